@@ -0,0 +1,189 @@
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Optional
+
+import redis
+
+logger = logging.getLogger(__name__)
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries also expire after a fixed TTL"""
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return None
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: str, value: Any):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class TieredCache:
+    """
+    In-process TTLCache in front of an optional shared Redis tier.
+
+    Values must be JSON-serializable dicts. Invalidations are published on a
+    pub/sub channel so every process holding a local copy drops it; without
+    Redis the cache is simply per-process. With shared=False values never
+    leave the process (e.g. because they hold secrets) and Redis only carries
+    the invalidations.
+    """
+
+    def __init__(self, namespace: str, maxsize: int = 10000, ttl: float = 60, shared_ttl: int = 300, shared: bool = True):
+        self.namespace = namespace
+        self.shared_ttl = shared_ttl
+        self.shared = shared
+        self.local = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.redis_client: Optional[redis.Redis] = None
+        self.channel = f"cache_invalidate:{namespace}"
+
+    def attach_redis(self, redis_client: redis.Redis):
+        """Enable the shared tier and start listening for invalidations from other processes"""
+        self.redis_client = redis_client
+        threading.Thread(target=self._listen, name=f"{self.namespace}-invalidations", daemon=True).start()
+
+    def _key(self, key: str) -> str:
+        return f"{self.namespace}:{key}"
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = self.redis_client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                for message in pubsub.listen():
+                    if message["type"] != "message":
+                        continue
+                    if message["data"] == "*":
+                        self.local.clear()
+                    else:
+                        self.local.delete(message["data"])
+            except Exception as e:
+                # Entries may be stale until the connection is back; the local TTL bounds it
+                logger.warning(f"Cache invalidation listener for {self.namespace} failed: {e}")
+                self.local.clear()
+                time.sleep(1)
+
+    def get(self, key: str) -> Optional[dict]:
+        value = self.local.get(key)
+        if value is not None:
+            return value
+        return self.get_shared(key)
+
+    def get_shared(self, key: str) -> Optional[dict]:
+        """Look in the Redis tier only, copying a hit into the local one. Blocks on Redis."""
+        if not (self.redis_client and self.shared):
+            return None
+
+        try:
+            raw = self.redis_client.get(self._key(key))
+        except Exception:
+            raw = None
+        if not raw:
+            return None
+
+        value = json.loads(raw)
+        self.local.set(key, value)
+        return value
+
+    def set(self, key: str, value: dict):
+        self.local.set(key, value)
+        if self.redis_client and self.shared:
+            try:
+                self.redis_client.set(self._key(key), json.dumps(value), ex=self.shared_ttl)
+            except Exception:
+                pass
+
+    def invalidate(self, key: str):
+        """Drop a key here, in Redis, and in every other process's local tier"""
+        self.local.delete(key)
+        if self.redis_client:
+            try:
+                pipe = self.redis_client.pipeline(transaction=False)
+                pipe.delete(self._key(key))
+                pipe.publish(self.channel, key)
+                pipe.execute()
+            except Exception:
+                pass
+
+
+class BackgroundRefreshCache:
+    """
+    Caches expensive values (e.g. COUNT(*) results) per key.
+    A stale value keeps being served while a single background thread
+    recomputes it, so callers only wait on the very first load.
+    """
+
+    def __init__(self, ttl: float = 30):
+        self.ttl = ttl
+        self._values: dict = {}  # key -> (value, loaded_at)
+        self._refreshing: set = set()
+        self._lock = threading.Lock()
+
+    def get(self, key: Any, loader: Callable[[], Any]) -> Any:
+        with self._lock:
+            entry = self._values.get(key)
+            stale = entry is None or time.monotonic() - entry[1] >= self.ttl
+            start_refresh = entry is not None and stale and key not in self._refreshing
+            if start_refresh:
+                self._refreshing.add(key)
+
+        if entry is None:
+            value = loader()
+            with self._lock:
+                self._values[key] = (value, time.monotonic())
+            return value
+
+        if start_refresh:
+            threading.Thread(target=self._refresh, args=(key, loader), daemon=True).start()
+
+        return entry[0]
+
+    def _refresh(self, key: Any, loader: Callable[[], Any]):
+        try:
+            value = loader()
+            with self._lock:
+                self._values[key] = (value, time.monotonic())
+        except Exception as e:
+            logger.warning(f"Background refresh of {key!r} failed: {e}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
@@ -0,0 +1,84 @@
+import os
+from typing import Dict, Iterable, NamedTuple, Optional
+
+import redis
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.core.cache import TieredCache
+from app.models.database import Agent, AgentStatus
+
+# Bounds how long a process can act on an agent's old status or push channel
+# when an invalidation doesn't reach it (e.g. no Redis, or a dropped listener)
+AGENT_CACHE_TTL = float(os.getenv("AGENT_CACHE_TTL", "30"))
+AGENT_CACHE_SIZE = int(os.getenv("AGENT_CACHE_SIZE", "10000"))
+
+
+class AgentEntry(NamedTuple):
+    """What sending to and delivering for an agent needs from its row"""
+    id: str
+    status: AgentStatus
+    webhook_url: Optional[str]
+    secret_token: str
+    push_connection: Optional[str]
+    delivery_batch_size: Optional[int]
+    webhook_gzip: bool
+    delivery_receipts: bool
+
+
+ENTRY_COLUMNS = [getattr(Agent, field) for field in AgentEntry._fields]
+
+
+class AgentDirectory:
+    """
+    Per-process cache of the agent fields the send endpoints and delivery
+    workers look up for every message, so a burst of messages to the same
+    recipients reads each row once.
+
+    Unknown ids are cached too, as empty entries. Entries hold the webhook
+    secret, so they stay in the process (shared=False); Redis only carries
+    invalidations, published when an agent registers or its status or push
+    channel changes.
+    """
+
+    def __init__(self, maxsize: int = AGENT_CACHE_SIZE, ttl: float = AGENT_CACHE_TTL):
+        self.cache = TieredCache("agents", maxsize=maxsize, ttl=ttl, shared=False)
+
+    def attach_redis(self, redis_client: redis.Redis):
+        self.cache.attach_redis(redis_client)
+
+    def load(self, db: Session, agent_ids: Iterable[str]) -> Dict[str, AgentEntry]:
+        """
+        Entries for the agents that exist, reading every id not cached with a single query.
+        Works as AsyncSession.run_sync target.
+        """
+        entries = {}
+        missing = set()
+        for agent_id in set(agent_ids):
+            cached = self.cache.get(agent_id)
+            if cached is None:
+                missing.add(agent_id)
+            elif cached:
+                entries[agent_id] = AgentEntry(**{**cached, "status": AgentStatus(cached["status"])})
+
+        if missing:
+            for row in db.execute(select(*ENTRY_COLUMNS).where(Agent.id.in_(missing))).all():
+                entry = AgentEntry(*row)
+                entries[entry.id] = entry
+                self.cache.set(entry.id, {**entry._asdict(), "status": entry.status.value})
+            for agent_id in missing - entries.keys():
+                self.cache.set(agent_id, {})
+
+        return entries
+
+    def invalidate(self, agent_id: str):
+        """Drop the agent's entry here and in every other process"""
+        self.cache.invalidate(agent_id)
+
+    def forget(self, agent_id: str):
+        """Drop the agent's entry in this process only"""
+        self.cache.local.delete(agent_id)
+
+
+# Shared by the API and the delivery workers; each attaches Redis when available
+agent_directory = AgentDirectory()
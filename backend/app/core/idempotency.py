@@ -0,0 +1,57 @@
+import hashlib
+import json
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from fastapi import HTTPException
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.queue import as_utc
+from app.models.database import IdempotencyKey
+
+# How long a key keeps returning the original message
+IDEMPOTENCY_TTL = int(os.getenv("IDEMPOTENCY_TTL", str(24 * 3600)))
+MAX_KEY_LENGTH = 255
+
+
+def request_fingerprint(to_agent_id: str, message_content: dict, priority: str) -> str:
+    """Hash of the parts of a send that must match when its key is reused"""
+    canonical = json.dumps([to_agent_id, message_content, priority], sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def new_key(agent_id: str, key: str, message_id: str, fingerprint: str) -> IdempotencyKey:
+    """Row to add in the same transaction as the message it points to"""
+    return IdempotencyKey(
+        agent_id=agent_id,
+        key=key,
+        message_id=message_id,
+        request_hash=fingerprint,
+        expires_at=datetime.now(timezone.utc) + timedelta(seconds=IDEMPOTENCY_TTL)
+    )
+
+
+async def replayed_message_id(db: AsyncSession, agent_id: str, key: str, fingerprint: str) -> Optional[str]:
+    """
+    The message_id an earlier send with this key created, or None if the key is new.
+    An expired key is dropped so it can be used again. Raises 422 when the key was
+    used for a different request.
+    """
+    row = (await db.execute(
+        select(IdempotencyKey).where(IdempotencyKey.agent_id == agent_id, IdempotencyKey.key == key)
+    )).scalar_one_or_none()
+    if row is None:
+        return None
+
+    if as_utc(row.expires_at) <= datetime.now(timezone.utc):
+        await db.execute(
+            delete(IdempotencyKey).where(IdempotencyKey.agent_id == agent_id, IdempotencyKey.key == key)
+        )
+        await db.commit()
+        return None
+
+    if row.request_hash != fingerprint:
+        raise HTTPException(status_code=422, detail="Idempotency-Key was already used for a different request")
+    return row.message_id
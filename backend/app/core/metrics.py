@@ -0,0 +1,111 @@
+import time
+from typing import Callable, Dict, Iterable
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Counter, Histogram, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from prometheus_client.registry import Collector
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.core.cache import TTLCache
+
+# Everything here is a counter bump or histogram observation on the hot path;
+# gauges that need a query (queue depth) are computed at scrape time instead.
+
+MESSAGES_SENT = Counter(
+    "agentconnect_messages_sent_total",
+    "Messages accepted by the API",
+    ["endpoint"]
+)
+SEND_REPLAYS = Counter(
+    "agentconnect_send_replays_total",
+    "Sends answered with an earlier message_id because their Idempotency-Key was already used"
+)
+DELIVERY_LATENCY = Histogram(
+    "agentconnect_delivery_latency_seconds",
+    "Time from a message being queued to it being delivered",
+    ["channel"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900, 3600, 6 * 3600, 24 * 3600)
+)
+DELIVERY_ATTEMPTS = Counter(
+    "agentconnect_delivery_attempts_total",
+    "Webhook delivery attempts by outcome: delivered, retry, failed, or deferred (circuit open)",
+    ["outcome"]
+)
+WEBHOOK_LATENCY = Histogram(
+    "agentconnect_webhook_request_seconds",
+    "Webhook request duration by response status code (or timeout / connection_error / error)",
+    ["status"]
+)
+DB_QUERY_LATENCY = Histogram(
+    "agentconnect_db_query_seconds",
+    "Database statement execution time by statement type",
+    ["operation"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+)
+
+
+def delivery_channel(owner: str) -> str:
+    """Channel label for a lease owner: push connections and inboxes are prefixed, workers are not"""
+    prefix = owner.split(":", 1)[0]
+    return prefix if prefix in ("push", "inbox") else "webhook"
+
+
+def instrument_engine(engine: Engine):
+    """Time every statement run through the engine (pass async_engine.sync_engine for async engines)"""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _start(conn, cursor, statement, parameters, context, executemany):
+        conn.info["query_start"] = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _stop(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.pop("query_start", None)
+        if started is None:
+            return
+        operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "OTHER"
+        DB_QUERY_LATENCY.labels(operation).observe(time.perf_counter() - started)
+
+
+class CacheCollector(Collector):
+    """Hit and miss counts of in-process caches, read at scrape time"""
+
+    def __init__(self, caches: Dict[str, TTLCache]):
+        self.caches = caches
+
+    def collect(self) -> Iterable:
+        requests = CounterMetricFamily(
+            "agentconnect_cache_requests",
+            "Cache lookups by cache and result",
+            labels=["cache", "result"]
+        )
+        for name, cache in self.caches.items():
+            requests.add_metric([name, "hit"], cache.hits)
+            requests.add_metric([name, "miss"], cache.misses)
+        yield requests
+
+
+class GaugeCollector(Collector):
+    """A labelled gauge whose values come from a callback at scrape time"""
+
+    def __init__(self, name: str, documentation: str, label: str, values: Callable[[], Dict[str, float]]):
+        self.name = name
+        self.documentation = documentation
+        self.label = label
+        self.values = values
+
+    def describe(self) -> Iterable:
+        # Keeps registration from calling the (possibly expensive) callback
+        yield GaugeMetricFamily(self.name, self.documentation, labels=[self.label])
+
+    def collect(self) -> Iterable:
+        gauge = GaugeMetricFamily(self.name, self.documentation, labels=[self.label])
+        for value, amount in self.values().items():
+            gauge.add_metric([value], amount)
+        yield gauge
+
+
+def render_metrics(registry=REGISTRY) -> tuple:
+    """(body, content type) of the Prometheus text exposition"""
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
@@ -0,0 +1,91 @@
+import asyncio
+import json
+import logging
+import secrets
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+import redis
+
+logger = logging.getLogger(__name__)
+
+INBOX_CHANNEL = "inbox_notify"
+
+
+class InboxNotifier:
+    """
+    Wakes coroutines waiting for new messages addressed to an agent.
+
+    Waiters register an asyncio.Event per agent. notify() sets the events of
+    local waiters directly and, when Redis is attached, publishes the agent ids
+    so waiters held by other API processes wake too. A missed notification only
+    costs latency: waiters also wake on their own timeout and re-check the DB.
+    """
+
+    def __init__(self, channel: str = INBOX_CHANNEL):
+        self.channel = channel
+        self.origin = secrets.token_hex(8)  # lets the listener skip our own publishes
+        self.redis_client: Optional[redis.Redis] = None
+        self._waiters: Dict[str, Set[Tuple[asyncio.Event, asyncio.AbstractEventLoop]]] = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def attach_redis(self, redis_client: redis.Redis):
+        self.redis_client = redis_client
+        threading.Thread(target=self._listen, name="inbox-notifications", daemon=True).start()
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = self.redis_client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                for message in pubsub.listen():
+                    if message["type"] != "message":
+                        continue
+                    data = json.loads(message["data"])
+                    if data.get("origin") != self.origin:
+                        self._wake(data.get("agent_ids", []))
+            except Exception as e:
+                logger.warning(f"Inbox notification listener failed: {e}")
+                time.sleep(1)
+
+    def subscribe(self, agent_id: str) -> asyncio.Event:
+        """Register a waiter for agent_id; must be called from the event loop that will wait on it"""
+        event = asyncio.Event()
+        with self._lock:
+            self._waiters[agent_id].add((event, asyncio.get_running_loop()))
+        return event
+
+    def unsubscribe(self, agent_id: str, event: asyncio.Event):
+        with self._lock:
+            waiters = self._waiters.get(agent_id)
+            if not waiters:
+                return
+            waiters.difference_update({waiter for waiter in waiters if waiter[0] is event})
+            if not waiters:
+                del self._waiters[agent_id]
+
+    def _wake(self, agent_ids: Iterable[str]):
+        with self._lock:
+            waiters = [waiter for agent_id in agent_ids for waiter in self._waiters.get(agent_id, ())]
+        for event, loop in waiters:
+            # notify() may run on a threadpool thread (sync endpoints, the Redis listener)
+            loop.call_soon_threadsafe(event.set)
+
+    def notify(self, agent_ids: Iterable[str]):
+        """Wake everyone waiting on any of agent_ids, in this process and (via Redis) in others"""
+        agent_ids = list(dict.fromkeys(agent_ids))
+        if not agent_ids:
+            return
+
+        self._wake(agent_ids)
+        if self.redis_client:
+            try:
+                self.redis_client.publish(self.channel, json.dumps({"origin": self.origin, "agent_ids": agent_ids}))
+            except Exception:
+                pass
+
+
+# Shared by the push and long-poll endpoints; main.py attaches Redis when available
+inbox_notifier = InboxNotifier()
@@ -0,0 +1,140 @@
+import logging
+import os
+import re
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.schema import CreateTable
+
+from app.models.database import Message, MessageStatus
+
+logger = logging.getLogger(__name__)
+
+# "month" or "day" to range-partition messages on created_at (Postgres only); unset: plain table
+PARTITION_INTERVAL = os.getenv("MESSAGES_PARTITION_INTERVAL")
+PARTITIONS_AHEAD = 2
+PARTITION_NAME = re.compile(r"^messages_p(\d{4})_(\d{2})(?:_(\d{2}))?$")
+
+
+def partitioning_enabled(engine: Engine) -> bool:
+    return PARTITION_INTERVAL in ("month", "day") and engine.dialect.name == "postgresql"
+
+
+def partition_range(day: datetime) -> Tuple[str, datetime, datetime]:
+    """Name and [start, end) bounds of the partition holding `day`"""
+    if PARTITION_INTERVAL == "day":
+        start = datetime(day.year, day.month, day.day)
+        return f"messages_p{start:%Y_%m_%d}", start, start + timedelta(days=1)
+
+    start = datetime(day.year, day.month, 1)
+    end = datetime(start.year + start.month // 12, start.month % 12 + 1, 1)
+    return f"messages_p{start:%Y_%m}", start, end
+
+
+def create_partitioned_messages(engine: Engine):
+    """
+    Create the messages table partitioned by created_at, if it doesn't exist yet,
+    and the partitions for the coming PARTITIONS_AHEAD intervals. Call at startup,
+    before metadata.create_all. An existing plain table is left alone: converting
+    it means copying the data, which is a migration, not a startup step.
+    """
+    if not partitioning_enabled(engine):
+        return
+
+    with engine.begin() as conn:
+        if not inspect(conn).has_table(Message.__tablename__):
+            Message.__table__.c.status.type.create(conn, checkfirst=True)
+            # Postgres requires the partition key in the primary key
+            ddl = str(CreateTable(Message.__table__).compile(dialect=conn.dialect)).strip().rstrip(";")
+            ddl = ddl.replace("PRIMARY KEY (id)", "PRIMARY KEY (id, created_at)")
+            conn.execute(text(f"{ddl} PARTITION BY RANGE (created_at)"))
+            for index in Message.__table__.indexes:
+                index.create(conn)
+            # Catches rows outside every range so inserts never fail
+            conn.execute(text("CREATE TABLE messages_default PARTITION OF messages DEFAULT"))
+            logger.info(f"Created messages table partitioned by {PARTITION_INTERVAL}")
+
+    ensure_partitions(engine)
+
+
+def ensure_partitions(engine: Engine, now: Optional[datetime] = None):
+    """
+    Create the current partition and the next PARTITIONS_AHEAD ones.
+    Rows that already landed in messages_default for a missing range are moved
+    into its partition before it is attached; Postgres refuses to attach a
+    range the default partition holds rows for.
+    """
+    if not partitioning_enabled(engine):
+        return
+
+    day = (now or datetime.now(timezone.utc)).replace(tzinfo=None)
+    with engine.begin() as conn:
+        # API processes and the compactor may all get here at once
+        conn.execute(text("SELECT pg_advisory_xact_lock(hashtext('messages_partitions'))"))
+        for _ in range(PARTITIONS_AHEAD + 1):
+            name, start, end = partition_range(day)
+            day = end
+            if conn.execute(text("SELECT to_regclass(:name)"), {"name": name}).scalar() is not None:
+                continue
+
+            conn.execute(text(f"CREATE TABLE {name} (LIKE messages INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+            moved = conn.execute(text(
+                f"WITH moved AS (DELETE FROM messages_default WHERE created_at >= :start AND created_at < :end RETURNING *) "
+                f"INSERT INTO {name} SELECT * FROM moved"
+            ), {"start": start, "end": end}).rowcount
+            conn.execute(text(
+                f"ALTER TABLE messages ATTACH PARTITION {name} "
+                f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+            ))
+            logger.info(f"Created partition {name}" + (f", moving {moved} messages out of messages_default" if moved else ""))
+
+
+def list_partitions(engine: Engine) -> List[Tuple[str, datetime, datetime]]:
+    """Range partitions of messages as (name, start, end), oldest first"""
+    with engine.connect() as conn:
+        names = conn.execute(text(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid "
+            "JOIN pg_class p ON p.oid = i.inhparent "
+            "WHERE p.relname = 'messages'"
+        )).scalars().all()
+
+    partitions = []
+    for name in names:
+        match = PARTITION_NAME.match(name)
+        if match:
+            year, month, day = match.groups()
+            partitions.append(partition_range(datetime(int(year), int(month), int(day or 1))))
+    return sorted(partitions, key=lambda partition: partition[1])
+
+
+def drop_expired_partitions(engine: Engine, retention: Dict[MessageStatus, int], now: Optional[datetime] = None) -> List[str]:
+    """
+    Drop whole partitions whose rows have all outlived their status's retention.
+    A partition holding any row that must be kept (queued, or a status without
+    retention, or not old enough yet) is left for the row-by-row compactor.
+    """
+    if not partitioning_enabled(engine):
+        return []
+
+    now = (now or datetime.now(timezone.utc)).replace(tzinfo=None)
+    dropped = []
+    for name, _, end in list_partitions(engine):
+        if end > now:
+            break
+
+        expired = [status.name for status, seconds in retention.items() if end <= now - timedelta(seconds=seconds)]
+        with engine.begin() as conn:
+            keep = conn.execute(
+                text(f"SELECT 1 FROM {name} WHERE NOT (CAST(status AS text) = ANY(CAST(:expired AS text[]))) LIMIT 1"),
+                {"expired": expired}
+            ).first()
+            if keep:
+                continue
+            conn.execute(text(f"DROP TABLE {name}"))
+        dropped.append(name)
+        logger.info(f"Dropped expired partition {name}")
+
+    return dropped
@@ -0,0 +1,81 @@
+import gzip
+import json
+import os
+import zlib
+from typing import NamedTuple, Optional
+
+try:
+    import zstandard
+except ImportError:  # optional; gzip is used without it
+    zstandard = None
+
+# Largest serialized message_content accepted, in bytes
+MAX_CONTENT_BYTES = int(os.getenv("MESSAGE_MAX_BYTES", str(256 * 1024)))
+# Contents at least this large are stored compressed
+COMPRESSION_THRESHOLD = int(os.getenv("MESSAGE_COMPRESSION_THRESHOLD", "1024"))
+# "gzip", "zstd" or "none". Only choose zstd once every API and worker process has
+# zstandard installed: a process without it can't read zstd contents. Falls back
+# to gzip where zstandard is missing.
+COMPRESSION = os.getenv("MESSAGE_COMPRESSION", "gzip")
+
+
+class ContentTooLarge(ValueError):
+    def __init__(self, size: int):
+        super().__init__(f"Message content is {size} bytes, the limit is {MAX_CONTENT_BYTES}")
+        self.size = size
+
+
+class UndecodableContent(ValueError):
+    """A stored message_content this process can't decode"""
+
+
+class EncodedContent(NamedTuple):
+    data: bytes
+    encoding: Optional[str]  # None: plain UTF-8 JSON
+
+
+def serialize_content(content: dict) -> bytes:
+    """Compact JSON for a message_content; raises ContentTooLarge past MAX_CONTENT_BYTES"""
+    raw = json.dumps(content, separators=(",", ":")).encode()
+    if len(raw) > MAX_CONTENT_BYTES:
+        raise ContentTooLarge(len(raw))
+    return raw
+
+
+def compress(raw: bytes, method: str = COMPRESSION) -> EncodedContent:
+    """Compress raw JSON for storage when it is large enough and actually shrinks"""
+    if len(raw) < COMPRESSION_THRESHOLD or method == "none":
+        return EncodedContent(raw, None)
+
+    if method == "zstd" and zstandard is not None:
+        compressed, encoding = zstandard.ZstdCompressor(level=3).compress(raw), "zstd"
+    else:
+        compressed, encoding = gzip.compress(raw, compresslevel=6), "gzip"
+
+    if len(compressed) >= len(raw):
+        return EncodedContent(raw, None)
+    return EncodedContent(compressed, encoding)
+
+
+def encode_content(content: dict) -> EncodedContent:
+    """Storage form of a message_content: serialized, size-checked and maybe compressed"""
+    return compress(serialize_content(content))
+
+
+def decode_content(data: bytes, encoding: Optional[str]) -> bytes:
+    """Raw JSON bytes of a stored message_content; raises UndecodableContent"""
+    if encoding is None:
+        return data
+    if encoding == "gzip":
+        try:
+            return gzip.decompress(data)
+        except (OSError, EOFError, zlib.error) as e:
+            raise UndecodableContent(f"Corrupt gzip content: {e}")
+    if encoding == "zstd":
+        if zstandard is None:
+            raise UndecodableContent("Message is zstd-compressed but zstandard is not installed")
+        try:
+            return zstandard.ZstdDecompressor().decompress(data)
+        except zstandard.ZstdError as e:
+            raise UndecodableContent(f"Corrupt zstd content: {e}")
+    raise UndecodableContent(f"Unknown content encoding: {encoding}")
@@ -0,0 +1,99 @@
+from datetime import datetime, timezone
+from typing import Iterable, List, Optional
+from sqlalchemy import update, select
+from sqlalchemy.orm import Session
+
+from app.models.database import Agent, Message, AgentStatus, MessageStatus
+
+
+def as_utc(value: datetime) -> datetime:
+    """Normalize a datetime read back from the DB (naive on SQLite) to aware UTC"""
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def webhook_recipients():
+    """
+    Agents the delivery worker should POST to: online, with a webhook, and not
+    holding a push channel (the channel delivers their messages instead).
+    """
+    return select(Agent.id).where(
+        Agent.status == AgentStatus.ONLINE,
+        Agent.webhook_url.is_not(None),
+        Agent.push_connection.is_(None)
+    )
+
+
+def mark_agent_messages_due(db: Session, agent_id: str, now: Optional[datetime] = None) -> int:
+    """
+    Make every queued message for an agent due immediately.
+    Used when an agent comes online; clears both parked messages and retry backoff.
+    Caller commits. Returns the number of rows touched.
+    """
+    now = now or datetime.now(timezone.utc)
+    result = db.execute(
+        update(Message)
+        .where(Message.to_agent_id == agent_id, Message.status == MessageStatus.QUEUED)
+        .values(next_attempt_at=now)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount
+
+
+def park_messages(db: Session, message_ids: Iterable[str]) -> int:
+    """
+    Park queued messages whose recipient can't take a webhook right now (offline,
+    no webhook, or on a push channel) so the due-time index skips them.
+    The recipient is re-checked in SQL so a concurrent online transition wins.
+    Caller commits.
+    """
+    message_ids = list(message_ids)
+    if not message_ids:
+        return 0
+
+    result = db.execute(
+        update(Message)
+        .where(
+            Message.id.in_(message_ids),
+            Message.status == MessageStatus.QUEUED,
+            Message.to_agent_id.not_in(webhook_recipients())
+        )
+        .values(next_attempt_at=None, lease_owner=None, lease_expires_at=None)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount
+
+
+def unpark_online_messages(db: Session, now: Optional[datetime] = None) -> int:
+    """
+    Safety net for parked messages whose recipient is already online
+    (e.g. a status change that raced with parking). Caller commits.
+    """
+    now = now or datetime.now(timezone.utc)
+    result = db.execute(
+        update(Message)
+        .where(
+            Message.status == MessageStatus.QUEUED,
+            Message.next_attempt_at.is_(None),
+            Message.to_agent_id.in_(webhook_recipients())
+        )
+        .values(next_attempt_at=now)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount
+
+
+def expire_push_connections(db: Session, now: Optional[datetime] = None) -> List[str]:
+    """
+    Take agents offline whose push channel stopped refreshing its presence,
+    e.g. because the API process holding it died. Returns their ids. Caller commits.
+    """
+    now = now or datetime.now(timezone.utc)
+    return db.execute(
+        update(Agent)
+        .where(Agent.push_connection.is_not(None), Agent.push_expires_at < now)
+        .values(status=AgentStatus.OFFLINE, push_connection=None, push_expires_at=None, updated_at=now)
+        .returning(Agent.id)
+        .execution_options(synchronize_session=False)
+    ).scalars().all()
@@ -0,0 +1,185 @@
+import json
+import logging
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, NamedTuple, Optional, Tuple
+
+import redis
+
+logger = logging.getLogger(__name__)
+
+def parse_limit(value: str) -> Tuple[int, int]:
+    """Parse "<requests>/<seconds>", e.g. "100/3600" """
+    requests_part, seconds_part = value.split("/")
+    return int(requests_part), int(seconds_part)
+
+
+# 100 requests per hour unless RATE_LIMIT_DEFAULT says otherwise
+DEFAULT_LIMIT = parse_limit(os.getenv("RATE_LIMIT_DEFAULT", "100/3600"))
+
+
+def load_endpoint_limits() -> Dict[str, Tuple[int, int]]:
+    """
+    Per-endpoint limits from RATE_LIMITS, a JSON object such as
+    {"POST /api/messages/send": "1000/3600"}. Endpoints listed here get
+    their own bucket; everything else shares the agent's default bucket.
+    """
+    raw = os.getenv("RATE_LIMITS")
+    if not raw:
+        return {}
+    return {endpoint: parse_limit(limit) for endpoint, limit in json.loads(raw).items()}
+
+
+class RateLimitResult(NamedTuple):
+    allowed: bool
+    limit: int
+    remaining: int
+    retry_after: float  # seconds until the next request is allowed (0 if allowed now)
+    reset_after: float  # seconds until the bucket is full again
+
+
+def _result(allowed: bool, tokens: float, limit: int, rate: float) -> RateLimitResult:
+    return RateLimitResult(
+        allowed=allowed,
+        limit=limit,
+        remaining=int(tokens),
+        retry_after=0.0 if allowed else (1 - tokens) / rate,
+        reset_after=(limit - tokens) / rate
+    )
+
+
+class InMemoryTokenBucket:
+    """
+    Token bucket per key: `limit` tokens refilled evenly over `window_seconds`.
+    Each key costs a few floats, and keys idle long enough to have refilled
+    completely are evicted, since they carry no information.
+    """
+
+    def __init__(self, max_keys: int = 100000):
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (tokens, updated_at, full_after)
+        self._lock = threading.Lock()
+
+    def hit(self, key: str, limit: int, window_seconds: int) -> RateLimitResult:
+        rate = limit / window_seconds
+        now = time.monotonic()
+
+        with self._lock:
+            tokens, updated_at, _ = self._buckets.get(key, (limit, now, now))
+            tokens = min(limit, tokens + (now - updated_at) * rate)
+
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+
+            self._buckets[key] = (tokens, now, now + (limit - tokens) / rate)
+            self._buckets.move_to_end(key)
+            self._evict(now)
+
+        return _result(allowed, tokens, limit, rate)
+
+    def _evict(self, now: float):
+        # Oldest-touched first: drop refilled buckets, then enforce the size cap
+        while self._buckets:
+            key, (_, _, full_after) = next(iter(self._buckets.items()))
+            if full_after <= now or len(self._buckets) > self.max_keys:
+                del self._buckets[key]
+            else:
+                break
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+# Atomic token bucket shared by every API process. Uses the Redis clock so
+# processes with skewed clocks agree, and expires keys once they are full.
+TOKEN_BUCKET_LUA = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+
+local allowed = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+end
+
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil((capacity - tokens) / rate * 1000) + 1000)
+return {allowed, tostring(tokens)}
+"""
+
+
+class RedisTokenBucket:
+    """Same algorithm as InMemoryTokenBucket, evaluated atomically in Redis"""
+
+    def __init__(self, redis_client: redis.Redis, prefix: str = "ratelimit"):
+        self.prefix = prefix
+        self.script = redis_client.register_script(TOKEN_BUCKET_LUA)
+
+    def hit(self, key: str, limit: int, window_seconds: int) -> RateLimitResult:
+        rate = limit / window_seconds
+        allowed, tokens = self.script(keys=[f"{self.prefix}:{key}"], args=[limit, rate])
+        return _result(bool(int(allowed)), float(tokens), limit, rate)
+
+
+class RateLimiter:
+    """
+    Per-agent, per-endpoint rate limiting.
+    Uses the shared Redis backend when attached and falls back to the
+    in-process buckets if Redis is unavailable.
+    """
+
+    def __init__(self, default_limit: Tuple[int, int] = DEFAULT_LIMIT, endpoint_limits: Optional[Dict[str, Tuple[int, int]]] = None):
+        self.default_limit = default_limit
+        self.endpoint_limits = endpoint_limits if endpoint_limits is not None else load_endpoint_limits()
+        self.local = InMemoryTokenBucket()
+        self.shared: Optional[RedisTokenBucket] = None
+
+    def attach_redis(self, redis_client: redis.Redis):
+        self.shared = RedisTokenBucket(redis_client)
+
+    def window_for(self, endpoint: str) -> int:
+        return self.endpoint_limits.get(endpoint, self.default_limit)[1]
+
+    def check(self, agent_id: str, endpoint: str, agent_limit: Optional[int] = None) -> RateLimitResult:
+        """
+        Count one request by agent_id against endpoint.
+        agent_limit overrides the default request count for the agent's shared bucket.
+        """
+        if endpoint in self.endpoint_limits:
+            key = f"{agent_id}:{endpoint}"
+            limit, window_seconds = self.endpoint_limits[endpoint]
+        else:
+            key = f"{agent_id}:default"
+            limit, window_seconds = self.default_limit
+            if agent_limit:
+                limit = agent_limit
+
+        if self.shared:
+            try:
+                return self.shared.hit(key, limit, window_seconds)
+            except Exception as e:
+                logger.warning(f"Redis rate limiter unavailable, using local buckets: {e}")
+
+        return self.local.hit(key, limit, window_seconds)
+
+
+def rate_limit_headers(result: RateLimitResult) -> Dict[str, str]:
+    headers = {
+        "X-RateLimit-Limit": str(result.limit),
+        "X-RateLimit-Remaining": str(result.remaining),
+        "X-RateLimit-Reset": str(math.ceil(result.reset_after))
+    }
+    if not result.allowed:
+        headers["Retry-After"] = str(math.ceil(result.retry_after))
+    return headers
@@ -0,0 +1,131 @@
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import Iterable, List, NamedTuple, Optional
+
+import redis
+from sqlalchemy import event, insert
+from sqlalchemy.orm import Session
+
+from app.core.directory import agent_directory
+from app.core.notifier import inbox_notifier
+from app.core.payloads import encode_content
+from app.core.security import generate_message_id
+from app.core.streams import DeliveryStream
+from app.models.database import Message, MessagePriority, MessageStatus, PRIORITY_LEVELS
+
+logger = logging.getLogger(__name__)
+
+# Sender of every receipt. No agent has this id, so receipts never get receipts of their own.
+SYSTEM_AGENT_ID = "system"
+RECEIPT_TYPE = "delivery_receipt"
+# session.info key of the receipts inserted in the session's open transaction
+PENDING_RECEIPTS = "delivery_receipts"
+
+
+class Outcome(NamedTuple):
+    """A message that reached a final status"""
+    message_id: str
+    from_agent_id: str
+    to_agent_id: str
+    status: MessageStatus
+    at: datetime
+    error_message: Optional[str] = None
+
+
+class DeliveryReceipts:
+    """
+    Sends a receipt to the sender when one of its messages is DELIVERED or FAILED,
+    for agents registered with delivery_receipts.
+
+    Receipts are ordinary messages from SYSTEM_AGENT_ID, so each sender gets them
+    over whatever it already uses to receive: push channel, inbox or webhook.
+    They are inserted in the caller's transaction; the sender is woken once it
+    commits. Receipts waiting for the commit are kept in session.info, behind
+    one pair of listeners per session, and dropped if the transaction rolls back.
+    """
+
+    def __init__(self):
+        self.stream: Optional[DeliveryStream] = None
+
+    def attach_redis(self, redis_client: redis.Redis):
+        self.stream = DeliveryStream(redis_client)
+
+    def queue(self, db: Session, outcomes: Iterable[Outcome]) -> int:
+        """Insert receipts for the outcomes whose sender wants them; returns how many. Caller commits."""
+        outcomes = [outcome for outcome in outcomes if outcome.from_agent_id != SYSTEM_AGENT_ID]
+        if not outcomes:
+            return 0
+
+        senders = {
+            agent_id: entry.push_connection
+            for agent_id, entry in agent_directory.load(db, (outcome.from_agent_id for outcome in outcomes)).items()
+            if entry.delivery_receipts
+        }
+        if not senders:
+            return 0
+
+        now = datetime.now(timezone.utc)
+        rows = []
+        for outcome in outcomes:
+            if outcome.from_agent_id not in senders:
+                continue
+            content = encode_content({
+                "type": RECEIPT_TYPE,
+                "message_id": outcome.message_id,
+                "to_agent_id": outcome.to_agent_id,
+                "status": outcome.status.value,
+                "at": outcome.at.isoformat(),
+                "error_message": outcome.error_message
+            })
+            rows.append({
+                "id": generate_message_id(),
+                "from_agent_id": SYSTEM_AGENT_ID,
+                "to_agent_id": outcome.from_agent_id,
+                "message_content": content.data,
+                "content_encoding": content.encoding,
+                "status": MessageStatus.QUEUED,
+                "priority": PRIORITY_LEVELS[MessagePriority.NORMAL],
+                "retry_count": 0,
+                "created_at": now,
+                "next_attempt_at": None if senders[outcome.from_agent_id] else now
+            })
+
+        db.execute(insert(Message), rows)
+        pending = db.info.get(PENDING_RECEIPTS)
+        if pending is None:
+            pending = db.info[PENDING_RECEIPTS] = []
+            event.listen(db, "after_commit", self._after_commit)
+            event.listen(db, "after_soft_rollback", self._after_soft_rollback)
+        pending.extend(rows)
+        return len(rows)
+
+    def _after_soft_rollback(self, session: Session, previous_transaction):
+        # Only a rollback of the whole transaction discards the inserted receipts
+        if not previous_transaction.nested:
+            session.info[PENDING_RECEIPTS].clear()
+
+    def _after_commit(self, session: Session):
+        rows = session.info[PENDING_RECEIPTS]
+        if not rows:
+            return
+        session.info[PENDING_RECEIPTS] = []
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._wake(rows)
+            return
+        # Committed by an AsyncSession (inbox ack, push channel): keep the Redis publishes off the event loop
+        loop.run_in_executor(None, self._wake, rows)
+
+    def _wake(self, rows: List[dict]):
+        inbox_notifier.notify(row["to_agent_id"] for row in rows)
+        if self.stream:
+            try:
+                self.stream.publish_messages([row["id"] for row in rows if row["next_attempt_at"]])
+            except Exception as e:
+                logger.warning(f"Could not publish delivery receipts: {e}")
+
+
+# Shared by every path that finishes a message; main.py and the worker attach Redis when available
+delivery_receipts = DeliveryReceipts()
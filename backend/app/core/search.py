@@ -0,0 +1,261 @@
+import logging
+import math
+import os
+import re
+import threading
+from collections import defaultdict
+from typing import Dict, List, NamedTuple, Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from app.models.database import Agent, AgentStatus
+
+logger = logging.getLogger(__name__)
+
+MAX_QUERY_TERMS = 8
+MAX_RESULTS = 50
+TAG_PATTERN = re.compile(r"^[a-z0-9][a-z0-9_-]{0,31}$")
+
+
+class SearchHit(NamedTuple):
+    agent_id: str
+    score: float
+
+
+def tokenize(value: Optional[str]) -> List[str]:
+    return re.findall(r"[a-z0-9]+", (value or "").lower())
+
+
+def query_terms(query: Optional[str]) -> List[str]:
+    """Distinct terms of a user query, capped so one request can't fan out unboundedly"""
+    terms = []
+    for term in tokenize(query):
+        if term not in terms:
+            terms.append(term)
+    return terms[:MAX_QUERY_TERMS]
+
+
+def normalize_tags(tags: List[str]) -> List[str]:
+    """Lowercase and de-duplicate tags; raises ValueError on invalid ones"""
+    normalized = []
+    for tag in tags:
+        tag = tag.strip().lower()
+        if not TAG_PATTERN.match(tag):
+            raise ValueError(f"Invalid tag: {tag!r}")
+        if tag not in normalized:
+            normalized.append(tag)
+    return normalized
+
+
+class InMemorySearchIndex:
+    """
+    Inverted index held in process memory, scored with BM25.
+    Meant for tests and single-process dev setups; it is rebuilt from the
+    agents table at startup and only sees updates made by this process.
+    """
+
+    k1 = 1.2
+    b = 0.75
+    weights = {"name": 3.0, "tags": 2.0, "description": 1.0}
+
+    def __init__(self):
+        self._postings: Dict[str, Dict[str, float]] = defaultdict(dict)  # term -> agent_id -> weighted tf
+        self._lengths: Dict[str, float] = {}
+        self._tags: Dict[str, set] = defaultdict(set)
+        self._status: Dict[str, AgentStatus] = {}
+        self._lock = threading.Lock()
+
+    def setup(self, engine: Engine):
+        with Session(engine) as db:
+            for agent in db.query(Agent).all():
+                self._add(agent.id, agent.name, agent.description, agent.tags, agent.status)
+
+    def _add(self, agent_id: str, name: str, description: str, tags: Optional[str], status: AgentStatus):
+        with self._lock:
+            length = 0.0
+            for field, value in (("name", name), ("description", description), ("tags", tags)):
+                for term in tokenize(value):
+                    postings = self._postings[term]
+                    postings[agent_id] = postings.get(agent_id, 0.0) + self.weights[field]
+                    length += 1
+            self._lengths[agent_id] = length
+            for tag in (tags or "").split():
+                self._tags[tag].add(agent_id)
+            self._status[agent_id] = status
+
+    def index_agent(self, db: Session, agent: Agent):
+        self._add(agent.id, agent.name, agent.description, agent.tags, agent.status)
+
+    def update_status(self, agent_id: str, status: AgentStatus):
+        with self._lock:
+            if agent_id in self._status:
+                self._status[agent_id] = status
+
+    def _prefix_postings(self, prefix: str) -> Dict[str, float]:
+        """Postings of every indexed term starting with prefix, like the FTS backends' prefix queries"""
+        merged: Dict[str, float] = {}
+        for term, postings in self._postings.items():
+            if term.startswith(prefix):
+                for agent_id, tf in postings.items():
+                    merged[agent_id] = max(merged.get(agent_id, 0.0), tf)
+        return merged
+
+    def search(self, db: Session, query: str, tags: List[str], status: Optional[AgentStatus], limit: int) -> List[SearchHit]:
+        terms = query_terms(query)
+        with self._lock:
+            candidates = None
+            for tag in tags:
+                tagged = self._tags.get(tag, set())
+                candidates = tagged if candidates is None else candidates & tagged
+
+            scores: Dict[str, float] = defaultdict(float)
+            if terms:
+                count = len(self._lengths) or 1
+                avg_length = sum(self._lengths.values()) / count
+                matched = None
+                for term in terms:
+                    postings = self._prefix_postings(term)
+                    idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+                    for agent_id, tf in postings.items():
+                        norm = self.k1 * (1 - self.b + self.b * self._lengths[agent_id] / (avg_length or 1))
+                        scores[agent_id] += idf * tf * (self.k1 + 1) / (tf + norm)
+                    # Every term has to match
+                    matched = set(postings) if matched is None else matched & set(postings)
+            else:
+                matched = candidates or set()
+
+            hits = [
+                SearchHit(agent_id, scores.get(agent_id, 0.0))
+                for agent_id in matched
+                if (candidates is None or agent_id in candidates)
+                and (status is None or self._status.get(agent_id) == status)
+            ]
+
+        hits.sort(key=lambda hit: (-hit.score, hit.agent_id))
+        return hits[:limit]
+
+
+class SqliteSearchIndex:
+    """FTS5 virtual table kept next to the agents table (dev databases)"""
+
+    def setup(self, engine: Engine):
+        with engine.begin() as conn:
+            conn.execute(text(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS agents_fts "
+                "USING fts5(agent_id UNINDEXED, name, description, tags, tokenize='unicode61')"
+            ))
+            # Backfill agents registered before the index existed
+            conn.execute(text(
+                "INSERT INTO agents_fts (agent_id, name, description, tags) "
+                "SELECT id, name, description, coalesce(tags, '') FROM agents "
+                "WHERE id NOT IN (SELECT agent_id FROM agents_fts)"
+            ))
+
+    def index_agent(self, db: Session, agent: Agent):
+        db.execute(
+            text("INSERT INTO agents_fts (agent_id, name, description, tags) VALUES (:id, :name, :description, :tags)"),
+            {"id": agent.id, "name": agent.name, "description": agent.description, "tags": agent.tags or ""}
+        )
+
+    def update_status(self, agent_id: str, status: AgentStatus):
+        pass
+
+    def search(self, db: Session, query: str, tags: List[str], status: Optional[AgentStatus], limit: int) -> List[SearchHit]:
+        # Terms are alphanumeric only, so quoting them is enough to keep FTS syntax out
+        clauses = [f'"{term}"*' for term in query_terms(query)]
+        clauses += [f'tags : "{tag}"' for tag in tags]
+        if not clauses:
+            return []
+
+        sql = (
+            "SELECT f.agent_id, bm25(agents_fts, 0, 3.0, 1.0, 2.0) AS rank "
+            "FROM agents_fts f JOIN agents a ON a.id = f.agent_id "
+            "WHERE agents_fts MATCH :match"
+        )
+        params = {"match": " AND ".join(clauses), "limit": limit}
+        if status:
+            sql += " AND a.status = :status"
+            params["status"] = status.name
+        sql += " ORDER BY rank LIMIT :limit"
+
+        # bm25() is lower-is-better; flip it so higher scores rank first everywhere
+        return [SearchHit(row.agent_id, -row.rank) for row in db.execute(text(sql), params)]
+
+
+class PostgresSearchIndex:
+    """
+    Generated tsvector column with a GIN index, plus a GIN index over the tag array.
+    Postgres maintains both on every write, so registration needs no extra work.
+    Every field uses the 'simple' configuration, the one queries use: words are
+    indexed unstemmed and matched by prefix, as in the other backends.
+    """
+
+    statement_timeout_ms = 500
+
+    def setup(self, engine: Engine):
+        with engine.begin() as conn:
+            conn.execute(text(
+                "ALTER TABLE agents ADD COLUMN IF NOT EXISTS search_vector tsvector "
+                "GENERATED ALWAYS AS ("
+                "setweight(to_tsvector('simple', coalesce(name, '')), 'A') || "
+                "setweight(to_tsvector('simple', coalesce(tags, '')), 'B') || "
+                "setweight(to_tsvector('simple', coalesce(description, '')), 'C')"
+                ") STORED"
+            ))
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_agents_search_vector ON agents USING GIN (search_vector)"))
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_agents_tags ON agents USING GIN (string_to_array(tags, ' '))"))
+
+    def index_agent(self, db: Session, agent: Agent):
+        pass
+
+    def update_status(self, agent_id: str, status: AgentStatus):
+        pass
+
+    def search(self, db: Session, query: str, tags: List[str], status: Optional[AgentStatus], limit: int) -> List[SearchHit]:
+        terms = query_terms(query)
+        if not terms and not tags:
+            return []
+
+        conditions = []
+        params = {"limit": limit}
+        if terms:
+            conditions.append("search_vector @@ to_tsquery('simple', :tsquery)")
+            params["tsquery"] = " & ".join(f"{term}:*" for term in terms)
+        if tags:
+            conditions.append("string_to_array(tags, ' ') @> CAST(:tags AS text[])")
+            params["tags"] = tags
+        if status:
+            conditions.append("status = :status")
+            params["status"] = status.name
+
+        rank = "ts_rank(search_vector, to_tsquery('simple', :tsquery))" if terms else "0"
+        sql = (
+            f"SELECT id AS agent_id, {rank} AS rank FROM agents "
+            f"WHERE {' AND '.join(conditions)} ORDER BY rank DESC, created_at LIMIT :limit"
+        )
+
+        # Keep a pathological query from holding a connection
+        db.execute(text(f"SET LOCAL statement_timeout = {self.statement_timeout_ms}"))
+        return [SearchHit(row.agent_id, float(row.rank)) for row in db.execute(text(sql), params)]
+
+
+def create_search_index(engine: Engine):
+    """Pick a backend from SEARCH_BACKEND (memory, sqlite, postgres) or the database dialect"""
+    backend = os.getenv("SEARCH_BACKEND") or engine.dialect.name
+    if backend == "postgresql" or backend == "postgres":
+        index = PostgresSearchIndex()
+    elif backend == "sqlite":
+        index = SqliteSearchIndex()
+    else:
+        index = InMemorySearchIndex()
+
+    try:
+        index.setup(engine)
+    except Exception as e:
+        logger.warning(f"{type(index).__name__} unavailable ({e}), falling back to in-memory search")
+        index = InMemorySearchIndex()
+        index.setup(engine)
+
+    return index
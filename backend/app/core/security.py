@@ -1,20 +1,33 @@
 import secrets
 import hashlib
 import hmac
-from datetime import datetime, timedelta, timezone
-from typing import Optional
-from collections import defaultdict
-from fastapi import HTTPException, Depends
+from typing import Optional, NamedTuple
+from fastapi import HTTPException, Depends, Request, Response, WebSocket
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.core.database import get_db
-from app.models.database import Agent
+from app.core.cache import TieredCache
+from app.core.database import get_async_db
+from app.core.rate_limit import RateLimiter, RateLimitResult, rate_limit_headers
+from app.core.tracing import span
+from app.models.database import Agent, AgentStatus
 
 security = HTTPBearer()
 
-# In-memory rate limiting (use Redis for production)
-rate_limit_store = defaultdict(list)
+# API key hash -> authenticated agent snapshot
+auth_cache = TieredCache("auth", maxsize=10000, ttl=60)
+
+# Token buckets per agent and endpoint; main.py attaches Redis when available
+rate_limiter = RateLimiter()
+
+
+class AuthenticatedAgent(NamedTuple):
+    """Snapshot of the agent behind an API key, as cached by get_current_agent"""
+    id: str
+    status: AgentStatus
+    rate_limit: Optional[int] = None
 
 
 def generate_id() -> str:
@@ -42,10 +55,50 @@ def hash_api_key(api_key: str) -> str:
     return hashlib.sha256(api_key.encode()).hexdigest()
 
 
-def verify_api_key(api_key: str, db: Session) -> Optional[Agent]:
-    """Verify API key and return agent"""
+async def verify_api_key(api_key: str, db: AsyncSession) -> Optional[AuthenticatedAgent]:
+    """Verify API key and return agent snapshot, served from auth_cache when possible"""
     api_key_hash = hash_api_key(api_key)
-    return db.query(Agent).filter(Agent.api_key_hash == api_key_hash).first()
+
+    cached = auth_cache.local.get(api_key_hash)
+    if cached is None and auth_cache.redis_client:
+        # The Redis round trip would block the event loop
+        cached = await run_in_threadpool(auth_cache.get_shared, api_key_hash)
+    if cached:
+        return AuthenticatedAgent(
+            id=cached["id"],
+            status=AgentStatus(cached["status"]),
+            rate_limit=cached.get("rate_limit")
+        )
+
+    result = await db.execute(
+        select(Agent.id, Agent.status, Agent.rate_limit).where(Agent.api_key_hash == api_key_hash)
+    )
+    row = result.first()
+    # End the read so the connection goes back to the pool before the handler runs;
+    # long-polling handlers would otherwise pin it for their whole wait
+    await db.rollback()
+    if not row:
+        return None
+
+    snapshot = {"id": row.id, "status": row.status.value, "rate_limit": row.rate_limit}
+    if auth_cache.redis_client:
+        await run_in_threadpool(auth_cache.set, api_key_hash, snapshot)
+    else:
+        auth_cache.set(api_key_hash, snapshot)
+    return AuthenticatedAgent(id=row.id, status=row.status, rate_limit=row.rate_limit)
+
+
+def websocket_api_key(websocket: WebSocket) -> Optional[str]:
+    """API key from the handshake's Bearer header, or the api_key query parameter (browsers can't set headers)"""
+    scheme, _, token = websocket.headers.get("authorization", "").partition(" ")
+    if scheme.lower() == "bearer" and token:
+        return token
+    return websocket.query_params.get("api_key")
+
+
+def invalidate_agent_auth(api_key_hash: str):
+    """Drop cached auth for an agent; call after its status or credentials change"""
+    auth_cache.invalidate(api_key_hash)
 
 
 def generate_webhook_signature(payload: str, secret_token: str) -> str:
@@ -63,52 +116,51 @@ def verify_webhook_signature(payload: str, signature: str, secret_token: str) ->
     return hmac.compare_digest(signature, expected_signature)
 
 
-def check_rate_limit(api_key: str, limit: int = 100, window_seconds: int = 3600) -> bool:
+def check_rate_limit(agent: AuthenticatedAgent, endpoint: str) -> RateLimitResult:
     """
-    Check if API key has exceeded rate limit.
-    limit: max requests allowed
-    window_seconds: time window in seconds (default 1 hour)
-    Returns True if within limit, False if exceeded
+    Count one request by the agent against the endpoint's limit.
+    endpoint: "<METHOD> <route path>", e.g. "POST /api/messages/send"
     """
-    now = datetime.now(timezone.utc)
-    cutoff = now - timedelta(seconds=window_seconds)
-    
-    # Clean old requests
-    rate_limit_store[api_key] = [
-        timestamp for timestamp in rate_limit_store[api_key]
-        if timestamp > cutoff
-    ]
-    
-    # Check limit
-    if len(rate_limit_store[api_key]) >= limit:
-        return False
-    
-    # Add current request
-    rate_limit_store[api_key].append(now)
-    return True
+    return rate_limiter.check(agent.id, endpoint, agent_limit=agent.rate_limit)
 
 
-def get_current_agent(
+async def get_current_agent(
+    request: Request,
+    response: Response,
     credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
-) -> Agent:
+    db: AsyncSession = Depends(get_async_db)
+) -> AuthenticatedAgent:
     """
     Dependency to get current authenticated agent.
-    Verifies API key and applies rate limiting.
+    Verifies API key, applies rate limiting and sets the X-RateLimit-* headers.
     """
     api_key = credentials.credentials
     
-    # Verify API key
-    agent = verify_api_key(api_key, db)
-    if not agent:
-        raise HTTPException(status_code=401, detail="Invalid API key")
-    
-    # Check rate limit
-    if not check_rate_limit(api_key):
+    with span("get_current_agent") as current:
+        # Verify API key
+        agent = await verify_api_key(api_key, db)
+        if not agent:
+            raise HTTPException(status_code=401, detail="Invalid API key")
+        if current:
+            current.set_attribute("agent.id", agent.id)
+
+        # Check rate limit
+        route = request.scope.get("route")
+        endpoint = f"{request.method} {route.path if route else request.url.path}"
+        if rate_limiter.shared:
+            # The Redis round trip would block the event loop
+            result = await run_in_threadpool(check_rate_limit, agent, endpoint)
+        else:
+            result = check_rate_limit(agent, endpoint)
+    headers = rate_limit_headers(result)
+
+    if not result.allowed:
         raise HTTPException(
             status_code=429,
-            detail="Rate limit exceeded. Maximum 100 requests per hour.",
-            headers={"Retry-After": "3600"}
+            detail=f"Rate limit exceeded. Maximum {result.limit} requests per {rate_limiter.window_for(endpoint)} seconds.",
+            headers=headers
         )
+
+    response.headers.update(headers)
     
     return agent
\ No newline at end of file
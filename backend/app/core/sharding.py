@@ -0,0 +1,48 @@
+import bisect
+import hashlib
+import os
+from typing import Dict, Iterable, List
+
+# Fixed number of shards messages are spread over by recipient. Workers own whole
+# shards, so this bounds how many workers can share the load; changing it
+# reassigns every stored message's shard, so pick it once per deployment.
+NUM_SHARDS = int(os.getenv("DELIVERY_SHARDS", "256"))
+
+
+def _hash(value: str) -> int:
+    # Stable across processes and machines, unlike hash()
+    return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], "big")
+
+
+def shard_of(agent_id: str) -> int:
+    """Shard holding the messages addressed to agent_id"""
+    return _hash(agent_id) % NUM_SHARDS
+
+
+class HashRing:
+    """
+    Consistent-hash ring assigning shards to members.
+
+    Each member is placed at `vnodes` points on the ring and owns the shards
+    that hash to just before its points, so when a member joins or leaves only
+    the shards next to its points move. Every process building a ring from the
+    same members gets the same assignment.
+    """
+
+    def __init__(self, members: Iterable[str], vnodes: int = 160):
+        points = sorted((_hash(f"{member}#{index}"), member) for member in set(members) for index in range(vnodes))
+        self._keys = [key for key, _ in points]
+        self._members = [member for _, member in points]
+
+    def owner(self, shard: int) -> str:
+        if not self._keys:
+            raise LookupError("Hash ring has no members")
+        index = bisect.bisect(self._keys, _hash(f"shard:{shard}")) % len(self._keys)
+        return self._members[index]
+
+    def assignments(self, num_shards: int = NUM_SHARDS) -> Dict[str, List[int]]:
+        """Member -> the shards it owns"""
+        owned: Dict[str, List[int]] = {member: [] for member in self._members}
+        for shard in range(num_shards):
+            owned[self.owner(shard)].append(shard)
+        return owned
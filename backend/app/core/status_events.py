@@ -0,0 +1,81 @@
+import logging
+import threading
+from collections import deque
+from typing import List, Optional, Tuple
+
+import redis
+
+from app.models.database import AgentStatus
+
+logger = logging.getLogger(__name__)
+
+STATUS_STREAM = "agents:status"
+
+
+class StatusEvents:
+    """
+    Feed of agent status transitions (ONLINE / OFFLINE) for the delivery workers.
+
+    With Redis attached this is a Redis Stream that every worker reads from its
+    own position, so transitions published while a worker is busy wait for it
+    instead of being dropped the way pub/sub drops them. Without Redis events go
+    to an in-process buffer with the same interface: the stand-in tests and
+    single-process setups use.
+
+    The transition itself is committed to the database before it is published
+    (parked messages are released in the same transaction), so an event a worker
+    never sees, e.g. one published while it was down, only costs latency: the
+    worker's sweep finds the released messages.
+    """
+
+    def __init__(self, stream: str = STATUS_STREAM, maxlen: int = 100000):
+        self.stream = stream
+        self.maxlen = maxlen
+        self.redis_client: Optional[redis.Redis] = None
+        self._local = deque(maxlen=maxlen)
+        self._last_local_id = 0
+        self._condition = threading.Condition()
+
+    def attach_redis(self, redis_client: redis.Redis):
+        self.redis_client = redis_client
+
+    def publish(self, agent_id: str, status: AgentStatus):
+        fields = {"agent_id": agent_id, "status": status.value}
+        if self.redis_client:
+            try:
+                self.redis_client.xadd(self.stream, fields, maxlen=self.maxlen, approximate=True)
+            except Exception as e:
+                logger.warning(f"Could not publish status change of {agent_id}: {e}")
+            return
+
+        with self._condition:
+            self._last_local_id += 1
+            self._local.append((f"{self._last_local_id}-0", fields))
+            self._condition.notify_all()
+
+    def position(self) -> str:
+        """Id of the latest event; read() after it returns only events published from now on"""
+        if self.redis_client:
+            latest = self.redis_client.xrevrange(self.stream, count=1)
+            return latest[0][0] if latest else "0-0"
+        with self._condition:
+            return f"{self._last_local_id}-0"
+
+    def read(self, after: str, count: int, block_ms: int) -> List[Tuple[str, dict]]:
+        """Up to count events after the given id, waiting up to block_ms for the first"""
+        if self.redis_client:
+            response = self.redis_client.xread({self.stream: after}, count=count, block=max(block_ms, 1))
+            return response[0][1] if response else []
+
+        after = int(after.split("-", 1)[0])
+        with self._condition:
+            self._condition.wait_for(lambda: self._last_local_id > after, timeout=block_ms / 1000)
+            return [
+                (event_id, fields) for event_id, fields in self._local
+                if int(event_id.split("-", 1)[0]) > after
+            ][:count]
+
+
+# Published by the API on every status change, consumed by delivery workers;
+# main.py and the worker attach Redis when available
+status_events = StatusEvents()
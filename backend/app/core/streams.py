@@ -0,0 +1,103 @@
+from typing import Iterable, List, Tuple
+
+import redis
+
+DELIVERY_STREAM = "messages:delivery"
+DELIVERY_GROUP = "delivery-workers"
+
+
+class DeliveryStream:
+    """
+    Redis Stream carrying delivery hints from the API to the workers.
+
+    Each entry holds the "message_id" of a message that is ready; agent status
+    changes have their own feed in app.core.status_events. The database stays
+    the source of truth: a lost or duplicated entry only costs latency, because workers
+    lease the row before delivering and the reconciliation sweep catches
+    anything the stream missed.
+    """
+
+    def __init__(self, redis_client: redis.Redis, stream: str = DELIVERY_STREAM, group: str = DELIVERY_GROUP, maxlen: int = 100000):
+        self.redis_client = redis_client
+        self.stream = stream
+        self.group = group
+        self.maxlen = maxlen
+
+    def ensure_group(self):
+        """Create the consumer group (and stream) if they don't exist yet"""
+        try:
+            self.redis_client.xgroup_create(self.stream, self.group, id="0", mkstream=True)
+        except redis.exceptions.ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    def publish_messages(self, message_ids: Iterable[str]):
+        pipe = self.redis_client.pipeline(transaction=False)
+        for message_id in message_ids:
+            pipe.xadd(self.stream, {"message_id": message_id}, maxlen=self.maxlen, approximate=True)
+        pipe.execute()
+
+    def read(self, consumer: str, count: int, block_ms: int) -> List[Tuple[str, dict]]:
+        """Block up to block_ms for new entries; returns [(entry_id, fields)]"""
+        response = self.redis_client.xreadgroup(
+            self.group,
+            consumer,
+            {self.stream: ">"},
+            count=count,
+            block=max(block_ms, 1)
+        )
+        if not response:
+            return []
+        return [(entry_id, fields) for entry_id, fields in response[0][1] if fields]
+
+    def read_all(self, last_id: str, count: int, block_ms: int) -> List[Tuple[str, dict]]:
+        """
+        Block up to block_ms for entries after last_id ("$" for new ones only), outside
+        the consumer group. Sharded workers each read every entry and keep the ones for
+        their shards; there is nothing to acknowledge.
+        """
+        response = self.redis_client.xread({self.stream: last_id}, count=count, block=max(block_ms, 1))
+        return response[0][1] if response else []
+
+    def claim_stale(self, consumer: str, min_idle_ms: int, count: int) -> List[Tuple[str, dict]]:
+        """Take over entries another consumer read but never acknowledged"""
+        response = self.redis_client.xautoclaim(
+            self.stream,
+            self.group,
+            consumer,
+            min_idle_time=min_idle_ms,
+            start_id="0-0",
+            count=count
+        )
+        # Before Redis 7, entries trimmed from the stream come back with no fields
+        # and stay pending until acknowledged; Redis 7 drops them itself
+        self.ack([entry_id for entry_id, fields in response[1] if entry_id and not fields])
+        return [(entry_id, fields) for entry_id, fields in response[1] if fields]
+
+    def remove_consumer(self, consumer: str) -> bool:
+        """
+        Delete a consumer from the group, unless it still has pending entries:
+        deleting it would drop them, so they are left for claim_stale instead.
+        Returns whether it was deleted.
+        """
+        if self.redis_client.xpending_range(self.stream, self.group, min="-", max="+", count=1, consumername=consumer):
+            return False
+        self.redis_client.xgroup_delconsumer(self.stream, self.group, consumer)
+        return True
+
+    def prune_consumers(self, min_idle_ms: int) -> List[str]:
+        """
+        Delete consumers idle for min_idle_ms with nothing pending, i.e. workers that
+        stopped without removing themselves. A live worker reads (and so resets its
+        idle time) every few seconds, and XREADGROUP recreates a deleted consumer anyway.
+        """
+        removed = []
+        for consumer in self.redis_client.xinfo_consumers(self.stream, self.group):
+            if consumer["pending"] == 0 and consumer["idle"] >= min_idle_ms:
+                self.redis_client.xgroup_delconsumer(self.stream, self.group, consumer["name"])
+                removed.append(consumer["name"])
+        return removed
+
+    def ack(self, entry_ids: List[str]):
+        if entry_ids:
+            self.redis_client.xack(self.stream, self.group, *entry_ids)
@@ -0,0 +1,23 @@
+from contextlib import contextmanager, nullcontext
+
+try:
+    from opentelemetry import trace
+except ImportError:  # optional; spans are skipped without it
+    trace = None
+
+# Without an OpenTelemetry SDK configured (e.g. via opentelemetry-instrument)
+# the API hands out non-recording spans, so leaving these in costs next to nothing.
+tracer = trace.get_tracer("agentconnect") if trace else None
+
+
+def span(name: str, **attributes):
+    """Context manager for a span named `name`; a no-op when opentelemetry isn't installed"""
+    if tracer is None:
+        return nullcontext()
+    return _span(name, attributes)
+
+
+@contextmanager
+def _span(name: str, attributes: dict):
+    with tracer.start_as_current_span(name, attributes={key: value for key, value in attributes.items() if value is not None}) as current:
+        yield current
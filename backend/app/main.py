@@ -1,46 +1,108 @@
+import asyncio
 from datetime import datetime, timezone
 from typing import Optional, List
 
-from fastapi import FastAPI, HTTPException, Depends
-from pydantic import BaseModel, HttpUrl
+from fastapi import FastAPI, HTTPException, Depends, Header, Query, WebSocket, Response
+from pydantic import BaseModel, HttpUrl, Field, field_validator
+from sqlalchemy import insert, func, or_, select, tuple_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-import json
+from starlette.concurrency import run_in_threadpool
 import redis
 
-from app.core.database import engine, get_db, Base
-from app.models.database import Agent, Message, AgentStatus, MessageStatus
+from app.core.cache import BackgroundRefreshCache
+from app.core.database import engine, get_db, get_async_db, Base, SessionLocal, AsyncSessionLocal
+from app.core.directory import agent_directory
+from app.core.idempotency import MAX_KEY_LENGTH, new_key, replayed_message_id, request_fingerprint
+from app.core.metrics import MESSAGES_SENT, SEND_REPLAYS, REGISTRY, CacheCollector, GaugeCollector, render_metrics
+from app.core.pagination import encode_cursor, decode_cursor
+from app.core.partitions import create_partitioned_messages
+from app.core.payloads import encode_content, ContentTooLarge
+from app.core.search import create_search_index, normalize_tags, MAX_RESULTS
+from app.models.database import Agent, Message, AgentStatus, MessageStatus, MessagePriority, PRIORITY_LEVELS, PRIORITIES_BY_LEVEL
+from app.core.notifier import inbox_notifier
+from app.core.queue import mark_agent_messages_due
+from app.core.receipts import delivery_receipts
+from app.core.status_events import status_events
+from app.core.streams import DeliveryStream
+from app.core.tracing import span
 from app.core.security import (
     generate_id,
     generate_api_key,
     generate_secret_token,
     generate_message_id,
     hash_api_key,
-    get_current_agent
+    get_current_agent,
+    auth_cache,
+    rate_limiter,
+    invalidate_agent_auth,
+    verify_api_key,
+    websocket_api_key,
+    check_rate_limit,
+    AuthenticatedAgent
 )
+from app.workers.leasing import mark_delivered
+from app.workers.push_channel import PushSession, generate_connection_id, open_presence, close_presence, claim_payloads, MAX_ACK_IDS
 
+create_partitioned_messages(engine)
 Base.metadata.create_all(bind=engine)
+search_index = create_search_index(engine)
 
 # Pydantic Models
 class AgentRegisterRequest(BaseModel):
     name: str
     description: str
-    webhook_url: HttpUrl
+    # Optional for agents that only receive through the push channel
+    webhook_url: Optional[HttpUrl] = None
+    tags: List[str] = Field(default_factory=list, max_length=20)
+    # Opt in to batched delivery: up to this many messages per webhook call
+    delivery_batch_size: Optional[int] = Field(default=None, ge=2, le=1000)
+    # Accept gzip-encoded webhook bodies (Content-Encoding: gzip) for large payloads
+    webhook_gzip: bool = False
+    # Receive a receipt message from "system" when a sent message is delivered or fails
+    delivery_receipts: bool = False
+
+    @field_validator("tags")
+    @classmethod
+    def check_tags(cls, tags: List[str]) -> List[str]:
+        return normalize_tags(tags)
 
 class AgentRegisterResponse(BaseModel):
     agent_id: str
     api_key: str
     secret_token: str
 
+class AgentKeyRotateResponse(BaseModel):
+    agent_id: str
+    api_key: str
+
 class AgentPublicInfo(BaseModel):
     agent_id: str
     name: str
     description: str
     status: AgentStatus
     created_at: datetime
+    tags: List[str] = []
+
+class AgentSearchResult(AgentPublicInfo):
+    score: float
+
+class AgentSearchResponse(BaseModel):
+    results: List[AgentSearchResult]
+
+class AgentListItem(BaseModel):
+    # Only the fields requested via `fields` are returned
+    agent_id: Optional[str] = None
+    name: Optional[str] = None
+    description: Optional[str] = None
+    status: Optional[AgentStatus] = None
+    created_at: Optional[datetime] = None
 
 class AgentListResponse(BaseModel):
-    agents: List[AgentPublicInfo]
-    total: int
+    agents: List[AgentListItem]
+    total: int  # cached, may lag behind by up to AGENT_COUNT_TTL seconds
+    next_cursor: Optional[str]
 
 class AgentStatusUpdateRequest(BaseModel):
     status: AgentStatus
@@ -48,24 +110,155 @@ class AgentStatusUpdateRequest(BaseModel):
 class SendMessageRequest(BaseModel):
     to_agent_id: str
     message_content: dict
+    priority: MessagePriority = MessagePriority.NORMAL
 
 class SendMessageResponse(BaseModel):
     message_id: str
     status: MessageStatus
 
+class BatchMessageItem(BaseModel):
+    to_agent_id: str
+    message_content: dict
+    priority: Optional[MessagePriority] = None  # defaults to the batch's priority
+
+class SendBatchRequest(BaseModel):
+    # Either a list of individual messages...
+    messages: Optional[List[BatchMessageItem]] = None
+    # ...or one message fanned out to many recipients
+    to_agent_ids: Optional[List[str]] = None
+    message_content: Optional[dict] = None
+    priority: MessagePriority = MessagePriority.NORMAL
+
+class BatchItemResult(BaseModel):
+    to_agent_id: str
+    message_id: Optional[str] = None
+    status: Optional[MessageStatus] = None
+    error: Optional[str] = None
+
+class SendBatchResponse(BaseModel):
+    results: List[BatchItemResult]
+
+class InboxMessage(BaseModel):
+    message_id: str
+    from_agent_id: str
+    to_agent_id: str
+    message_content: dict
+    priority: MessagePriority
+    timestamp: datetime
+
+class InboxResponse(BaseModel):
+    messages: List[InboxMessage]
+
+class AckRequest(BaseModel):
+    message_ids: List[str] = Field(max_length=MAX_ACK_IDS)
+
+class AckResponse(BaseModel):
+    acknowledged: int
+
 class MessageStatusResponse(BaseModel):
     message_id: str
     from_agent_id: str
     to_agent_id: str
     status: MessageStatus
+    priority: MessagePriority
     retry_count: int
     created_at: datetime
     delivered_at: Optional[datetime]
     error_message: Optional[str]
 
+MAX_STATUS_IDS = 1000
+
+class MessageStatusQuery(BaseModel):
+    message_ids: List[str] = Field(min_length=1, max_length=MAX_STATUS_IDS)
+
+class MessageStatusQueryResponse(BaseModel):
+    messages: List[MessageStatusResponse]
+    # Unknown ids and messages the caller neither sent nor received
+    not_found: List[str]
+
 # FastAPI app
 app = FastAPI(title="Agent Connect API")
 
+MAX_BATCH_SIZE = 1000
+
+MAX_INBOX_WAIT = 60
+MAX_INBOX_MESSAGES = 1000
+
+def replayed_send(response: Response, message_id: str) -> SendMessageResponse:
+    """Answer a repeated send with the message its Idempotency-Key created"""
+    SEND_REPLAYS.inc()
+    response.headers["Idempotent-Replayed"] = "true"
+    return SendMessageResponse(message_id=message_id, status=MessageStatus.QUEUED)
+
+def status_response(message) -> MessageStatusResponse:
+    """Status of a Message, or of a row selecting MESSAGE_STATUS_COLUMNS"""
+    return MessageStatusResponse(
+        message_id=message.id,
+        from_agent_id=message.from_agent_id,
+        to_agent_id=message.to_agent_id,
+        status=message.status,
+        priority=PRIORITIES_BY_LEVEL[message.priority],
+        retry_count=message.retry_count,
+        created_at=message.created_at,
+        delivered_at=message.delivered_at,
+        error_message=message.error_message
+    )
+
+def inbox_lease_owner(agent_id: str) -> str:
+    """Lease owner for messages handed out by the agent's inbox; acks must match it"""
+    return f"inbox:{agent_id}"
+
+AGENT_COUNT_TTL = 30
+AGENT_LIST_COLUMNS = {
+    "agent_id": Agent.id,
+    "name": Agent.name,
+    "description": Agent.description,
+    "status": Agent.status,
+    "created_at": Agent.created_at,
+}
+# Everything a status lookup needs, leaving out the message content
+MESSAGE_STATUS_COLUMNS = (
+    Message.id,
+    Message.from_agent_id,
+    Message.to_agent_id,
+    Message.status,
+    Message.priority,
+    Message.retry_count,
+    Message.created_at,
+    Message.delivered_at,
+    Message.error_message,
+)
+agent_counts = BackgroundRefreshCache(ttl=AGENT_COUNT_TTL)
+message_counts = BackgroundRefreshCache(ttl=15)
+
+def count_agents(status: Optional[AgentStatus]) -> int:
+    db = SessionLocal()
+    try:
+        query = db.query(func.count(Agent.id))
+        if status:
+            query = query.filter(Agent.status == status)
+        return query.scalar()
+    finally:
+        db.close()
+
+def count_messages_by_status() -> dict:
+    db = SessionLocal()
+    try:
+        counts = {status.value: 0 for status in MessageStatus}
+        for status, count in db.query(Message.status, func.count(Message.id)).group_by(Message.status):
+            counts[status.value] = count
+        return counts
+    finally:
+        db.close()
+
+REGISTRY.register(CacheCollector({"auth": auth_cache.local, "agents": agent_directory.cache.local}))
+REGISTRY.register(GaugeCollector(
+    "agentconnect_messages",
+    "Messages stored, by status (refreshed every 15s)",
+    "status",
+    lambda: message_counts.get("by_status", count_messages_by_status)
+))
+
 try:
     redis_client = redis.Redis(host='localhost', port=6379, decode_responses=True)
     redis_client.ping()
@@ -74,6 +267,23 @@ except:
     redis_client = None
     print("Redis not available, waitlist processing will use polling only")
 
+delivery_stream = DeliveryStream(redis_client) if redis_client else None
+
+if redis_client:
+    auth_cache.attach_redis(redis_client)
+    rate_limiter.attach_redis(redis_client)
+    inbox_notifier.attach_redis(redis_client)
+    delivery_receipts.attach_redis(redis_client)
+    status_events.attach_redis(redis_client)
+    agent_directory.attach_redis(redis_client)
+
+def agent_status_changed(agent_id: str, api_key_hash: str, status: AgentStatus):
+    """Drop state derived from the agent's old status and tell the delivery workers"""
+    invalidate_agent_auth(api_key_hash)
+    agent_directory.invalidate(agent_id)
+    search_index.update_status(agent_id, status)
+    status_events.publish(agent_id, status)
+
 # Endpoints
 @app.post("/api/agents/register", response_model=AgentRegisterResponse)
 def register_agent(request: AgentRegisterRequest, db: Session = Depends(get_db)):
@@ -85,14 +295,21 @@ def register_agent(request: AgentRegisterRequest, db: Session = Depends(get_db))
         id=agent_id,
         name=request.name,
         description=request.description,
-        webhook_url=str(request.webhook_url),
+        webhook_url=str(request.webhook_url) if request.webhook_url else None,
+        tags=" ".join(request.tags) or None,
         api_key_hash=hash_api_key(api_key),
         secret_token=secret_token,
-        status=AgentStatus.OFFLINE
+        status=AgentStatus.OFFLINE,
+        delivery_batch_size=request.delivery_batch_size,
+        webhook_gzip=request.webhook_gzip,
+        delivery_receipts=request.delivery_receipts
     )
     
     db.add(agent)
+    search_index.index_agent(db, agent)
     db.commit()
+    # Sends to this id may have cached it as unknown
+    agent_directory.invalidate(agent_id)
     
     return AgentRegisterResponse(
         agent_id=agent_id,
@@ -100,6 +317,45 @@ def register_agent(request: AgentRegisterRequest, db: Session = Depends(get_db))
         secret_token=secret_token
     )
 
+@app.get("/api/agents/search", response_model=AgentSearchResponse)
+def search_agents(
+    q: Optional[str] = Query(None, max_length=200),
+    tags: Optional[str] = Query(None, description="Comma-separated tags; all must match"),
+    status: Optional[AgentStatus] = None,
+    limit: int = Query(20, ge=1, le=MAX_RESULTS),
+    db: Session = Depends(get_db)
+):
+    try:
+        tag_list = normalize_tags(tags.split(",")) if tags else []
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if not (q and q.strip()) and not tag_list:
+        raise HTTPException(status_code=400, detail="Provide a query or tags")
+
+    hits = search_index.search(db, q, tag_list, status, limit)
+    agents = {
+        agent.id: agent
+        for agent in db.query(Agent).filter(Agent.id.in_([hit.agent_id for hit in hits])).all()
+    } if hits else {}
+
+    results = []
+    for hit in hits:
+        agent = agents.get(hit.agent_id)
+        if not agent:
+            continue
+        results.append(AgentSearchResult(
+            agent_id=agent.id,
+            name=agent.name,
+            description=agent.description,
+            status=agent.status,
+            created_at=agent.created_at,
+            tags=agent.tags.split() if agent.tags else [],
+            score=hit.score
+        ))
+
+    return AgentSearchResponse(results=results)
+
 @app.get("/api/agents/{agent_id}", response_model=AgentPublicInfo)
 def get_agent_info(agent_id: str, db: Session = Depends(get_db)):
     agent = db.query(Agent).filter(Agent.id == agent_id).first()
@@ -112,104 +368,340 @@ def get_agent_info(agent_id: str, db: Session = Depends(get_db)):
         name=agent.name,
         description=agent.description,
         status=agent.status,
-        created_at=agent.created_at
+        created_at=agent.created_at,
+        tags=agent.tags.split() if agent.tags else []
     )
 
-@app.get("/api/agents", response_model=AgentListResponse)
+@app.get("/api/agents", response_model=AgentListResponse, response_model_exclude_unset=True)
 def list_agents(
     status: Optional[AgentStatus] = None,
-    skip: int = 0,
-    limit: int = 100,
+    cursor: Optional[str] = None,
+    skip: int = Query(0, ge=0, description="Deprecated: use cursor"),
+    limit: int = Query(100, ge=1, le=1000),
+    fields: Optional[str] = Query(None, description="Comma-separated subset of agent fields to return"),
     db: Session = Depends(get_db)
 ):
-    query = db.query(Agent)
+    if fields:
+        selected = [field.strip() for field in fields.split(",") if field.strip()]
+        unknown = [field for field in selected if field not in AGENT_LIST_COLUMNS]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    else:
+        selected = list(AGENT_LIST_COLUMNS)
+
+    # The keyset columns are always fetched so the next cursor can be built
+    query = db.query(Agent.created_at.label("_created_at"), Agent.id.label("_id"), *[AGENT_LIST_COLUMNS[field] for field in selected])
     
     if status:
         query = query.filter(Agent.status == status)
-    
-    total = query.count()
-    agents = query.offset(skip).limit(limit).all()
+
+    query = query.order_by(Agent.created_at, Agent.id)
+    if cursor:
+        try:
+            created_at, agent_id = decode_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        query = query.filter(tuple_(Agent.created_at, Agent.id) > tuple_(created_at, agent_id))
+    elif skip:
+        query = query.offset(skip)
+
+    rows = query.limit(limit).all()
+    next_cursor = encode_cursor(rows[-1]._created_at, rows[-1]._id) if len(rows) == limit else None
     
     return AgentListResponse(
         agents=[
-            AgentPublicInfo(
-                agent_id=agent.id,
-                name=agent.name,
-                description=agent.description,
-                status=agent.status,
-                created_at=agent.created_at
-            )
-            for agent in agents
+            AgentListItem(**{field: getattr(row, AGENT_LIST_COLUMNS[field].key) for field in selected})
+            for row in rows
         ],
-        total=total
+        total=agent_counts.get(status, lambda: count_agents(status)),
+        next_cursor=next_cursor
     )
 
 @app.put("/api/agents/{agent_id}/status")
-def update_agent_status(
+async def update_agent_status(
     agent_id: str,
     request: AgentStatusUpdateRequest,
-    current_agent: Agent = Depends(get_current_agent),
-    db: Session = Depends(get_db)
+    current_agent: AuthenticatedAgent = Depends(get_current_agent),
+    db: AsyncSession = Depends(get_async_db)
 ):
     if current_agent.id != agent_id:
         raise HTTPException(status_code=403, detail="Can only update your own status")
     
-    old_status = current_agent.status
-    current_agent.status = request.status
-    current_agent.updated_at = datetime.now(timezone.utc)
-    db.commit()
-    
-    # If agent just came online, notify worker to process waitlist
+    agent = (await db.execute(select(Agent).where(Agent.id == agent_id))).scalar_one_or_none()
+    if not agent:
+        raise HTTPException(status_code=404, detail="Agent not found")
+
+    old_status = agent.status
+    api_key_hash = agent.api_key_hash
+    agent.status = request.status
+    agent.updated_at = datetime.now(timezone.utc)
+
+    # Release parked messages in the same transaction so the transition can't be lost
     if old_status != AgentStatus.ONLINE and request.status == AgentStatus.ONLINE:
-        if redis_client:
-            try:
-                redis_client.publish('agent_status_change', json.dumps({
-                    'agent_id': agent_id,
-                    'status': 'online'
-                }))
-            except:
-                pass
+        await db.run_sync(mark_agent_messages_due, agent_id)
+
+    await db.commit()
+
+    # Workers start on the released backlog, or stop sending, as soon as they hear
+    if old_status != request.status:
+        await run_in_threadpool(agent_status_changed, agent_id, api_key_hash, request.status)
     
     return {"agent_id": agent_id, "status": request.status}
 
+@app.post("/api/agents/{agent_id}/rotate_key", response_model=AgentKeyRotateResponse)
+async def rotate_api_key(
+    agent_id: str,
+    current_agent: AuthenticatedAgent = Depends(get_current_agent),
+    db: AsyncSession = Depends(get_async_db)
+):
+    if current_agent.id != agent_id:
+        raise HTTPException(status_code=403, detail="Can only rotate your own API key")
+
+    agent = (await db.execute(select(Agent).where(Agent.id == agent_id))).scalar_one_or_none()
+    if not agent:
+        raise HTTPException(status_code=404, detail="Agent not found")
+
+    old_api_key_hash = agent.api_key_hash
+    api_key = generate_api_key()
+    agent.api_key_hash = hash_api_key(api_key)
+    agent.updated_at = datetime.now(timezone.utc)
+    await db.commit()
+
+    # The old key stays valid wherever it is cached until this reaches every process
+    await run_in_threadpool(invalidate_agent_auth, old_api_key_hash)
+
+    return AgentKeyRotateResponse(agent_id=agent_id, api_key=api_key)
+
 @app.post("/api/messages/send", response_model=SendMessageResponse)
-def send_message(
+async def send_message(
     request: SendMessageRequest,
-    current_agent: Agent = Depends(get_current_agent),
-    db: Session = Depends(get_db)
+    response: Response,
+    current_agent: AuthenticatedAgent = Depends(get_current_agent),
+    db: AsyncSession = Depends(get_async_db),
+    idempotency_key: Optional[str] = Header(None, max_length=MAX_KEY_LENGTH)
 ):
-    # Verify recipient exists
-    recipient = db.query(Agent).filter(Agent.id == request.to_agent_id).first()
-    if not recipient:
-        raise HTTPException(status_code=404, detail="Recipient agent not found")
-    
-    message_id = generate_message_id()
-    
-    message = Message(
-        id=message_id,
-        from_agent_id=current_agent.id,
-        to_agent_id=request.to_agent_id,
-        message_content=json.dumps(request.message_content),
-        status=MessageStatus.QUEUED
-    )
+    """
+    Queue a message. With an Idempotency-Key header, repeating the request
+    (e.g. a client retry after a timeout) returns the original message_id
+    instead of queueing the message again.
+    """
+    with span("send_message", **{"agent.id": current_agent.id, "recipient.id": request.to_agent_id}):
+        if idempotency_key:
+            fingerprint = request_fingerprint(request.to_agent_id, request.message_content, request.priority.value)
+            original_id = await replayed_message_id(db, current_agent.id, idempotency_key, fingerprint)
+            if original_id:
+                return replayed_send(response, original_id)
+
+        # Verify recipient exists
+        recipient = (await db.run_sync(agent_directory.load, [request.to_agent_id])).get(request.to_agent_id)
+        if not recipient:
+            raise HTTPException(status_code=404, detail="Recipient agent not found")
+
+        try:
+            content = encode_content(request.message_content)
+        except ContentTooLarge as e:
+            raise HTTPException(status_code=413, detail=str(e))
     
-    db.add(message)
-    db.commit()
+        message_id = generate_message_id()
     
-    # TODO: Trigger background worker to deliver message
+        message = Message(
+            id=message_id,
+            from_agent_id=current_agent.id,
+            to_agent_id=request.to_agent_id,
+            message_content=content.data,
+            content_encoding=content.encoding,
+            status=MessageStatus.QUEUED,
+            priority=PRIORITY_LEVELS[request.priority],
+            # Recipients on a push channel get it from there; keep it out of the worker's due queue
+            next_attempt_at=None if recipient.push_connection else datetime.now(timezone.utc)
+        )
+    
+        db.add(message)
+        if idempotency_key:
+            db.add(new_key(current_agent.id, idempotency_key, message_id, fingerprint))
+        try:
+            await db.commit()
+        except IntegrityError:
+            # A concurrent request with the same key got there first
+            await db.rollback()
+            if not idempotency_key:
+                raise
+            original_id = await replayed_message_id(db, current_agent.id, idempotency_key, fingerprint)
+            if not original_id:
+                raise
+            return replayed_send(response, original_id)
+        MESSAGES_SENT.labels("send").inc()
+    
+        await run_in_threadpool(inbox_notifier.notify, [request.to_agent_id])
+
+        # Hand the message to a worker right away; the worker's sweep covers failures here
+        if delivery_stream and not recipient.push_connection:
+            try:
+                await run_in_threadpool(delivery_stream.publish_messages, [message_id])
+            except:
+                pass
     
     return SendMessageResponse(
         message_id=message_id,
         status=MessageStatus.QUEUED
     )
 
+@app.post("/api/messages/send_batch", response_model=SendBatchResponse)
+def send_batch(
+    request: SendBatchRequest,
+    current_agent: AuthenticatedAgent = Depends(get_current_agent),
+    db: Session = Depends(get_db)
+):
+    if request.messages is not None:
+        if request.to_agent_ids is not None or request.message_content is not None:
+            raise HTTPException(status_code=400, detail="Provide either messages or to_agent_ids with message_content, not both")
+        items = [(item.to_agent_id, item.message_content, item.priority or request.priority) for item in request.messages]
+    elif request.to_agent_ids is not None and request.message_content is not None:
+        items = [(to_agent_id, request.message_content, request.priority) for to_agent_id in request.to_agent_ids]
+    else:
+        raise HTTPException(status_code=400, detail="Provide either messages or to_agent_ids with message_content")
+
+    if not items:
+        raise HTTPException(status_code=400, detail="Batch is empty")
+    if len(items) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=400, detail=f"Batch exceeds {MAX_BATCH_SIZE} messages")
+
+    # Verify all recipients; any not cached are read with a single query
+    recipient_ids = {to_agent_id for to_agent_id, _, _ in items}
+    existing = agent_directory.load(db, recipient_ids)
+
+    now = datetime.now(timezone.utc)
+    rows = []
+    results = []
+    encoded = {}
+    for to_agent_id, message_content, priority in items:
+        if to_agent_id not in existing:
+            results.append(BatchItemResult(to_agent_id=to_agent_id, error="Recipient agent not found"))
+            continue
+
+        # Fan-outs share one content object; encode it once
+        content = encoded.get(id(message_content))
+        if content is None:
+            try:
+                content = encoded[id(message_content)] = encode_content(message_content)
+            except ContentTooLarge as e:
+                results.append(BatchItemResult(to_agent_id=to_agent_id, error=str(e)))
+                continue
+
+        message_id = generate_message_id()
+        rows.append({
+            "id": message_id,
+            "from_agent_id": current_agent.id,
+            "to_agent_id": to_agent_id,
+            "message_content": content.data,
+            "content_encoding": content.encoding,
+            "status": MessageStatus.QUEUED,
+            "priority": PRIORITY_LEVELS[priority],
+            "retry_count": 0,
+            "created_at": now,
+            "next_attempt_at": None if existing[to_agent_id].push_connection else now
+        })
+        results.append(BatchItemResult(
+            to_agent_id=to_agent_id,
+            message_id=message_id,
+            status=MessageStatus.QUEUED
+        ))
+
+    if rows:
+        db.execute(insert(Message), rows)
+        db.commit()
+        MESSAGES_SENT.labels("send_batch").inc(len(rows))
+
+        inbox_notifier.notify(row["to_agent_id"] for row in rows)
+
+        if delivery_stream:
+            try:
+                delivery_stream.publish_messages([row["id"] for row in rows if row["next_attempt_at"]])
+            except:
+                pass
+
+    return SendBatchResponse(results=results)
+
+@app.get("/api/messages/inbox", response_model=InboxResponse)
+async def get_inbox(
+    wait: int = Query(0, ge=0, le=MAX_INBOX_WAIT, description="Seconds to wait for messages if none are queued"),
+    max_messages: int = Query(100, alias="max", ge=1, le=MAX_INBOX_MESSAGES),
+    visibility: int = Query(60, ge=5, le=3600, description="Seconds before unacknowledged messages are handed out again"),
+    current_agent: AuthenticatedAgent = Depends(get_current_agent)
+):
+    """
+    Pull queued messages, waiting up to `wait` seconds for some to arrive.
+    Returned messages stay QUEUED until acknowledged with POST /api/messages/ack.
+    """
+    owner = inbox_lease_owner(current_agent.id)
+    # Subscribe before the first check so a message sent in between still wakes us
+    wakeup = inbox_notifier.subscribe(current_agent.id)
+    deadline = asyncio.get_running_loop().time() + wait
+    try:
+        while True:
+            wakeup.clear()
+            # A session per check, so no connection is held while waiting
+            async with AsyncSessionLocal() as db:
+                payloads = await db.run_sync(claim_payloads, owner, current_agent.id, max_messages, visibility)
+
+            remaining = deadline - asyncio.get_running_loop().time()
+            if payloads or remaining <= 0:
+                break
+            try:
+                await asyncio.wait_for(wakeup.wait(), timeout=remaining)
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        inbox_notifier.unsubscribe(current_agent.id, wakeup)
+
+    return InboxResponse(messages=payloads)
+
+@app.post("/api/messages/ack", response_model=AckResponse)
+async def ack_messages(
+    request: AckRequest,
+    current_agent: AuthenticatedAgent = Depends(get_current_agent),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Mark messages received from the inbox DELIVERED in a single UPDATE"""
+    acknowledged = await db.run_sync(
+        mark_delivered,
+        inbox_lease_owner(current_agent.id),
+        request.message_ids,
+        datetime.now(timezone.utc)
+    )
+    await db.commit()
+    return AckResponse(acknowledged=acknowledged)
+
+@app.post("/api/messages/status", response_model=MessageStatusQueryResponse)
+async def get_message_statuses(
+    request: MessageStatusQuery,
+    current_agent: AuthenticatedAgent = Depends(get_current_agent),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Statuses of up to MAX_STATUS_IDS messages the caller sent or received, in one query"""
+    message_ids = list(dict.fromkeys(request.message_ids))
+    rows = (await db.execute(
+        select(*MESSAGE_STATUS_COLUMNS).where(
+            Message.id.in_(message_ids),
+            or_(Message.from_agent_id == current_agent.id, Message.to_agent_id == current_agent.id)
+        )
+    )).all()
+
+    found = {row.id: row for row in rows}
+    return MessageStatusQueryResponse(
+        messages=[status_response(found[message_id]) for message_id in message_ids if message_id in found],
+        not_found=[message_id for message_id in message_ids if message_id not in found]
+    )
+
 @app.get("/api/messages/{message_id}", response_model=MessageStatusResponse)
-def get_message_status(
+async def get_message_status(
     message_id: str,
-    current_agent: Agent = Depends(get_current_agent),
-    db: Session = Depends(get_db)
+    current_agent: AuthenticatedAgent = Depends(get_current_agent),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    message = db.query(Message).filter(Message.id == message_id).first()
+    message = (await db.execute(
+        select(*MESSAGE_STATUS_COLUMNS).where(Message.id == message_id)
+    )).one_or_none()
     
     if not message:
         raise HTTPException(status_code=404, detail="Message not found")
@@ -218,13 +710,48 @@ def get_message_status(
     if message.from_agent_id != current_agent.id and message.to_agent_id != current_agent.id:
         raise HTTPException(status_code=403, detail="Not authorized to view this message")
     
-    return MessageStatusResponse(
-        message_id=message.id,
-        from_agent_id=message.from_agent_id,
-        to_agent_id=message.to_agent_id,
-        status=message.status,
-        retry_count=message.retry_count,
-        created_at=message.created_at,
-        delivered_at=message.delivered_at,
-        error_message=message.error_message
-    )
\ No newline at end of file
+    return status_response(message)
+
+@app.websocket("/api/messages/stream")
+async def message_stream(websocket: WebSocket):
+    """
+    Push channel: holds one connection per agent and streams its queued messages.
+    The agent is ONLINE while connected and goes OFFLINE when the connection ends.
+    See PushSession for the frame protocol.
+    """
+    api_key = websocket_api_key(websocket)
+    async with AsyncSessionLocal() as db:
+        agent = await verify_api_key(api_key, db) if api_key else None
+    if not agent:
+        await websocket.close(code=4401, reason="Invalid API key")
+        return
+
+    result = await run_in_threadpool(check_rate_limit, agent, "WEBSOCKET /api/messages/stream")
+    if not result.allowed:
+        await websocket.close(code=4429, reason="Rate limit exceeded")
+        return
+
+    await websocket.accept()
+    connection_id = generate_connection_id()
+    session = PushSession(websocket, agent.id, connection_id)
+    api_key_hash = hash_api_key(api_key)
+
+    async with AsyncSessionLocal() as db:
+        if await open_presence(db, agent.id, connection_id, session.presence_ttl):
+            await run_in_threadpool(agent_status_changed, agent.id, api_key_hash, AgentStatus.ONLINE)
+        else:
+            # Same status, but sends now go to this push channel
+            await run_in_threadpool(agent_directory.invalidate, agent.id)
+
+    try:
+        await session.run()
+    finally:
+        async with AsyncSessionLocal() as db:
+            if await close_presence(db, agent.id, connection_id):
+                await run_in_threadpool(agent_status_changed, agent.id, api_key_hash, AgentStatus.OFFLINE)
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    """Prometheus metrics for this API process"""
+    body, content_type = render_metrics()
+    return Response(content=body, headers={"Content-Type": content_type})
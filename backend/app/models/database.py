@@ -1,8 +1,10 @@
 from datetime import datetime, timezone
 from enum import Enum
-from sqlalchemy import Column, String, DateTime, Integer, Enum as SQLEnum
+from sqlalchemy import Column, String, DateTime, Integer, Boolean, LargeBinary, Index, Enum as SQLEnum
+from sqlalchemy.types import TypeDecorator
 
 from app.core.database import Base
+from app.core.sharding import shard_of
 
 class AgentStatus(str, Enum):
     ONLINE = "online"
@@ -14,18 +16,56 @@ class MessageStatus(str, Enum):
     DELIVERED = "delivered"
     FAILED = "failed"
 
+class MessagePriority(str, Enum):
+    LOW = "low"
+    NORMAL = "normal"
+    HIGH = "high"
+
+# Stored as integers so the delivery queue can order and weight by them
+PRIORITY_LEVELS = {MessagePriority.LOW: 0, MessagePriority.NORMAL: 1, MessagePriority.HIGH: 2}
+PRIORITIES_BY_LEVEL = {level: priority for priority, level in PRIORITY_LEVELS.items()}
+
+class UTCDateTime(TypeDecorator):
+    """
+    Timestamp stored as naive UTC (timestamp without time zone).
+    The code works with aware UTC datetimes; they are made naive on the way in
+    because asyncpg rejects aware values for these columns, and psycopg2 would
+    shift them by the session's time zone. Values read back are naive, see
+    app.core.queue.as_utc.
+    """
+    impl = DateTime
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is not None and value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value
+
 class Agent(Base):
     __tablename__ = "agents"
     
     id = Column(String, primary_key=True)
     name = Column(String, nullable=False)
     description = Column(String, nullable=False)
-    webhook_url = Column(String, nullable=False)
-    api_key_hash = Column(String, nullable=False)
+    webhook_url = Column(String, nullable=True)  # NULL: reachable only through the push channel
+    tags = Column(String, nullable=True)  # space-separated, normalized by app.core.search.normalize_tags
+    api_key_hash = Column(String, nullable=False, unique=True, index=True)
     secret_token = Column(String, nullable=False)
     status = Column(SQLEnum(AgentStatus), default=AgentStatus.OFFLINE, nullable=False)
-    created_at = Column(DateTime, default=datetime.now(timezone.utc), nullable=False)
-    updated_at = Column(DateTime, default=datetime.now(timezone.utc), onupdate=datetime.now(timezone.utc), nullable=False)
+    delivery_batch_size = Column(Integer, nullable=True)  # NULL: one message per webhook call
+    rate_limit = Column(Integer, nullable=True)  # requests per window; NULL: default limit
+    webhook_gzip = Column(Boolean, default=False, nullable=False)  # gzip large webhook bodies
+    delivery_receipts = Column(Boolean, default=False, nullable=False)  # receive a receipt when a sent message is delivered or fails
+    push_connection = Column(String, nullable=True)  # push channel currently held by the agent, if any
+    push_expires_at = Column(UTCDateTime, nullable=True)  # presence lapses unless the channel refreshes it
+    created_at = Column(UTCDateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
+    updated_at = Column(UTCDateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc), nullable=False)
+
+    __table_args__ = (
+        # Keyset pagination of the directory, with and without a status filter
+        Index("ix_agents_created_at_id", "created_at", "id"),
+        Index("ix_agents_status_created_at_id", "status", "created_at", "id"),
+    )
 
 class Message(Base):
     __tablename__ = "messages"
@@ -33,10 +73,44 @@ class Message(Base):
     id = Column(String, primary_key=True)
     from_agent_id = Column(String, nullable=False)
     to_agent_id = Column(String, nullable=False)
-    message_content = Column(String, nullable=False)  # JSON string
+    # Delivery shard, derived from to_agent_id on insert so every path that queues a message sets it
+    shard = Column(Integer, nullable=False, default=lambda context: shard_of(context.get_current_parameters()["to_agent_id"]))
+    message_content = Column(LargeBinary, nullable=False)  # JSON, compressed per content_encoding
+    content_encoding = Column(String, nullable=True)  # NULL (plain UTF-8), "gzip" or "zstd"
     status = Column(SQLEnum(MessageStatus), default=MessageStatus.QUEUED, nullable=False)
+    priority = Column(Integer, default=1, nullable=False)  # PRIORITY_LEVELS; higher is delivered first
     retry_count = Column(Integer, default=0, nullable=False)
-    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
-    delivered_at = Column(DateTime, nullable=True)
+    created_at = Column(UTCDateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
+    delivered_at = Column(UTCDateTime, nullable=True)
     error_message = Column(String, nullable=True)
-    last_retry_at = Column(DateTime, nullable=True)
\ No newline at end of file
+    last_retry_at = Column(UTCDateTime, nullable=True)
+    next_attempt_at = Column(UTCDateTime, nullable=True)  # NULL while parked for an offline recipient
+    lease_owner = Column(String, nullable=True)  # worker currently delivering this message
+    lease_expires_at = Column(UTCDateTime, nullable=True)
+
+    __table_args__ = (
+        Index("ix_messages_status_next_attempt_at", "status", "next_attempt_at"),
+        # Active sender queues and the head of each for the fair claim (app.workers.leasing)
+        Index("ix_messages_status_priority_from_agent_id_next_attempt_at", "status", "priority", "from_agent_id", "next_attempt_at"),
+        Index("ix_messages_to_agent_id_status", "to_agent_id", "status"),
+        # Retention sweeps (app.workers.compactor)
+        Index("ix_messages_status_created_at", "status", "created_at"),
+    )
+
+class IdempotencyKey(Base):
+    """Idempotency-Key of a send, so a retried request returns the original message"""
+    __tablename__ = "idempotency_keys"
+
+    agent_id = Column(String, primary_key=True)  # keys are scoped to the sending agent
+    key = Column(String, primary_key=True)
+    message_id = Column(String, nullable=False)
+    request_hash = Column(String, nullable=False)  # the same key with a different request is an error
+    expires_at = Column(UTCDateTime, nullable=False, index=True)
+
+class DeliveryWorker(Base):
+    """A running sharded delivery worker; the live rows decide who owns which shard"""
+    __tablename__ = "delivery_workers"
+
+    id = Column(String, primary_key=True)  # the worker's lease owner id
+    started_at = Column(UTCDateTime, nullable=False)
+    heartbeat_at = Column(UTCDateTime, nullable=False)  # rows not refreshed within the TTL are dropped
@@ -0,0 +1,231 @@
+import argparse
+import gzip
+import json
+import logging
+import os
+import re
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+from sqlalchemy import delete, tuple_
+from sqlalchemy.orm import Session
+
+from app.core.database import SessionLocal, engine
+from app.core.partitions import ensure_partitions, drop_expired_partitions
+from app.core.payloads import decode_content
+from app.models.database import IdempotencyKey, Message, MessageStatus
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Statuses that may be removed, with the env var holding their retention.
+# Queued messages are never compacted.
+RETENTION_ENV = {
+    MessageStatus.DELIVERED: ("RETENTION_DELIVERED", "7d"),
+    MessageStatus.FAILED: ("RETENTION_FAILED", "30d"),
+}
+DURATION = re.compile(r"^(\d+)([smhd]?)$")
+UNIT_SECONDS = {"": 1, "s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def parse_duration(value: str) -> Optional[int]:
+    """Seconds in "90", "15m", "12h" or "7d"; "off" (or empty) means keep forever"""
+    value = value.strip().lower()
+    if value in ("", "off", "none"):
+        return None
+    match = DURATION.match(value)
+    if not match:
+        raise ValueError(f"Invalid duration: {value!r}")
+    return int(match.group(1)) * UNIT_SECONDS[match.group(2)]
+
+
+def load_retention() -> Dict[MessageStatus, int]:
+    """Retention in seconds per status, counted from created_at"""
+    retention = {}
+    for status, (env_var, default) in RETENTION_ENV.items():
+        seconds = parse_duration(os.getenv(env_var, default))
+        if seconds is not None:
+            retention[status] = seconds
+    return retention
+
+
+def archive_record(message: Message) -> str:
+    """One JSONL line; the stored content is spliced in without re-parsing"""
+    head = json.dumps({
+        "message_id": message.id,
+        "from_agent_id": message.from_agent_id,
+        "to_agent_id": message.to_agent_id,
+        "status": message.status.value,
+        "retry_count": message.retry_count,
+        "created_at": message.created_at.isoformat(),
+        "delivered_at": message.delivered_at.isoformat() if message.delivered_at else None,
+        "error_message": message.error_message
+    })
+    content = decode_content(message.message_content, message.content_encoding).decode()
+    return f'{head[:-1]}, "message_content": {content}}}\n'
+
+
+class MessageCompactor:
+    def __init__(
+        self,
+        retention: Optional[Dict[MessageStatus, int]] = None,
+        archive_dir: Optional[str] = None,
+        batch_size: int = 1000,
+        max_batches: int = 100,
+        interval: int = 300
+    ):
+        """
+        retention: seconds to keep messages per status after creation; missing statuses are kept forever
+        archive_dir: write removed messages there as gzip JSONL before deleting them; None deletes outright
+        batch_size: rows removed per transaction, keeping locks and WAL bursts small
+        max_batches: cap per status and run, so one run can't monopolize the database
+        interval: seconds between runs
+        """
+        self.retention = retention if retention is not None else load_retention()
+        self.archive_dir = archive_dir
+        self.batch_size = batch_size
+        self.max_batches = max_batches
+        self.interval = interval
+
+    def compact_status(self, db: Session, status: MessageStatus, cutoff: datetime) -> int:
+        """
+        Remove messages with `status` created before `cutoff`, batch by batch.
+        Each batch is on disk (fsynced) before its delete commits, so a crash can
+        archive a batch twice but never lose one.
+        """
+        removed = 0
+        archive = raw = None
+        try:
+            for _ in range(self.max_batches):
+                query = db.query(Message if self.archive_dir else Message.id).filter(
+                    Message.status == status,
+                    Message.created_at < cutoff
+                ).order_by(Message.created_at).limit(self.batch_size)
+                if db.get_bind().dialect.name == "postgresql":
+                    query = query.with_for_update(skip_locked=True)
+
+                rows = query.all()
+                if not rows:
+                    break
+
+                if self.archive_dir:
+                    if archive is None:
+                        path = os.path.join(
+                            self.archive_dir,
+                            f"messages-{status.value}-{datetime.now(timezone.utc):%Y%m%dT%H%M%S}.jsonl.gz"
+                        )
+                        raw = open(path, "ab")
+                        archive = gzip.GzipFile(fileobj=raw, mode="ab")
+                    archive.write("".join(archive_record(message) for message in rows).encode())
+                    archive.flush()
+                    raw.flush()
+                    os.fsync(raw.fileno())
+
+                ids = [row.id for row in rows]
+                db.execute(
+                    delete(Message).where(Message.id.in_(ids)).execution_options(synchronize_session=False)
+                )
+                db.commit()
+                db.expunge_all()
+                removed += len(ids)
+
+                if len(rows) < self.batch_size:
+                    break
+        finally:
+            if archive is not None:
+                archive.close()
+                raw.close()
+
+        return removed
+
+    def purge_idempotency_keys(self, db: Session, now: datetime) -> int:
+        """Delete expired Idempotency-Key records, batch by batch"""
+        removed = 0
+        for _ in range(self.max_batches):
+            keys = db.query(IdempotencyKey.agent_id, IdempotencyKey.key).filter(
+                IdempotencyKey.expires_at < now
+            ).limit(self.batch_size).all()
+            if not keys:
+                break
+
+            db.execute(
+                delete(IdempotencyKey)
+                .where(tuple_(IdempotencyKey.agent_id, IdempotencyKey.key).in_(keys))
+                .execution_options(synchronize_session=False)
+            )
+            db.commit()
+            removed += len(keys)
+            if len(keys) < self.batch_size:
+                break
+        return removed
+
+    def run_once(self) -> Dict[MessageStatus, int]:
+        """One compaction pass over every status with a retention"""
+        ensure_partitions(engine)
+        now = datetime.now(timezone.utc)
+
+        if not self.archive_dir:
+            # Cheapest path first: whole partitions that are entirely expired
+            drop_expired_partitions(engine, self.retention, now)
+
+        removed = {}
+        db = SessionLocal()
+        try:
+            for status, seconds in self.retention.items():
+                removed[status] = self.compact_status(db, status, now - timedelta(seconds=seconds))
+                if removed[status]:
+                    logger.info(f"Compacted {removed[status]} {status.value} messages")
+
+            purged = self.purge_idempotency_keys(db, now)
+            if purged:
+                logger.info(f"Purged {purged} expired idempotency keys")
+        finally:
+            db.close()
+
+        if self.archive_dir:
+            # Partitions emptied by the pass above
+            drop_expired_partitions(engine, {}, now)
+
+        return removed
+
+    def run(self):
+        """Compact every `interval` seconds"""
+        policy = ", ".join(f"{status.value} after {seconds}s" for status, seconds in self.retention.items()) or "nothing"
+        logger.info(f"Message compactor started: removing {policy}" + (f", archiving to {self.archive_dir}" if self.archive_dir else ""))
+
+        while True:
+            started = time.monotonic()
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"Compaction failed: {e}", exc_info=True)
+            time.sleep(max(0.0, self.interval - (time.monotonic() - started)))
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Remove (and optionally archive) messages past their retention, and expired idempotency keys")
+    parser.add_argument("--once", action="store_true", help="run a single pass and exit")
+    parser.add_argument("--archive-dir", default=os.getenv("MESSAGE_ARCHIVE_DIR"))
+    parser.add_argument("--batch-size", type=int, default=int(os.getenv("COMPACTION_BATCH_SIZE", "1000")))
+    parser.add_argument("--max-batches", type=int, default=int(os.getenv("COMPACTION_MAX_BATCHES", "100")))
+    parser.add_argument("--interval", type=int, default=int(os.getenv("COMPACTION_INTERVAL", "300")))
+    args = parser.parse_args(argv)
+
+    if args.archive_dir:
+        os.makedirs(args.archive_dir, exist_ok=True)
+
+    compactor = MessageCompactor(
+        archive_dir=args.archive_dir,
+        batch_size=args.batch_size,
+        max_batches=args.max_batches,
+        interval=args.interval
+    )
+    if args.once:
+        compactor.run_once()
+    else:
+        compactor.run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,370 @@
+import os
+import socket
+import secrets
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, List, Optional, Set, Tuple
+from sqlalchemy import Integer, String, bindparam, case, column, func, literal, select, true, union_all, update, or_
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.orm import Session
+
+from app.core.metrics import DELIVERY_LATENCY, delivery_channel
+from app.core.queue import as_utc
+from app.core.receipts import Outcome, delivery_receipts
+from app.core.security import generate_id
+from app.models.database import Message, MessageStatus
+
+
+# Share of delivery slots per priority level in the fair queue (low, normal, high)
+PRIORITY_WEIGHTS = {0: 1, 1: 4, 2: 16}
+# Virtual time a message of each level costs (1 / weight, scaled to whole numbers)
+PRIORITY_COSTS = {level: max(PRIORITY_WEIGHTS.values()) // weight for level, weight in PRIORITY_WEIGHTS.items()}
+# Most sender queues per priority level one claim offers slots to
+SENDER_SCAN_LIMIT = int(os.getenv("CLAIM_SENDER_SCAN_LIMIT", "256"))
+
+
+def generate_worker_id() -> str:
+    """Unique lease owner id for this worker process"""
+    return f"{socket.gethostname()}:{os.getpid()}:{secrets.token_hex(4)}"
+
+
+def claim_due_messages(
+    db: Session,
+    owner: str,
+    limit: int,
+    lease_seconds: int,
+    now: Optional[datetime] = None,
+    filters: Iterable = ()
+) -> List[Message]:
+    """
+    Lease up to `limit` due messages for `owner` and return them.
+
+    Due messages are picked by weighted fair queuing rather than age alone:
+    each message's virtual finish time is its position in its sender's queue
+    for that priority times the priority's cost. A sender with a huge backlog
+    therefore takes one slot per round like everyone else, and higher
+    priorities get proportionally more slots, so low-volume agents see bounded
+    latency under heavy load. Ties go to the message furthest ahead in its
+    recipient's queue, spreading a page across recipients.
+
+    Only a page-sized set of candidates is ranked, so a claim costs the same
+    however large the due backlog is (see _candidate_ids).
+
+    Rows are claimable when nobody holds a lease or the lease has expired,
+    so messages held by a crashed worker are picked up again automatically.
+    Postgres uses SELECT ... FOR UPDATE SKIP LOCKED so concurrent workers never
+    block on each other. SQLite has no row locks; there the claim is a
+    compare-and-set UPDATE, which SQLite's single writer makes atomic.
+    Commits the claim.
+    """
+    now = now or datetime.now(timezone.utc)
+    due = (Message.status == MessageStatus.QUEUED, Message.next_attempt_at <= now, _claimable(now), *filters)
+
+    candidate_ids = _candidate_ids(db, limit, due)
+    if not candidate_ids:
+        db.rollback()
+        return []
+
+    cost = case(PRIORITY_COSTS, value=Message.priority, else_=max(PRIORITY_COSTS.values()))
+    ranked = select(
+        Message.id,
+        cost.label("cost"),
+        func.row_number().over(
+            partition_by=(Message.from_agent_id, Message.priority),
+            order_by=Message.next_attempt_at
+        ).label("sender_rank"),
+        func.row_number().over(
+            partition_by=Message.to_agent_id,
+            order_by=(Message.priority.desc(), Message.next_attempt_at)
+        ).label("recipient_rank")
+    ).where(Message.id.in_(candidate_ids), *due).subquery()
+
+    # The conditions are repeated on the outer rows so Postgres rechecks them once a row is locked
+    candidates = select(Message.id).join(ranked, ranked.c.id == Message.id).where(*due).order_by(
+        ranked.c.sender_rank * ranked.c.cost,
+        ranked.c.recipient_rank,
+        Message.next_attempt_at
+    ).limit(limit)
+
+    return _lease(db, owner, candidates, due, now, lease_seconds, (Message.priority.desc(), Message.next_attempt_at))
+
+
+def _candidate_ids(db: Session, limit: int, due: tuple) -> List[str]:
+    """
+    Ids a page of `limit` is ranked from.
+
+    When no more than `limit` messages are due, that's all of them and the page
+    is exact. Otherwise it's the `limit` longest-due messages (so a page is
+    always full) plus the front of each active sender queue, sized by the
+    queue's share of the page by priority weight. Every candidate set is a
+    prefix of its sender's queue, so sender ranks stay exact; a queue is only
+    cut short where it already has its share of the page.
+
+    Sender queues are found with a loose index scan, one probe of the
+    (status, priority, from_agent_id) index per sender, so nothing here reads
+    the whole backlog.
+    """
+    oldest = db.execute(
+        select(Message.id).where(*due).order_by(Message.next_attempt_at).limit(limit + 1)
+    ).scalars().all()
+    if len(oldest) <= limit:
+        return oldest
+
+    queues = _sender_queues(db)
+    weight = sum(PRIORITY_WEIGHTS.get(priority, 1) for priority, _ in queues)
+    shares = [
+        (priority, sender, -(-limit * PRIORITY_WEIGHTS.get(priority, 1) // weight))
+        for priority, sender in queues
+    ]
+    return list(set(oldest[:limit]) | _queue_fronts(db, shares, due))
+
+
+def _sender_queues(db: Session) -> List[Tuple[int, str]]:
+    """
+    Up to SENDER_SCAN_LIMIT (priority, from_agent_id) queues with queued messages per priority level.
+    Each level is scanned from a random sender id and wraps around, so when more
+    senders are active than that, a different slice of them is offered each claim.
+    """
+    queues = {priority: [] for priority in PRIORITY_WEIGHTS}
+    rows = db.execute(_SENDER_SCAN, {"start": generate_id()}).all()
+    for row in sorted(rows, key=lambda row: (row.wrapped, row.n)):
+        if len(queues[row.priority]) < SENDER_SCAN_LIMIT:
+            queues[row.priority].append(row.sender)
+    return [(priority, sender) for priority, senders in queues.items() for sender in senders]
+
+
+def _sender_scan():
+    """
+    The statement behind _sender_queues, built once: for each priority level,
+    senders after :start, then senders from the beginning up to :start. Each step
+    finds the next sender with one probe of the (status, priority, from_agent_id)
+    index, however many messages the previous one has queued.
+    """
+    start = bindparam("start", type_=String)
+    scans = []
+    for priority in PRIORITY_WEIGHTS:
+        for wrapped in (False, True):
+            def next_sender(previous):
+                conditions = [Message.status == MessageStatus.QUEUED, Message.priority == priority, Message.from_agent_id > previous]
+                if wrapped:
+                    conditions.append(Message.from_agent_id <= start)
+                return (
+                    select(Message.from_agent_id).where(*conditions)
+                    .order_by(Message.from_agent_id).limit(1).scalar_subquery()
+                )
+
+            senders = select(
+                next_sender(literal("") if wrapped else start).label("sender"), literal(1).label("n")
+            ).cte(f"senders_{priority}_{int(wrapped)}", recursive=True)
+            senders = senders.union_all(
+                select(next_sender(senders.c.sender), senders.c.n + 1)
+                .where(senders.c.sender.is_not(None), senders.c.n < SENDER_SCAN_LIMIT)
+            )
+            scans.append(
+                select(literal(priority).label("priority"), literal(wrapped).label("wrapped"), senders.c.sender, senders.c.n)
+                .where(senders.c.sender.is_not(None))
+            )
+    return union_all(*scans)
+
+
+_SENDER_SCAN = _sender_scan()
+
+
+def _queue_fronts(db: Session, shares: List[Tuple[int, str, int]], due: tuple) -> Set[str]:
+    """Ids of the first `share` due messages of each (priority, from_agent_id, share) queue"""
+    if not shares:
+        return set()
+
+    if db.get_bind().dialect.name == "postgresql":
+        priorities, senders, counts = zip(*shares)
+        # Arrays rather than a VALUES list, so the statement compiles once however many queues there are
+        queues = func.unnest(
+            bindparam("priorities", list(priorities), type_=ARRAY(Integer)),
+            bindparam("senders", list(senders), type_=ARRAY(String)),
+            bindparam("shares", list(counts), type_=ARRAY(Integer))
+        ).table_valued(
+            column("priority", Integer), column("from_agent_id", String), column("share", Integer)
+        ).render_derived(name="queues")
+        front = select(Message.id).where(
+            Message.priority == queues.c.priority,
+            Message.from_agent_id == queues.c.from_agent_id,
+            *due
+        ).order_by(Message.next_attempt_at).limit(queues.c.share).lateral()
+        return set(db.execute(select(front.c.id).select_from(queues).join(front, true())).scalars())
+
+    # No LATERAL elsewhere: one statement, run per queue
+    front = select(Message.id).where(
+        Message.priority == bindparam("priority"),
+        Message.from_agent_id == bindparam("from_agent_id"),
+        *due
+    ).order_by(Message.next_attempt_at).limit(bindparam("share"))
+    ids = set()
+    for priority, sender, share in shares:
+        ids.update(db.execute(front, {"priority": priority, "from_agent_id": sender, "share": share}).scalars())
+    return ids
+
+
+def claim_agent_messages(
+    db: Session,
+    owner: str,
+    agent_id: str,
+    limit: int,
+    lease_seconds: int,
+    now: Optional[datetime] = None
+) -> List[Message]:
+    """
+    Lease up to `limit` queued messages for one recipient, highest priority then oldest first.
+    Unlike claim_due_messages this ignores next_attempt_at, so parked messages
+    and messages in retry backoff are included: used by channels the recipient
+    is actively holding open. Commits the claim.
+    """
+    now = now or datetime.now(timezone.utc)
+    queued = (Message.to_agent_id == agent_id, Message.status == MessageStatus.QUEUED, _claimable(now))
+    candidates = select(Message.id).where(*queued).order_by(Message.priority.desc(), Message.created_at).limit(limit)
+
+    return _lease(db, owner, candidates, queued, now, lease_seconds, (Message.priority.desc(), Message.created_at))
+
+
+def _claimable(now: datetime):
+    return or_(Message.lease_expires_at.is_(None), Message.lease_expires_at < now)
+
+
+def _lease(
+    db: Session,
+    owner: str,
+    candidates,
+    conditions: tuple,
+    now: datetime,
+    lease_seconds: int,
+    order_by: tuple
+) -> List[Message]:
+    """
+    Take leases on the candidate ids and return the rows this claim actually got.
+    The candidates may be stale by the time the UPDATE runs (another worker can
+    lease, deliver and release a message in between), so it re-applies the
+    conditions they were selected by, and only rows it updated are returned:
+    another thread of the same owner may hold the rest.
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        # OF: lock only the messages rows, not derived tables joined for ordering
+        candidates = candidates.with_for_update(skip_locked=True, of=Message)
+
+    ids = db.execute(candidates).scalars().all()
+    if not ids:
+        db.rollback()
+        return []
+
+    leased = db.execute(
+        update(Message)
+        .where(Message.id.in_(ids), *conditions)
+        .values(lease_owner=owner, lease_expires_at=now + timedelta(seconds=lease_seconds))
+        .returning(Message.id)
+        .execution_options(synchronize_session=False)
+    ).scalars().all()
+    db.commit()
+    if not leased:
+        return []
+
+    return db.query(Message).filter(Message.id.in_(leased)).order_by(*order_by).all()
+
+
+def write_back(db: Session, owner: str, updates: List[dict]) -> List[str]:
+    """
+    Apply per-message column updates in one statement batch, releasing the lease.
+    Rows whose lease was taken over by another worker are left untouched.
+    Each dict must include the message "id". Returns the ids that were updated. Caller commits.
+    """
+    if not updates:
+        return []
+
+    # The batch UPDATE can't report which rows it matched, so first find (and lock
+    # until commit) the rows this owner still holds
+    held = set(db.execute(
+        update(Message)
+        .where(Message.id.in_([values["id"] for values in updates]), Message.lease_owner == owner)
+        .values(lease_owner=owner)
+        .returning(Message.id)
+        .execution_options(synchronize_session=False)
+    ).scalars())
+    updates = [values for values in updates if values["id"] in held]
+    if not updates:
+        return []
+
+    for values in updates:
+        values["lease_owner"] = None
+        values["lease_expires_at"] = None
+
+    db.execute(
+        update(Message).where(Message.lease_owner == owner),
+        updates,
+        execution_options={"synchronize_session": None}
+    )
+    return [values["id"] for values in updates]
+
+
+def mark_delivered(db: Session, owner: str, message_ids: List[str], delivered_at: datetime) -> int:
+    """
+    Mark many leased messages DELIVERED with a single UPDATE, record their
+    time in the queue and queue any delivery receipts their senders asked for.
+    Returns how many were marked. Caller commits.
+    """
+    if not message_ids:
+        return 0
+
+    marked = db.execute(
+        update(Message)
+        .where(Message.id.in_(message_ids), Message.lease_owner == owner)
+        .values(
+            status=MessageStatus.DELIVERED,
+            delivered_at=delivered_at,
+            error_message=None,
+            next_attempt_at=None,
+            lease_owner=None,
+            lease_expires_at=None
+        )
+        .returning(Message.id, Message.from_agent_id, Message.to_agent_id, Message.created_at)
+        .execution_options(synchronize_session=False)
+    ).all()
+
+    histogram = DELIVERY_LATENCY.labels(delivery_channel(owner))
+    for row in marked:
+        histogram.observe((delivered_at - as_utc(row.created_at)).total_seconds())
+
+    delivery_receipts.queue(db, [
+        Outcome(row.id, row.from_agent_id, row.to_agent_id, MessageStatus.DELIVERED, delivered_at)
+        for row in marked
+    ])
+    return len(marked)
+
+
+def renew_leases(db: Session, owner: str, message_ids: Iterable[str], lease_seconds: int, now: Optional[datetime] = None) -> int:
+    """
+    Extend the leases `owner` still holds on the given messages to `lease_seconds` from now.
+    Returns how many were renewed. Caller commits.
+    """
+    message_ids = list(message_ids)
+    if not message_ids:
+        return 0
+
+    now = now or datetime.now(timezone.utc)
+    result = db.execute(
+        update(Message)
+        .where(Message.id.in_(message_ids), Message.lease_owner == owner)
+        .values(lease_expires_at=now + timedelta(seconds=lease_seconds))
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount
+
+
+def release_leases(db: Session, owner: str, message_ids: Iterable[str]) -> int:
+    """Drop any leases still held by `owner` on the given messages. Caller commits."""
+    message_ids = list(message_ids)
+    if not message_ids:
+        return 0
+
+    result = db.execute(
+        update(Message)
+        .where(Message.id.in_(message_ids), Message.lease_owner == owner)
+        .values(lease_owner=None, lease_expires_at=None)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount
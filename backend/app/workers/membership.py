@@ -0,0 +1,65 @@
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import List
+
+from sqlalchemy import delete, select, update
+from sqlalchemy.orm import Session
+
+from app.core.sharding import NUM_SHARDS, HashRing
+from app.models.database import DeliveryWorker
+
+logger = logging.getLogger(__name__)
+
+
+class WorkerMembership:
+    """
+    Tracks which sharded delivery workers are alive through heartbeats in the
+    delivery_workers table, and which shards this worker owns among them.
+
+    Any worker on any machine sharing the database takes part. Members only
+    agree on ownership once they have seen each other's heartbeats, so for up
+    to one interval after a join or leave two workers may both claim a shard
+    (leases still prevent double delivery) or nobody does (its messages wait
+    until the next heartbeat).
+    """
+
+    def __init__(self, worker_id: str, ttl: int = 15):
+        """ttl: seconds without a heartbeat after which a worker is considered gone"""
+        self.worker_id = worker_id
+        self.ttl = ttl
+        self.members: List[str] = []
+        self.shards: List[int] = []
+
+    def heartbeat(self, db: Session) -> bool:
+        """
+        Refresh this worker's row, drop expired ones and recompute the shards it owns.
+        Returns True when the assignment changed. Commits.
+        """
+        now = datetime.now(timezone.utc)
+        refreshed = db.execute(
+            update(DeliveryWorker).where(DeliveryWorker.id == self.worker_id).values(heartbeat_at=now)
+        ).rowcount
+        if not refreshed:
+            db.add(DeliveryWorker(id=self.worker_id, started_at=now, heartbeat_at=now))
+
+        # Workers that died without leaving
+        db.execute(delete(DeliveryWorker).where(DeliveryWorker.heartbeat_at < now - timedelta(seconds=self.ttl)))
+        db.commit()
+
+        members = sorted(db.execute(select(DeliveryWorker.id)).scalars().all())
+        if members == self.members:
+            return False
+
+        self.members = members
+        shards = HashRing(members).assignments().get(self.worker_id, [])
+        changed = shards != self.shards
+        self.shards = shards
+        logger.info(f"{len(members)} delivery workers; {self.worker_id} owns {len(shards)} of {NUM_SHARDS} shards")
+        return changed
+
+    def leave(self, db: Session):
+        """Remove this worker so the others take over its shards at their next heartbeat. Commits."""
+        db.execute(delete(DeliveryWorker).where(DeliveryWorker.id == self.worker_id))
+        db.commit()
+        self.members = []
+        self.shards = []
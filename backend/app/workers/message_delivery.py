@@ -1,162 +1,586 @@
+import os
+import signal
+import threading
 import time
 import logging
 from datetime import datetime, timedelta, timezone
+from collections import Counter, defaultdict
+from contextlib import closing
+from typing import Dict, List, Optional
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 import redis
-import json
 
 from app.core.database import SessionLocal
-from app.models.database import Message, Agent, MessageStatus, AgentStatus
-from app.workers.webhook_caller import call_webhook
+from app.core.directory import AgentEntry, agent_directory
+from app.core.metrics import DELIVERY_ATTEMPTS, REGISTRY, CacheCollector, GaugeCollector, render_metrics
+from app.core.notifier import inbox_notifier
+from app.core.payloads import UndecodableContent, decode_content
+from app.core.queue import park_messages, unpark_online_messages, expire_push_connections
+from app.core.receipts import Outcome, delivery_receipts
+from app.core.sharding import shard_of
+from app.core.status_events import status_events
+from app.core.streams import DeliveryStream
+from app.core.tracing import span
+from app.models.database import Message, MessageStatus, AgentStatus
+from app.workers.leasing import generate_worker_id, claim_due_messages, write_back, mark_delivered, renew_leases, release_leases
+from app.workers.membership import WorkerMembership
+from app.workers.metrics_server import start_metrics_server
+from app.workers.recipient_health import BreakerState, HealthTracker
+from app.workers.scheduler import DueTimeHeap
+from app.workers.webhook_caller import WebhookDispatcher, WebhookJob, WebhookResult, build_webhook_job, build_batch_webhook_job, forget_job, signed_jobs
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Longest a blocking wait runs before the loop checks whether it should stop
+STOP_CHECK_INTERVAL = 2
+# Longest a finished delivery waits to be written back while the rest of its page is in flight
+FLUSH_INTERVAL = 1
+
 
 class MessageDeliveryWorker:
-    def __init__(self, poll_interval: int = 5):
+    def __init__(
+        self,
+        poll_interval: float = 5,
+        concurrency: int = 32,
+        per_agent_concurrency: int = 4,
+        batch_size: int = 100,
+        unpark_interval: int = 60,
+        lease_seconds: int = 600,
+        sweep_interval: int = 30,
+        metrics_port: Optional[int] = None,
+        sharded: bool = False,
+        heartbeat_interval: int = 5
+    ):
         """
-        poll_interval: seconds between polling for queued messages
+        poll_interval: max seconds to sleep when nothing is due (polling only mode)
+        concurrency: max webhook calls in flight across all recipients
+        per_agent_concurrency: max webhook calls in flight to a single recipient; the actual
+            limit adapts to the recipient's health between 1 and this
+        batch_size: max due messages fetched per page
+        unpark_interval: seconds between sweeps for parked messages whose recipient is online
+            and for push channels whose presence has lapsed
+        lease_seconds: how long a claimed batch stays reserved for this worker; leases on
+            messages still in flight are renewed every third of this, so it bounds how long
+            a crashed worker's messages wait before another worker picks them up
+        sweep_interval: seconds between reconciliation sweeps when the delivery stream is available
+        metrics_port: serve Prometheus metrics on this port at /metrics, and recipient health
+            (circuit breakers, timeouts, limits) as JSON at /metrics/recipients
+        sharded: only deliver messages for the recipient shards this worker owns among the
+            live sharded workers (see app.workers.supervisor), so each recipient is served
+            by one process (which does not by itself keep its messages in order)
+        heartbeat_interval: seconds between membership heartbeats when sharded; a worker
+            missing three is considered gone and its shards move to the others
         """
         self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.unpark_interval = unpark_interval
+        self.lease_seconds = lease_seconds
+        self.sweep_interval = sweep_interval
+        self.worker_id = generate_worker_id()
         self.max_retries = 5
         self.retry_delays = [60, 300, 900, 3600, 21600]  # 1min, 5min, 15min, 1hr, 6hr
+        self.metrics_port = metrics_port
+        self.health = HealthTracker(max_concurrency=per_agent_concurrency)
+        self.dispatcher = WebhookDispatcher(
+            max_in_flight=concurrency,
+            max_per_agent=per_agent_concurrency,
+            health=self.health
+        )
+        self.due_times = DueTimeHeap()
+        self.last_unpark = 0.0
+        self.last_sweep = 0.0
+        self.membership = WorkerMembership(self.worker_id, ttl=3 * heartbeat_interval) if sharded else None
+        self.heartbeat_interval = heartbeat_interval
+        self.stream_position = "$"  # sharded workers read the stream outside the consumer group
+        self.stopping = threading.Event()
 
         try:
             self.redis_client = redis.Redis(host='localhost', port=6379, decode_responses=True)
             self.redis_client.ping()
-            self.pubsub = self.redis_client.pubsub()
-            self.pubsub.subscribe('agent_status_change')
-            logger.info("Connected to Redis for instant waitlist processing")
+            self.stream = DeliveryStream(self.redis_client)
+            self.stream.ensure_group()
+            # Receipts this worker queues wake their senders' push channels and other workers
+            inbox_notifier.attach_redis(self.redis_client)
+            delivery_receipts.attach_redis(self.redis_client)
+            status_events.attach_redis(self.redis_client)
+            agent_directory.attach_redis(self.redis_client)
+            logger.info("Connected to Redis, consuming delivery stream for immediate dispatch")
         except:
             logger.warning("Redis not available, using polling only")
             self.redis_client = None
+            self.stream = None
 
-        
-    def should_retry_message(self, message: Message) -> bool:
-        """Check if message should be retried based on retry count and delay"""
-        if message.retry_count >= self.max_retries:
-            return False
-        
-        if message.retry_count == 0:
-            return True
-        
-        # Calculate when next retry should happen
-        delay_seconds = self.retry_delays[message.retry_count - 1]
-        last_attempt = message.last_retry_at or message.created_at
-        next_retry_time = last_attempt + timedelta(seconds=delay_seconds)
-        
-        return datetime.now(timezone.utc) >= next_retry_time
-    
-    def process_queued_messages(self, db: Session):
-        """Process all queued messages"""
-        messages = db.query(Message).filter(
-            Message.status == MessageStatus.QUEUED
-        ).all()
-        
+    def next_attempt_time(self, retry_count: int, now: datetime) -> datetime:
+        """When a message that has failed retry_count times should be attempted again"""
+        return now + timedelta(seconds=self.retry_delays[retry_count - 1])
+
+    def deliver_messages(self, messages: List[Message], db: Session):
+        """
+        Deliver leased messages concurrently, writing outcomes back as they come in
+        (at most FLUSH_INTERVAL apart), so a slow recipient doesn't hold up the rest
+        of the page. Recipients come from the agent directory; those not cached are
+        loaded with a single query for the whole batch.
+        """
+        # Agents that go offline after this are skipped by the dispatcher
+        loaded_at = time.monotonic()
+        recipients = agent_directory.load(db, (message.to_agent_id for message in messages))
+
+        ready = defaultdict(list)
+        by_id = {}
+        updates = []
+        parked = []
         for message in messages:
-            if not self.should_retry_message(message):
-                continue
-            
-            # Get recipient agent
-            recipient = db.query(Agent).filter(Agent.id == message.to_agent_id).first()
-            
+            recipient = recipients.get(message.to_agent_id)
+
             if not recipient:
                 logger.error(f"Recipient agent {message.to_agent_id} not found for message {message.id}")
-                message.status = MessageStatus.FAILED
-                message.error_message = "Recipient agent not found"
-                db.commit()
+                updates.append({
+                    "id": message.id,
+                    "status": MessageStatus.FAILED,
+                    "error_message": "Recipient agent not found",
+                    "next_attempt_at": None
+                })
                 continue
-            
-            # Check if recipient is online
+
+            # Park messages for offline recipients until they come online
             if recipient.status != AgentStatus.ONLINE:
-                logger.info(f"Recipient {recipient.id} is {recipient.status}, keeping message {message.id} queued")
+                logger.info(f"Recipient {recipient.id} is {recipient.status}, parking message {message.id}")
+                parked.append(message.id)
                 continue
-            
-            # Attempt delivery
+
+            # The recipient's push channel (or its next one) picks these up
+            if recipient.push_connection or not recipient.webhook_url:
+                logger.info(f"Recipient {recipient.id} has no webhook delivery, leaving message {message.id} to its push channel")
+                parked.append(message.id)
+                continue
+
             logger.info(f"Attempting delivery of message {message.id} (attempt {message.retry_count + 1})")
-            success, error_msg = call_webhook(message, recipient, db)
-            
-            if success:
-                logger.info(f"Successfully delivered message {message.id}")
-            else:
-                message.retry_count += 1
-                message.last_retry_at = datetime.now(timezone.utc)
-                
-                if message.retry_count >= self.max_retries:
-                    message.status = MessageStatus.FAILED
-                    message.error_message = f"Max retries exceeded. Last error: {error_msg}"
-                    logger.error(f"Message {message.id} failed after {self.max_retries} attempts")
-                else:
-                    message.error_message = error_msg
-                    next_retry = self.retry_delays[message.retry_count - 1]
-                    logger.warning(f"Message {message.id} delivery failed: {error_msg}. Will retry in {next_retry}s")
-                
+            ready[recipient.id].append(message)
+            by_id[message.id] = message
+
+        jobs = []
+        for agent_id, agent_messages in ready.items():
+            jobs.extend(self.build_jobs(agent_messages, recipients[agent_id], updates))
+
+        # Committing outcomes would otherwise expire the page, reloading each message on next access
+        for message in messages:
+            db.expunge(message)
+        leased = {message.id: message for message in messages}
+
+        delivered = []
+        retrying = set()
+        in_flight = {message_id for job in jobs for message_id in job.message_ids}
+        flushed_at = renewed_at = time.monotonic()
+        with closing(self.dispatcher.stream(jobs, since=loaded_at, tick=FLUSH_INTERVAL)) as results:
+            for finished in results:
+                for result in finished:
+                    in_flight.discard(result.message_id)
+                    if result.success:
+                        logger.info(f"Successfully delivered message {result.message_id}")
+                        delivered.append(result.message_id)
+                    elif result.offline:
+                        parked.append(result.message_id)
+                    else:
+                        updates.append(self.failure_values(by_id[result.message_id], result))
+
+                if time.monotonic() - flushed_at >= FLUSH_INTERVAL:
+                    retrying |= self.write_outcomes(db, leased, delivered, updates, parked)
+                    delivered, updates, parked = [], [], []
+                    flushed_at = time.monotonic()
+
+                # Keep slow pages from outliving their leases and being delivered again elsewhere
+                if in_flight and time.monotonic() - renewed_at >= self.lease_seconds / 3:
+                    renewed = renew_leases(db, self.worker_id, in_flight, self.lease_seconds)
+                    db.commit()
+                    if renewed < len(in_flight):
+                        logger.warning(f"Lost the lease on {len(in_flight) - renewed} messages still in flight; another worker may deliver them again")
+                    renewed_at = time.monotonic()
+
+        retrying |= self.write_outcomes(db, leased, delivered, updates, parked)
+
+        # Keep signed bodies only for jobs that will be sent again
+        for job in jobs:
+            if retrying.isdisjoint(job.message_ids):
+                forget_job(job)
+
+    def build_jobs(self, messages: List[Message], recipient: AgentEntry, updates: List[dict]) -> List[WebhookJob]:
+        """
+        Signed requests for one recipient's messages, batched if it opted in. A message
+        whose stored content this process can't decode fails for good (its values are
+        added to updates) instead of failing the whole page on every lease.
+        """
+        batch_size = recipient.delivery_batch_size or 1
+
+        def build(chunk: List[Message]) -> WebhookJob:
+            return build_batch_webhook_job(chunk, recipient) if batch_size > 1 else build_webhook_job(chunk[0], recipient)
+
+        jobs = []
+        for start in range(0, len(messages), batch_size):
+            chunk = messages[start:start + batch_size]
+            try:
+                jobs.append(build(chunk))
+            except UndecodableContent:
+                chunk = [message for message in chunk if not self.fail_undecodable(message, updates)]
+                if chunk:
+                    jobs.append(build(chunk))
+        return jobs
+
+    def fail_undecodable(self, message: Message, updates: List[dict]) -> bool:
+        """Record a permanent failure for the message if its content can't be decoded"""
+        try:
+            decode_content(message.message_content, message.content_encoding)
+            return False
+        except UndecodableContent as e:
+            logger.error(f"Failing message {message.id}: {e}")
+            updates.append({
+                "id": message.id,
+                "status": MessageStatus.FAILED,
+                "error_message": str(e),
+                "next_attempt_at": None
+            })
+            return True
+
+    def write_outcomes(self, db: Session, leased: Dict[str, Message], delivered: List[str], updates: List[dict], parked: List[str]) -> set:
+        """
+        Write back one round of outcomes for leased messages in a single commit, along
+        with receipts for messages delivered or failed for good. Returns the ids that will be retried.
+        """
+        if not (delivered or updates or parked):
+            return set()
+
+        DELIVERY_ATTEMPTS.labels("delivered").inc(len(delivered))
+        now = datetime.now(timezone.utc)
+        marked = mark_delivered(db, self.worker_id, delivered, now)
+        written = set(write_back(db, self.worker_id, updates))
+        lost = len(delivered) - marked + len(updates) - len(written)
+        if lost:
+            logger.warning(f"Lost the lease on {lost} messages before their outcome was written; another worker may deliver them again")
+
+        # Only outcomes that were written: a message whose lease was lost may still be delivered by another worker
+        delivery_receipts.queue(db, [
+            Outcome(
+                values["id"],
+                leased[values["id"]].from_agent_id,
+                leased[values["id"]].to_agent_id,
+                MessageStatus.FAILED,
+                now,
+                values["error_message"]
+            )
+            for values in updates
+            if values["id"] in written and values.get("status") == MessageStatus.FAILED
+        ])
+        park_messages(db, parked)
+        release_leases(db, self.worker_id, parked)
+        db.commit()
+        return {values["id"] for values in updates if values.get("next_attempt_at")}
+
+    def failure_values(self, message: Message, result: WebhookResult) -> dict:
+        """Column values recording a failed delivery attempt for the message"""
+        now = datetime.now(timezone.utc)
+
+        # Not attempted (recipient circuit open): reschedule without using up a retry
+        if result.retry_after is not None:
+            values = {
+                "id": message.id,
+                "error_message": result.error,
+                "next_attempt_at": now + timedelta(seconds=result.retry_after)
+            }
+            self.due_times.push(values["next_attempt_at"])
+            DELIVERY_ATTEMPTS.labels("deferred").inc()
+            logger.info(f"Deferring message {message.id} for {result.retry_after:.0f}s: {result.error}")
+            return values
+
+        values = {
+            "id": message.id,
+            "retry_count": message.retry_count + 1,
+            "last_retry_at": now
+        }
+
+        if result.permanent:
+            values["status"] = MessageStatus.FAILED
+            values["error_message"] = result.error
+            values["next_attempt_at"] = None
+            DELIVERY_ATTEMPTS.labels("failed").inc()
+            logger.error(f"Message {message.id} rejected by recipient: {result.error}")
+        elif values["retry_count"] >= self.max_retries:
+            values["status"] = MessageStatus.FAILED
+            values["error_message"] = f"Max retries exceeded. Last error: {result.error}"
+            values["next_attempt_at"] = None
+            DELIVERY_ATTEMPTS.labels("failed").inc()
+            logger.error(f"Message {message.id} failed after {self.max_retries} attempts")
+        else:
+            values["error_message"] = result.error
+            values["next_attempt_at"] = self.next_attempt_time(values["retry_count"], now)
+            self.due_times.push(values["next_attempt_at"])
+            DELIVERY_ATTEMPTS.labels("retry").inc()
+            next_retry = self.retry_delays[values["retry_count"] - 1]
+            logger.warning(f"Message {message.id} delivery failed: {result.error}. Will retry in {next_retry}s")
+
+        return values
+
+    def shard_filters(self) -> tuple:
+        """Conditions restricting message queries to the shards this worker owns, if sharded"""
+        return (Message.shard.in_(self.membership.shards),) if self.membership else ()
+
+    def owns(self, agent_id: str) -> bool:
+        return self.membership is None or shard_of(agent_id) in self.membership.shards
+
+    def heartbeat(self, db: Session):
+        """Keep this worker's membership alive; sweep straight away when its shards change"""
+        if self.membership.heartbeat(db):
+            self.last_sweep = 0.0
+
+    def send_heartbeats(self):
+        """
+        Heartbeat every heartbeat_interval on a thread of its own, so a long delivery
+        pass doesn't make the other workers think this one is gone. Runs until the worker stops.
+        """
+        while not self.stopping.is_set():
+            try:
+                db = SessionLocal()
+                try:
+                    self.heartbeat(db)
+                finally:
+                    db.close()
+
+            except Exception as e:
+                logger.error(f"Error sending heartbeat: {e}", exc_info=True)
+
+            self.stopping.wait(self.heartbeat_interval)
+
+    def claim_due_messages(self, db: Session, now: datetime, *filters) -> List[Message]:
+        """Lease one page of due messages using the (status, next_attempt_at) index"""
+        return claim_due_messages(
+            db,
+            owner=self.worker_id,
+            limit=self.batch_size,
+            lease_seconds=self.lease_seconds,
+            now=now,
+            filters=(*filters, *self.shard_filters())
+        )
+
+    def process_queued_messages(self, db: Session):
+        """Deliver due messages page by page until none are left"""
+        with span("process_queued_messages", **{"worker.id": self.worker_id}):
+            if time.monotonic() - self.last_unpark >= self.unpark_interval:
+                expired = expire_push_connections(db)
+                unpark_online_messages(db)
                 db.commit()
-    
+                if expired:
+                    logger.warning(f"Took {len(expired)} agents offline whose push channel stopped refreshing")
+                    for agent_id in expired:
+                        agent_directory.invalidate(agent_id)
+                self.last_unpark = time.monotonic()
+
+            while True:
+                now = datetime.now(timezone.utc)
+                self.due_times.pop_due(now)
+                messages = self.claim_due_messages(db, now)
+                if messages:
+                    self.deliver_messages(messages, db)
+                # Between pages is where a draining worker stops
+                if len(messages) < self.batch_size or self.stopping.is_set():
+                    break
+
+            # Pick up due times set by the API or other workers
+            next_due = db.query(func.min(Message.next_attempt_at)).filter(
+                Message.status == MessageStatus.QUEUED,
+                *self.shard_filters()
+            ).scalar()
+            self.due_times.push(next_due)
+
+    def process_stream_entries(self, entries: List[tuple], db: Session):
+        """Handle delivery stream entries, then acknowledge them"""
+        # Entries already leased, delivered or not yet due are simply acknowledged;
+        # the reconciliation sweep owns them from here
+        message_ids = [fields["message_id"] for _, fields in entries if "message_id" in fields]
+        if message_ids:
+            messages = self.claim_due_messages(
+                db,
+                datetime.now(timezone.utc),
+                Message.id.in_(message_ids)
+            )
+            if messages:
+                self.deliver_messages(messages, db)
+
+        if not self.membership:
+            self.stream.ack([entry_id for entry_id, _ in entries])
+
+    def sweep(self, db: Session):
+        """Reconciliation pass: due retries, anything the stream missed, stale stream entries and consumers"""
+        self.process_queued_messages(db)
+
+        if self.stream and not self.membership:
+            stale = self.stream.claim_stale(self.worker_id, self.lease_seconds * 1000, self.batch_size)
+            if stale:
+                self.process_stream_entries(stale, db)
+            for consumer in self.stream.prune_consumers(self.lease_seconds * 1000):
+                logger.info(f"Removed idle delivery stream consumer {consumer}")
+
+        self.last_sweep = time.monotonic()
+
+    def seconds_until_sweep(self) -> float:
+        """Seconds until the next sweep: the earliest due time, capped by the sweep or poll interval"""
+        interval = self.sweep_interval if self.stream else self.poll_interval
+        remaining = max(0.0, interval - (time.monotonic() - self.last_sweep))
+        return self.due_times.seconds_until_next(remaining)
+
+    def breaker_counts(self) -> dict:
+        counts = Counter(recipient["state"] for recipient in self.health.snapshot().values())
+        return {state.value: counts[state.value] for state in BreakerState}
+
+    def recipient_metrics(self) -> dict:
+        """Per-recipient health, with a count of recipients in each breaker state"""
+        recipients = self.health.snapshot()
+        return {
+            "worker_id": self.worker_id,
+            "breakers": Counter(recipient["state"] for recipient in recipients.values()),
+            "recipients": recipients
+        }
+
     def run(self):
         """Main worker loop"""
-        logger.info(f"Message delivery worker started (polling every {self.poll_interval}s)")
-        
-        while True:
+        mode = "delivery stream" if self.stream else f"polling every {self.poll_interval}s"
+        logger.info(f"Message delivery worker {self.worker_id} started ({mode})")
+
+        if self.metrics_port:
+            REGISTRY.register(CacheCollector({"webhook_bodies": signed_jobs, "agents": agent_directory.cache.local}))
+            REGISTRY.register(GaugeCollector(
+                "agentconnect_recipient_breakers",
+                "Recipients tracked by this worker, by circuit breaker state",
+                "state",
+                self.breaker_counts
+            ))
+            start_metrics_server(
+                os.getenv("WORKER_METRICS_HOST", "127.0.0.1"),
+                self.metrics_port,
+                {"/metrics": render_metrics, "/metrics/recipients": self.recipient_metrics}
+            )
+
+        # Finish the batch in hand, then stop; the supervisor sends SIGTERM to drain
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, lambda signum, frame: self.stop())
+
+        status_thread = threading.Thread(target=self.consume_status_events, name="status-events", daemon=True)
+        status_thread.start()
+
+        heartbeat_thread = None
+        if self.membership:
+            heartbeat_thread = threading.Thread(target=self.send_heartbeats, name="heartbeats", daemon=True)
+            heartbeat_thread.start()
+
+        while not self.stopping.is_set():
             try:
                 db = SessionLocal()
-                
-                # Process queued messages
-                self.process_queued_messages(db)
-                
-                # Listen for status change notifications
-                if self.redis_client:
-                    message = self.pubsub.get_message(timeout=self.poll_interval)
-                    if message and message['type'] == 'message':
-                        try:
-                            data = json.loads(message['data'])
-                            if data.get('status') == 'online':
-                                agent_id = data.get('agent_id')
-                                logger.info(f"Received status change notification for {agent_id}")
-                                self.process_status_change_to_online(agent_id, db)
-                        except:
-                            pass
+
+                if self.seconds_until_sweep() == 0:
+                    self.sweep(db)
+
+                # Sleep until the next due time, waking early for stream entries
+                wait = min(self.seconds_until_sweep(), STOP_CHECK_INTERVAL)
+                if self.stream and self.membership:
+                    entries = self.stream.read_all(self.stream_position, self.batch_size, int(wait * 1000))
+                    if entries:
+                        self.stream_position = entries[-1][0]
+                        self.process_stream_entries(entries, db)
+                elif self.stream:
+                    entries = self.stream.read(self.worker_id, self.batch_size, int(wait * 1000))
+                    if entries:
+                        self.process_stream_entries(entries, db)
                 else:
-                    time.sleep(self.poll_interval)
-                
+                    self.due_times.wait(wait)
+
                 db.close()
-                
+
             except Exception as e:
                 logger.error(f"Error in worker loop: {e}", exc_info=True)
-                time.sleep(self.poll_interval)
+                self.stopping.wait(self.poll_interval)
+
+        status_thread.join()
+        if self.stream and not self.membership:
+            try:
+                if not self.stream.remove_consumer(self.worker_id):
+                    logger.warning(f"Left delivery stream consumer {self.worker_id} in place: it has unacknowledged entries")
+            except Exception as e:
+                logger.warning(f"Could not remove delivery stream consumer {self.worker_id}: {e}")
+        if heartbeat_thread:
+            heartbeat_thread.join()
+            db = SessionLocal()
+            try:
+                self.membership.leave(db)
+            finally:
+                db.close()
+        logger.info(f"Message delivery worker {self.worker_id} stopped")
+
+    def stop(self):
+        """Ask run() to return once the current batch is written back"""
+        logger.info(f"Message delivery worker {self.worker_id} draining")
+        self.stopping.set()
+        self.due_times.wake()
+
+    def consume_status_events(self):
+        """
+        Act on agent status changes as they are published, on a thread of its own so
+        a long delivery pass doesn't hold them up. Runs until the worker stops.
+        """
+        position = status_events.position()
+        while not self.stopping.is_set():
+            try:
+                events = status_events.read(position, self.batch_size, STOP_CHECK_INTERVAL * 1000)
+                if not events:
+                    continue
+                position = events[-1][0]
+
+                db = SessionLocal()
+                try:
+                    self.process_status_events([fields for _, fields in events], db)
+                finally:
+                    db.close()
+
+            except Exception as e:
+                logger.error(f"Error processing status events: {e}", exc_info=True)
+                self.stopping.wait(self.poll_interval)
+
+    def process_status_events(self, events: List[dict], db: Session):
+        """Stop sending to agents that went offline; deliver the backlog of those that came online"""
+        # Only the latest status of each agent matters
+        latest = {event["agent_id"]: AgentStatus(event["status"]) for event in events}
+        for agent_id, status in latest.items():
+            # The API's invalidation may still be on its way; don't act on the old status
+            agent_directory.forget(agent_id)
+            if status == AgentStatus.OFFLINE:
+                self.dispatcher.stop(agent_id)
+            elif self.owns(agent_id):
+                self.process_status_change_to_online(agent_id, db)
 
     def process_status_change_to_online(self, agent_id: str, db: Session):
-        """Process queued messages when an agent comes online"""
-        messages = db.query(Message).filter(
-            Message.to_agent_id == agent_id,
-            Message.status == MessageStatus.QUEUED
-        ).all()
-        
-        if not messages:
-            return
-        
-        logger.info(f"Agent {agent_id} came online, processing {len(messages)} queued messages")
-        
-        recipient = db.query(Agent).filter(Agent.id == agent_id).first()
-        if not recipient:
-            return
-        
-        for message in messages:
-            # Force immediate delivery attempt by resetting retry time
-            message.last_retry_at = None
-            db.commit()
-            
-            logger.info(f"Triggering immediate delivery of message {message.id}")
-            success, error_msg = call_webhook(message, recipient, db)
-            
-            if not success:
-                message.retry_count += 1
-                message.last_retry_at = datetime.now(timezone.utc)
-                message.error_message = error_msg
-                db.commit()
+        """Deliver the messages released when an agent came online (the API makes them due)"""
+        total = 0
+        while True:
+            messages = self.claim_due_messages(
+                db,
+                datetime.now(timezone.utc),
+                Message.to_agent_id == agent_id
+            )
+
+            if not messages:
+                break
+
+            total += len(messages)
+            self.deliver_messages(messages, db)
+            if len(messages) < self.batch_size or self.stopping.is_set():
+                break
+
+        if total:
+            logger.info(f"Agent {agent_id} came online, processed {total} queued messages")
 
 
 if __name__ == "__main__":
-    worker = MessageDeliveryWorker(poll_interval=5)
-    worker.run()
\ No newline at end of file
+    # For several processes sharing the load, run app.workers.supervisor instead
+    worker = MessageDeliveryWorker(
+        poll_interval=float(os.getenv("WORKER_POLL_INTERVAL", "5")),
+        metrics_port=int(os.getenv("WORKER_METRICS_PORT", "9100")) or None
+    )
+    worker.run()
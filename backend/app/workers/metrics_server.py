@@ -0,0 +1,46 @@
+import json
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+
+def start_metrics_server(
+    host: str,
+    port: int,
+    routes: Dict[str, Callable[[], Union[dict, Tuple[bytes, str]]]]
+) -> ThreadingHTTPServer:
+    """
+    Serve each route on a daemon thread. A route returns a dict, sent as JSON,
+    or a (body, content type) pair such as Prometheus's text format.
+    Workers have no web framework; this keeps their internal state inspectable.
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            route = routes.get(self.path.split("?", 1)[0])
+            if route is None:
+                self.send_error(404)
+                return
+
+            result = route()
+            if isinstance(result, dict):
+                body, content_type = json.dumps(result).encode(), "application/json"
+            else:
+                body, content_type = result
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    logger.info(f"Serving worker metrics on http://{host}:{port}")
+    return server
@@ -0,0 +1,218 @@
+import asyncio
+import json
+import logging
+import secrets
+import socket
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List
+
+from fastapi import WebSocket, WebSocketDisconnect
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.core.database import AsyncSessionLocal
+from app.core.notifier import inbox_notifier
+from app.core.payloads import UndecodableContent
+from app.models.database import Agent, AgentStatus, Message, MessageStatus
+from app.workers.leasing import claim_agent_messages, mark_delivered, write_back
+from app.workers.webhook_caller import build_payload
+
+logger = logging.getLogger(__name__)
+
+MAX_ACK_IDS = 1000
+
+
+def generate_connection_id() -> str:
+    """Lease owner id for one push connection"""
+    return f"push:{socket.gethostname()}:{secrets.token_hex(8)}"
+
+
+def claim_payloads(db: Session, owner: str, agent_id: str, limit: int, lease_seconds: int) -> List[dict]:
+    """
+    Lease the agent's oldest queued messages to `owner` and return their payloads.
+    Messages whose content can't be decoded are failed rather than returned.
+    Shared by the push channel and the inbox long-poll; run via AsyncSession.run_sync.
+    """
+    payloads = []
+    undecodable = []
+    for message in claim_agent_messages(db, owner, agent_id, limit, lease_seconds):
+        try:
+            payloads.append(build_payload(message))
+        except UndecodableContent as e:
+            logger.error(f"Failing message {message.id}: {e}")
+            undecodable.append({
+                "id": message.id,
+                "status": MessageStatus.FAILED,
+                "error_message": str(e),
+                "next_attempt_at": None
+            })
+
+    if undecodable:
+        write_back(db, owner, undecodable)
+        db.commit()
+    return payloads
+
+
+async def open_presence(db: AsyncSession, agent_id: str, connection_id: str, ttl: int) -> bool:
+    """
+    Mark the agent ONLINE and owned by this connection, replacing any older one.
+    Returns True if the agent's status changed.
+    """
+    old_status = (await db.execute(select(Agent.status).where(Agent.id == agent_id))).scalar_one()
+    now = datetime.now(timezone.utc)
+    await db.execute(
+        update(Agent)
+        .where(Agent.id == agent_id)
+        .values(
+            status=AgentStatus.ONLINE,
+            push_connection=connection_id,
+            push_expires_at=now + timedelta(seconds=ttl),
+            updated_at=now
+        )
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    return old_status != AgentStatus.ONLINE
+
+
+async def refresh_presence(db: AsyncSession, agent_id: str, connection_id: str, ttl: int) -> bool:
+    """Extend the connection's presence; False once another connection (or the expiry sweep) took over"""
+    result = await db.execute(
+        update(Agent)
+        .where(Agent.id == agent_id, Agent.push_connection == connection_id)
+        .values(push_expires_at=datetime.now(timezone.utc) + timedelta(seconds=ttl))
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    return result.rowcount == 1
+
+
+async def close_presence(db: AsyncSession, agent_id: str, connection_id: str) -> bool:
+    """
+    Take the agent OFFLINE if this connection still owns it, and release
+    the leases on messages it never acknowledged. Returns True if the status changed.
+    """
+    now = datetime.now(timezone.utc)
+    result = await db.execute(
+        update(Agent)
+        .where(Agent.id == agent_id, Agent.push_connection == connection_id)
+        .values(status=AgentStatus.OFFLINE, push_connection=None, push_expires_at=None, updated_at=now)
+        .execution_options(synchronize_session=False)
+    )
+    await db.execute(
+        update(Message)
+        .where(Message.lease_owner == connection_id)
+        .values(lease_owner=None, lease_expires_at=None)
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    return result.rowcount == 1
+
+
+class PushSession:
+    """
+    Streams an agent's queued messages over an accepted WebSocket.
+
+    Server frames: {"type": "message", ...webhook payload}, {"type": "pong"},
+    {"type": "error", "detail": ...}. Client frames: {"type": "ack", "message_ids": [...]}
+    and {"type": "ping"}.
+
+    Messages are leased to the connection while in flight and marked DELIVERED
+    when acked. An unacked message is sent again once its lease (ack_timeout)
+    expires, so delivery is at-least-once. At most max_in_flight messages are
+    outstanding at any time.
+    """
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        agent_id: str,
+        connection_id: str,
+        max_in_flight: int = 100,
+        ack_timeout: int = 60,
+        heartbeat_interval: int = 30
+    ):
+        self.websocket = websocket
+        self.agent_id = agent_id
+        self.connection_id = connection_id
+        self.max_in_flight = max_in_flight
+        self.ack_timeout = ack_timeout
+        self.heartbeat_interval = heartbeat_interval
+        self.presence_ttl = heartbeat_interval * 3
+        self.in_flight: Dict[str, float] = {}  # message_id -> monotonic time its lease runs out
+
+    async def run(self):
+        """Serve the connection until the client disconnects or another connection takes over"""
+        wakeup = inbox_notifier.subscribe(self.agent_id)
+        tasks = [asyncio.create_task(self._pump(wakeup)), asyncio.create_task(self._read(wakeup))]
+        try:
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                error = task.exception()
+                if error and not isinstance(error, WebSocketDisconnect):
+                    logger.error(f"Push channel {self.connection_id} for {self.agent_id} failed: {error}")
+        finally:
+            for task in tasks:
+                task.cancel()
+            inbox_notifier.unsubscribe(self.agent_id, wakeup)
+
+    async def _pump(self, wakeup: asyncio.Event):
+        """Send claimed messages whenever there is room, new mail, or an expired lease"""
+        last_heartbeat = time.monotonic()
+        while True:
+            wakeup.clear()
+            now = time.monotonic()
+            self.in_flight = {message_id: expires for message_id, expires in self.in_flight.items() if expires > now}
+
+            room = self.max_in_flight - len(self.in_flight)
+            if room > 0:
+                for payload in await self._claim(room):
+                    await self.websocket.send_json({"type": "message", **payload})
+                    self.in_flight[payload["message_id"]] = time.monotonic() + self.ack_timeout
+
+            if time.monotonic() - last_heartbeat >= self.heartbeat_interval:
+                async with AsyncSessionLocal() as db:
+                    if not await refresh_presence(db, self.agent_id, self.connection_id, self.presence_ttl):
+                        await self.websocket.close(code=4000, reason="Superseded by another connection")
+                        return
+                last_heartbeat = time.monotonic()
+
+            # Wake on new mail or acks; otherwise at the next heartbeat or lease expiry
+            deadline = min([last_heartbeat + self.heartbeat_interval, *self.in_flight.values()])
+            try:
+                await asyncio.wait_for(wakeup.wait(), timeout=max(0.0, deadline - time.monotonic()))
+            except asyncio.TimeoutError:
+                pass
+
+    async def _read(self, wakeup: asyncio.Event):
+        while True:
+            try:
+                frame = json.loads(await self.websocket.receive_text())
+            except ValueError:
+                await self.websocket.send_json({"type": "error", "detail": "Frames must be JSON"})
+                continue
+
+            kind = frame.get("type") if isinstance(frame, dict) else None
+            if kind == "ack":
+                message_ids = [str(message_id) for message_id in frame.get("message_ids") or []][:MAX_ACK_IDS]
+                await self._ack(message_ids)
+                wakeup.set()
+            elif kind == "ping":
+                await self.websocket.send_json({"type": "pong"})
+            else:
+                await self.websocket.send_json({"type": "error", "detail": f"Unknown frame type: {kind}"})
+
+    async def _claim(self, limit: int) -> List[dict]:
+        async with AsyncSessionLocal() as db:
+            return await db.run_sync(claim_payloads, self.connection_id, self.agent_id, limit, self.ack_timeout)
+
+    async def _ack(self, message_ids: List[str]):
+        if not message_ids:
+            return
+        async with AsyncSessionLocal() as db:
+            await db.run_sync(mark_delivered, self.connection_id, message_ids, datetime.now(timezone.utc))
+            await db.commit()
+        for message_id in message_ids:
+            self.in_flight.pop(message_id, None)
@@ -0,0 +1,160 @@
+import threading
+import time
+from collections import deque
+from enum import Enum
+from typing import Deque, Dict, Optional
+
+
+class BreakerState(str, Enum):
+    CLOSED = "closed"        # delivering normally
+    OPEN = "open"            # failing; nothing is sent until the cooldown ends
+    HALF_OPEN = "half_open"  # cooldown over; a single probe request decides
+
+
+class RecipientHealth:
+    """Circuit breaker, latency samples and AIMD concurrency limit for one recipient"""
+
+    def __init__(self):
+        self.state = BreakerState.CLOSED
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.cooldown = 0.0
+        self.probe_in_flight = False
+        self.latencies: Deque[float] = deque(maxlen=100)
+        self.concurrency = 1.0
+        self.successes = 0
+        self.failures = 0
+
+
+class HealthTracker:
+    """
+    Per-recipient delivery health shared by the dispatcher's threads.
+
+    - Circuit breaker: after failure_threshold consecutive failures (timeouts,
+      connection errors, 5xx, 429) the recipient is OPEN and nothing is sent to
+      it for the cooldown, which doubles on each failed probe up to max_cooldown.
+      Then one probe request is let through; success closes the breaker.
+    - Adaptive timeout: timeout_multiplier x the p99 of recent response times,
+      clamped to [min_timeout, max_timeout]. A timed-out request counts as a
+      sample at the timeout, so the timeout grows again for a recipient that slows down.
+    - AIMD concurrency: the per-recipient in-flight limit starts at one, grows
+      by one per limit's worth of successes up to max_concurrency and halves on
+      every failure.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 4,
+        failure_threshold: int = 5,
+        base_cooldown: float = 30,
+        max_cooldown: float = 600,
+        min_timeout: float = 2,
+        max_timeout: float = 30,
+        timeout_multiplier: float = 3,
+        min_samples: int = 20
+    ):
+        self.max_concurrency = max_concurrency
+        self.failure_threshold = failure_threshold
+        self.base_cooldown = base_cooldown
+        self.max_cooldown = max_cooldown
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.timeout_multiplier = timeout_multiplier
+        self.min_samples = min_samples
+        self._recipients: Dict[str, RecipientHealth] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, agent_id: str) -> RecipientHealth:
+        health = self._recipients.get(agent_id)
+        if health is None:
+            health = self._recipients[agent_id] = RecipientHealth()
+        return health
+
+    def _state(self, health: RecipientHealth, now: float) -> BreakerState:
+        if health.state == BreakerState.OPEN and now >= health.open_until:
+            health.state = BreakerState.HALF_OPEN
+        return health.state
+
+    def acquire(self, agent_id: str, in_flight: int) -> Optional[bool]:
+        """
+        Whether another request may start for the recipient with `in_flight` already running.
+        True: send it. False: not now, wait for a running request to finish.
+        None: the breaker is open (or probing), defer the message until retry_at().
+        """
+        with self._lock:
+            health = self._get(agent_id)
+            state = self._state(health, time.monotonic())
+            if state == BreakerState.OPEN:
+                return None
+            if state == BreakerState.HALF_OPEN:
+                if health.probe_in_flight or in_flight:
+                    return None
+                health.probe_in_flight = True
+                return True
+            return in_flight < int(health.concurrency)
+
+    def retry_at(self, agent_id: str) -> float:
+        """Seconds from now until deferred messages for the recipient should be tried again"""
+        with self._lock:
+            health = self._get(agent_id)
+            if health.state == BreakerState.OPEN:
+                return max(1.0, health.open_until - time.monotonic())
+            # Probing: come back once the probe has had time to finish
+            return self._timeout(health)
+
+    def timeout(self, agent_id: str) -> float:
+        with self._lock:
+            return self._timeout(self._get(agent_id))
+
+    def _timeout(self, health: RecipientHealth) -> float:
+        if len(health.latencies) < self.min_samples:
+            return self.max_timeout
+        samples = sorted(health.latencies)
+        p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+        return min(self.max_timeout, max(self.min_timeout, p99 * self.timeout_multiplier))
+
+    def record(self, agent_id: str, ok: bool, elapsed: Optional[float]):
+        """
+        Record the outcome of one request. `ok` means the recipient answered and
+        wasn't overloaded; `elapsed` is None when no response time was observed
+        (e.g. the connection was refused).
+        """
+        with self._lock:
+            health = self._get(agent_id)
+            if elapsed is not None:
+                health.latencies.append(elapsed)
+            probe = health.probe_in_flight
+            health.probe_in_flight = False
+
+            if ok:
+                health.successes += 1
+                health.consecutive_failures = 0
+                health.state = BreakerState.CLOSED
+                health.cooldown = 0.0
+                health.concurrency = min(self.max_concurrency, health.concurrency + 1 / max(1.0, health.concurrency))
+                return
+
+            health.failures += 1
+            health.consecutive_failures += 1
+            health.concurrency = max(1.0, health.concurrency / 2)
+            if probe or health.consecutive_failures >= self.failure_threshold:
+                health.cooldown = min(self.max_cooldown, health.cooldown * 2 or self.base_cooldown)
+                health.open_until = time.monotonic() + health.cooldown
+                health.state = BreakerState.OPEN
+
+    def snapshot(self) -> Dict[str, dict]:
+        """Current state of every tracked recipient, for the metrics endpoint"""
+        now = time.monotonic()
+        with self._lock:
+            return {
+                agent_id: {
+                    "state": self._state(health, now).value,
+                    "consecutive_failures": health.consecutive_failures,
+                    "open_for_seconds": round(max(0.0, health.open_until - now), 1) if health.state == BreakerState.OPEN else 0.0,
+                    "timeout_seconds": round(self._timeout(health), 3),
+                    "concurrency_limit": int(health.concurrency),
+                    "successes": health.successes,
+                    "failures": health.failures
+                }
+                for agent_id, health in self._recipients.items()
+            }
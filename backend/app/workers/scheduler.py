@@ -0,0 +1,76 @@
+import heapq
+import threading
+import time
+from datetime import datetime, timezone
+from typing import List, Optional
+
+from app.core.queue import as_utc
+
+
+class DueTimeHeap:
+    """
+    Min-heap of upcoming message due times.
+    Lets the worker sleep exactly until the next retry instead of polling blindly.
+    Thread-safe: the worker's status event thread schedules retries too, and a
+    due time earlier than every other one wakes a thread sleeping in wait().
+    """
+
+    def __init__(self):
+        self._heap: List[datetime] = []
+        self._lock = threading.Lock()
+        self._earlier = threading.Condition(self._lock)
+        self._wakeups = 0
+
+    def push(self, when: Optional[datetime]):
+        if when is None:
+            return
+        when = as_utc(when)
+        with self._lock:
+            # The worker re-pushes the DB's earliest due time every pass; skip repeats
+            if self._heap and self._heap[0] == when:
+                return
+            heapq.heappush(self._heap, when)
+            if self._heap[0] == when:
+                self._earlier.notify_all()
+
+    def pop_due(self, now: Optional[datetime] = None):
+        """Drop every entry that is already due"""
+        now = now or datetime.now(timezone.utc)
+        with self._lock:
+            while self._heap and self._heap[0] <= now:
+                heapq.heappop(self._heap)
+
+    def next_due(self) -> Optional[datetime]:
+        with self._lock:
+            return self._heap[0] if self._heap else None
+
+    def seconds_until_next(self, max_wait: float, now: Optional[datetime] = None) -> float:
+        """Seconds to sleep before the next due time, capped at max_wait"""
+        next_due = self.next_due()
+        if next_due is None:
+            return max_wait
+
+        now = now or datetime.now(timezone.utc)
+        return max(0.0, min(max_wait, (next_due - now).total_seconds()))
+
+    def wait(self, max_wait: float):
+        """Sleep until the next due time, at most max_wait seconds; pushing an earlier due time cuts the sleep short"""
+        deadline = time.monotonic() + max_wait
+        with self._earlier:
+            wakeups = self._wakeups
+            while self._wakeups == wakeups:
+                timeout = deadline - time.monotonic()
+                if self._heap:
+                    timeout = min(timeout, (self._heap[0] - datetime.now(timezone.utc)).total_seconds())
+                if timeout <= 0:
+                    return
+                self._earlier.wait(timeout)
+
+    def wake(self):
+        """Cut short every wait() in progress"""
+        with self._earlier:
+            self._wakeups += 1
+            self._earlier.notify_all()
+
+    def __len__(self):
+        return len(self._heap)
@@ -0,0 +1,133 @@
+"""
+Runs several sharded delivery workers, one process each, and keeps them running.
+
+Messages are split into shards by recipient (app.core.sharding) and every live
+sharded worker owns a slice of them on a consistent-hash ring, so a recipient's
+messages, retries, circuit breaker and concurrency limit all live in one process.
+That is not an ordering guarantee: a worker still runs up to per_agent_concurrency
+calls to a recipient at once, the fair queue interleaves its senders, and retries
+go out after later messages. Only one sender's messages at one priority, with a
+single call in flight, arrive in the order they were sent.
+Workers find each other through heartbeats in the delivery_workers table: start
+a supervisor on each machine sharing the database and the shards spread over all
+of them, moving only as far as needed when a worker joins or leaves.
+
+    python -m app.workers.supervisor --processes 4
+
+SIGTERM or Ctrl-C drains: each worker finishes and writes back the batch it is
+delivering, hands its shards to the others and exits.
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from typing import List, Optional
+
+from app.workers.message_delivery import MessageDeliveryWorker
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Seconds to wait before restarting a worker that exited on its own
+RESTART_DELAY = 5
+
+
+def run_worker(poll_interval: float, metrics_port: Optional[int]):
+    # Ctrl-C reaches the whole process group; let the supervisor decide how workers stop
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    MessageDeliveryWorker(poll_interval=poll_interval, metrics_port=metrics_port, sharded=True).run()
+
+
+class Supervisor:
+    def __init__(self, processes: int, poll_interval: float = 5, metrics_port: Optional[int] = None, drain_timeout: float = 60):
+        """
+        processes: worker processes to keep running
+        metrics_port: worker i serves its metrics on metrics_port + i
+        drain_timeout: seconds workers get to finish after SIGTERM before they are killed
+        """
+        self.processes = processes
+        self.poll_interval = poll_interval
+        self.metrics_port = metrics_port
+        self.drain_timeout = drain_timeout
+        self.context = multiprocessing.get_context("spawn")
+        self.workers: List[Optional[multiprocessing.Process]] = [None] * processes
+        self.exited_at = [0.0] * processes
+        self.stopping = threading.Event()
+
+    def start_worker(self, index: int):
+        metrics_port = self.metrics_port + index if self.metrics_port else None
+        process = self.context.Process(
+            target=run_worker,
+            args=(self.poll_interval, metrics_port),
+            name=f"delivery-worker-{index}"
+        )
+        process.start()
+        self.workers[index] = process
+        logger.info(f"Started delivery worker {index} (pid {process.pid})")
+
+    def stop(self):
+        self.stopping.set()
+
+    def run(self):
+        signal.signal(signal.SIGTERM, lambda signum, frame: self.stop())
+        signal.signal(signal.SIGINT, lambda signum, frame: self.stop())
+
+        for index in range(self.processes):
+            self.start_worker(index)
+
+        while not self.stopping.wait(1):
+            now = time.monotonic()
+            for index, process in enumerate(self.workers):
+                if process.is_alive():
+                    continue
+                if not self.exited_at[index]:
+                    # Its shards move to the other workers once its heartbeat expires
+                    logger.error(f"Delivery worker {index} (pid {process.pid}) exited with code {process.exitcode}")
+                    self.exited_at[index] = now
+                elif now - self.exited_at[index] >= RESTART_DELAY:
+                    self.exited_at[index] = 0.0
+                    self.start_worker(index)
+
+        self.drain()
+
+    def drain(self):
+        """Ask every worker to finish its batch and exit, killing any that outlast drain_timeout"""
+        running = [process for process in self.workers if process.is_alive()]
+        logger.info(f"Draining {len(running)} delivery workers")
+        for process in running:
+            process.terminate()
+
+        deadline = time.monotonic() + self.drain_timeout
+        for process in running:
+            process.join(max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                logger.warning(f"Delivery worker {process.name} (pid {process.pid}) did not drain in time, killing it")
+                process.kill()
+                process.join()
+        logger.info("All delivery workers stopped")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=int(os.getenv("WORKER_PROCESSES", "0")) or os.cpu_count(),
+        help="worker processes on this machine (default: one per CPU)"
+    )
+    parser.add_argument("--drain-timeout", type=float, default=60, help="seconds workers get to finish after SIGTERM")
+    args = parser.parse_args()
+
+    Supervisor(
+        processes=args.processes,
+        poll_interval=float(os.getenv("WORKER_POLL_INTERVAL", "5")),
+        metrics_port=int(os.getenv("WORKER_METRICS_PORT", "9100")) or None,
+        drain_timeout=args.drain_timeout
+    ).run()
+
+
+if __name__ == "__main__":
+    main()
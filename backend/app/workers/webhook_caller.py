@@ -1,66 +1,378 @@
+import gzip
 import json
+import os
+import threading
+import time
+from collections import OrderedDict, defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+from urllib.parse import urlsplit
+
 import requests
-from datetime import datetime
-from typing import Optional, Tuple
-from sqlalchemy.orm import Session
+from requests.adapters import HTTPAdapter
 
-from app.models.database import Message, Agent, MessageStatus
+from app.models.database import Message, Agent, PRIORITIES_BY_LEVEL
+from app.core.cache import TTLCache
+from app.core.metrics import WEBHOOK_LATENCY
+from app.core.payloads import decode_content, COMPRESSION_THRESHOLD
 from app.core.security import generate_webhook_signature
+from app.core.tracing import span
+from app.workers.recipient_health import HealthTracker
 
+# Signed request bodies kept for messages awaiting a retry, keyed by message ids.
+# The worker forgets entries once their messages are settled.
+signed_jobs = TTLCache(maxsize=int(os.getenv("WEBHOOK_BODY_CACHE_SIZE", "1000")), ttl=7 * 3600)
+# Recipient hosts a dispatcher keeps a keep-alive session for; the least recently used is closed beyond that
+MAX_WEBHOOK_HOSTS = int(os.getenv("WEBHOOK_MAX_HOSTS", "1000"))
 
-def call_webhook(message: Message, recipient: Agent, db: Session) -> Tuple[bool, Optional[str]]:
-    """
-    Call recipient's webhook with message.
-    Returns (success: bool, error_message: Optional[str])
-    """
-    payload = {
+
+class WebhookJob(NamedTuple):
+    """A fully built webhook request, safe to hand to another thread"""
+    message_ids: Tuple[str, ...]
+    agent_id: str
+    url: str
+    body: bytes
+    headers: Dict[str, str]
+    batch: bool = False
+
+
+class WebhookResult(NamedTuple):
+    message_id: str
+    success: bool
+    permanent: bool  # True when retrying cannot help (4xx)
+    error: Optional[str]
+    retry_after: Optional[float] = None  # Set when no attempt was made: seconds until the recipient may be tried again
+    offline: bool = False  # Not attempted because the recipient went offline; park the message
+
+
+def build_payload(message: Message) -> dict:
+    return {
         "message_id": message.id,
         "from_agent_id": message.from_agent_id,
         "to_agent_id": message.to_agent_id,
-        "message_content": json.loads(message.message_content),
+        "message_content": json.loads(decode_content(message.message_content, message.content_encoding)),
+        "priority": PRIORITIES_BY_LEVEL[message.priority].value,
         "timestamp": message.created_at.isoformat()
     }
-    
-    payload_str = json.dumps(payload)
+
+
+def payload_json(message: Message) -> str:
+    """
+    JSON text of build_payload(message). The stored content is spliced in
+    as-is instead of being parsed and serialized again.
+    """
+    head = json.dumps({
+        "message_id": message.id,
+        "from_agent_id": message.from_agent_id,
+        "to_agent_id": message.to_agent_id
+    })
+    content = decode_content(message.message_content, message.content_encoding).decode()
+    tail = json.dumps({"priority": PRIORITIES_BY_LEVEL[message.priority].value, "timestamp": message.created_at.isoformat()})
+    return f'{head[:-1]}, "message_content": {content}, {tail[1:]}'
+
+
+def signed_headers(payload_str: str, recipient: Agent) -> Dict[str, str]:
     signature = generate_webhook_signature(payload_str, recipient.secret_token)
-    
-    headers = {
+    return {
         "Content-Type": "application/json",
         "X-Signature": f"sha256={signature}",
         "User-Agent": "AgentConnect/1.0"
     }
-    
+
+
+def _signed_job(messages: List[Message], recipient: Agent, batch: bool) -> WebhookJob:
+    """
+    Sign and encode a request body, reusing the one built for an earlier attempt
+    at the same messages. The signature always covers the uncompressed JSON.
+    """
+    message_ids = tuple(message.id for message in messages)
+    fingerprint = (recipient.webhook_url, recipient.secret_token, recipient.webhook_gzip)
+    cached = signed_jobs.get(message_ids)
+    if cached and cached[0] == fingerprint:
+        return cached[1]
+
+    if batch:
+        payload_str = f"[{', '.join(payload_json(message) for message in messages)}]"
+    else:
+        payload_str = payload_json(messages[0])
+
+    headers = signed_headers(payload_str, recipient)
+    if batch:
+        headers["X-Batch-Size"] = str(len(messages))
+
+    body = payload_str.encode()
+    if recipient.webhook_gzip and len(body) >= COMPRESSION_THRESHOLD:
+        body = gzip.compress(body, compresslevel=6)
+        headers["Content-Encoding"] = "gzip"
+
+    job = WebhookJob(
+        message_ids=message_ids,
+        agent_id=recipient.id,
+        url=recipient.webhook_url,
+        body=body,
+        headers=headers,
+        batch=batch
+    )
+    signed_jobs.set(message_ids, (fingerprint, job))
+    return job
+
+
+def forget_job(job: WebhookJob):
+    """Drop a cached body once none of its messages will be retried"""
+    signed_jobs.delete(job.message_ids)
+
+
+def build_webhook_job(message: Message, recipient: Agent) -> WebhookJob:
+    """
+    Build the signed webhook request for a message.
+    Must run on the thread that owns the session the ORM objects belong to.
+    """
+    return _signed_job([message], recipient, batch=False)
+
+
+def build_batch_webhook_job(messages: List[Message], recipient: Agent) -> WebhookJob:
+    """
+    Build one signed request carrying several messages as a JSON array.
+    The recipient may acknowledge items individually in its response body, e.g.
+    {"results": [{"message_id": "...", "status": "delivered" | "retry" | "rejected", "error": "..."}]}
+    Items left out of "results" are retried; a 2xx without "results" acknowledges everything.
+    """
+    return _signed_job(messages, recipient, batch=True)
+
+
+def parse_batch_results(job: WebhookJob, response: requests.Response) -> List[WebhookResult]:
+    """Per-item outcomes from a 2xx response to a batch request"""
     try:
-        response = requests.post(
-            recipient.webhook_url,
-            data=payload_str,
-            headers=headers,
-            timeout=30
-        )
-        
-        if 200 <= response.status_code < 300:
-            message.status = MessageStatus.DELIVERED
-            message.delivered_at = datetime.utcnow()
-            message.error_message = None
-            db.commit()
-            return True, None
-        
-        elif 400 <= response.status_code < 500:
-            error_msg = f"Webhook returned {response.status_code}: {response.text[:200]}"
-            message.status = MessageStatus.FAILED
-            message.error_message = error_msg
-            db.commit()
-            return False, error_msg
-        
+        items = response.json()["results"]
+    except (ValueError, KeyError, TypeError):
+        return [WebhookResult(message_id, True, False, None) for message_id in job.message_ids]
+
+    statuses = {}
+    for item in items if isinstance(items, list) else []:
+        if isinstance(item, dict) and item.get("message_id") in job.message_ids:
+            statuses[item["message_id"]] = item
+
+    results = []
+    for message_id in job.message_ids:
+        item = statuses.get(message_id)
+        if item is None:
+            results.append(WebhookResult(message_id, False, False, "Not acknowledged in batch response"))
+        elif item.get("status") == "delivered":
+            results.append(WebhookResult(message_id, True, False, None))
+        elif item.get("status") == "rejected":
+            results.append(WebhookResult(message_id, False, True, str(item.get("error") or "Rejected by recipient")[:200]))
         else:
-            error_msg = f"Webhook returned {response.status_code}: {response.text[:200]}"
-            return False, error_msg
-    
-    except requests.exceptions.Timeout:
-        return False, "Webhook request timed out"
-    
-    except requests.exceptions.ConnectionError:
-        return False, "Could not connect to webhook URL"
-    
-    except Exception as e:
-        return False, f"Unexpected error: {str(e)}"
\ No newline at end of file
+            results.append(WebhookResult(message_id, False, False, str(item.get("error") or "Recipient asked for retry")[:200]))
+    return results
+
+
+class WebhookDispatcher:
+    """
+    Delivers webhook jobs concurrently on a bounded thread pool.
+    Keeps one keep-alive session for each of the max_hosts most recently
+    used recipient hosts and caps in-flight
+    requests globally and per recipient agent. Per-recipient limits,
+    timeouts and circuit breakers come from the HealthTracker.
+    Safe to call from several threads.
+    """
+
+    def __init__(
+        self,
+        max_in_flight: int = 32,
+        max_per_agent: int = 4,
+        timeout: int = 30,
+        health: Optional[HealthTracker] = None,
+        max_hosts: int = MAX_WEBHOOK_HOSTS
+    ):
+        self.max_in_flight = max_in_flight
+        self.max_per_agent = max_per_agent
+        self.timeout = timeout
+        self.max_hosts = max_hosts
+        self.health = health or HealthTracker(max_concurrency=max_per_agent, max_timeout=timeout)
+        self.executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="webhook")
+        self._sessions: "OrderedDict[str, requests.Session]" = OrderedDict()
+        self._sessions_lock = threading.Lock()
+        self._stopped: Dict[str, float] = {}  # agent_id -> when it went offline
+        self._running: List[float] = []  # `since` of each deliver() in progress
+        self._stopped_lock = threading.Lock()
+
+    def _session_for(self, url: str) -> requests.Session:
+        """Return the pooled session for the URL's host, creating it on first use"""
+        parts = urlsplit(url)
+        host = f"{parts.scheme}://{parts.netloc}"
+
+        evicted = []
+        with self._sessions_lock:
+            session = self._sessions.get(host)
+            if session is not None:
+                self._sessions.move_to_end(host)
+                return session
+
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_in_flight)
+            session.mount(host, adapter)
+            self._sessions[host] = session
+            while len(self._sessions) > self.max_hosts:
+                evicted.append(self._sessions.popitem(last=False)[1])
+
+        # Closes the idle connections; a request still running on one finishes first
+        for old_session in evicted:
+            old_session.close()
+        return session
+
+    def post(self, job: WebhookJob) -> List[WebhookResult]:
+        """Send a single webhook request and classify the outcome of every message in it"""
+        def outcome(success: bool, permanent: bool, error: Optional[str]) -> List[WebhookResult]:
+            return [WebhookResult(message_id, success, permanent, error) for message_id in job.message_ids]
+
+        with span("call_webhook", **{"agent.id": job.agent_id, "messages": len(job.message_ids)}):
+            timeout = self.health.timeout(job.agent_id)
+            started = time.monotonic()
+            try:
+                response = self._session_for(job.url).post(
+                    job.url,
+                    data=job.body,
+                    headers=job.headers,
+                    timeout=timeout
+                )
+                elapsed = time.monotonic() - started
+                WEBHOOK_LATENCY.labels(str(response.status_code)).observe(elapsed)
+                # 4xx is the recipient's answer about this request, not a sign it is unhealthy
+                overloaded = response.status_code >= 500 or response.status_code == 429
+                self.health.record(job.agent_id, not overloaded, elapsed)
+
+                if 200 <= response.status_code < 300:
+                    if job.batch:
+                        return parse_batch_results(job, response)
+                    return outcome(True, False, None)
+
+                error_msg = f"Webhook returned {response.status_code}: {response.text[:200]}"
+                permanent = 400 <= response.status_code < 500
+                return outcome(False, permanent, error_msg)
+
+            except requests.exceptions.Timeout:
+                WEBHOOK_LATENCY.labels("timeout").observe(time.monotonic() - started)
+                self.health.record(job.agent_id, False, timeout)
+                return outcome(False, False, f"Webhook request timed out after {timeout:.1f}s")
+
+            except requests.exceptions.ConnectionError:
+                WEBHOOK_LATENCY.labels("connection_error").observe(time.monotonic() - started)
+                self.health.record(job.agent_id, False, None)
+                return outcome(False, False, "Could not connect to webhook URL")
+
+            except Exception as e:
+                WEBHOOK_LATENCY.labels("error").observe(time.monotonic() - started)
+                self.health.record(job.agent_id, False, None)
+                return outcome(False, False, f"Unexpected error: {str(e)}")
+
+    def defer(self, jobs: List[WebhookJob]) -> List[WebhookResult]:
+        """Results for jobs held back because the recipient's circuit is open"""
+        results = []
+        for job in jobs:
+            retry_after = self.health.retry_at(job.agent_id)
+            results.extend(
+                WebhookResult(message_id, False, False, "Recipient circuit open", retry_after)
+                for message_id in job.message_ids
+            )
+        return results
+
+    def stop(self, agent_id: str):
+        """
+        The agent went offline: deliver() calls already running send none of its
+        jobs that haven't started yet. Requests already in flight finish.
+        """
+        with self._stopped_lock:
+            if self._running:
+                self._stopped[agent_id] = time.monotonic()
+
+    def _is_stopped(self, agent_id: str, since: float) -> bool:
+        with self._stopped_lock:
+            return self._stopped.get(agent_id, -1.0) >= since
+
+    def hold(self, jobs: List[WebhookJob]) -> List[WebhookResult]:
+        """Results for jobs held back because the recipient went offline"""
+        return [
+            WebhookResult(message_id, False, False, "Recipient went offline", offline=True)
+            for job in jobs for message_id in job.message_ids
+        ]
+
+    def deliver(self, jobs: List[WebhookJob], since: Optional[float] = None) -> List[WebhookResult]:
+        """Run all jobs concurrently and wait for them to finish; see stream()"""
+        return [result for results in self.stream(jobs, since) for result in results]
+
+    def stream(
+        self,
+        jobs: List[WebhookJob],
+        since: Optional[float] = None,
+        tick: Optional[float] = None
+    ) -> Iterator[List[WebhookResult]]:
+        """
+        Run all jobs concurrently, yielding results as jobs finish, so callers can
+        record fast recipients' outcomes while slow ones are still in flight.
+        With a tick, an empty list is yielded whenever that many seconds pass
+        without a job finishing, giving the caller a chance to do periodic work.
+
+        Jobs for the same agent are started in the order given. Jobs for a
+        recipient whose circuit is open are not sent; their results carry retry_after.
+        Jobs for a recipient stopped (gone offline) after `since`, the time.monotonic()
+        its status was read, are not sent either; their results are marked offline.
+        """
+        since = time.monotonic() if since is None else since
+        with self._stopped_lock:
+            self._running.append(since)
+        try:
+            yield from self._stream(jobs, since, tick)
+        finally:
+            with self._stopped_lock:
+                self._running.remove(since)
+                # Forget stops that no running call can be affected by any more
+                oldest = min(self._running, default=float("inf"))
+                self._stopped = {agent_id: at for agent_id, at in self._stopped.items() if at >= oldest}
+
+    def _stream(self, jobs: List[WebhookJob], since: float, tick: Optional[float]) -> Iterator[List[WebhookResult]]:
+        pending = defaultdict(deque)
+        for job in jobs:
+            pending[job.agent_id].append(job)
+
+        in_flight = {}
+        per_agent = defaultdict(int)
+
+        while pending or in_flight:
+            results = []
+            # Start as many jobs as the global and per-agent limits allow
+            for agent_id in list(pending):
+                queue = pending[agent_id]
+                if self._is_stopped(agent_id, since):
+                    results.extend(self.hold(queue))
+                    queue.clear()
+                while queue and len(in_flight) < self.max_in_flight:
+                    admitted = self.health.acquire(agent_id, per_agent[agent_id])
+                    if admitted is None:
+                        results.extend(self.defer(queue))
+                        queue.clear()
+                    if not admitted:
+                        break
+                    job = queue.popleft()
+                    in_flight[self.executor.submit(self.post, job)] = job
+                    per_agent[agent_id] += 1
+                if not queue:
+                    del pending[agent_id]
+
+            timed_out = False
+            if in_flight:
+                done, _ = wait(in_flight, timeout=tick, return_when=FIRST_COMPLETED)
+                timed_out = not done
+                for future in done:
+                    job = in_flight.pop(future)
+                    per_agent[job.agent_id] -= 1
+                    results.extend(future.result())
+
+            if results or timed_out:
+                yield results
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        with self._sessions_lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
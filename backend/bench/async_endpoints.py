@@ -0,0 +1,134 @@
+"""
+Before/after throughput of the hot API paths (auth, send, message status).
+
+"sync" serves bench/sync_baseline.py, the handlers as they were before the
+async database layer; "async" serves app.main as it is now. Each mode runs in its own uvicorn process against the
+same database, driven by concurrent httpx clients.
+
+Run it against Postgres: SQLite serializes every commit on the database
+file, so both modes measure the same lock there.
+
+    cd backend
+    DATABASE_URL=postgresql://... python -m bench.async_endpoints --concurrency 64 --duration 15
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+
+def register(base_url: str, name: str) -> dict:
+    response = httpx.post(f"{base_url}/api/agents/register", json={
+        "name": name,
+        "description": "benchmark agent",
+        "webhook_url": "http://127.0.0.1:9/unused"
+    })
+    response.raise_for_status()
+    return response.json()
+
+
+def start_server(target: str, port: int, env: dict) -> subprocess.Popen:
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", target, "--port", str(port), "--log-level", "warning"],
+        env=env
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/openapi.json", timeout=1)
+            return server
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError(f"{target} did not start")
+
+
+async def drive(base_url: str, sender: dict, recipient: dict, concurrency: int, duration: float) -> list:
+    """Each client alternates send + status lookup until the deadline; returns request latencies"""
+    latencies = []
+    errors = 0
+    deadline = time.monotonic() + duration
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+        async def client_loop():
+            nonlocal errors
+            sender_headers = {"Authorization": f"Bearer {sender['api_key']}"}
+            recipient_headers = {"Authorization": f"Bearer {recipient['api_key']}"}
+            while time.monotonic() < deadline:
+                started = time.perf_counter()
+                response = await client.post("/api/messages/send", headers=sender_headers, json={
+                    "to_agent_id": recipient["agent_id"],
+                    "message_content": {"text": "ping"}
+                })
+                latencies.append(time.perf_counter() - started)
+                if response.status_code != 200:
+                    errors += 1
+                    continue
+
+                started = time.perf_counter()
+                response = await client.get(f"/api/messages/{response.json()['message_id']}", headers=recipient_headers)
+                latencies.append(time.perf_counter() - started)
+                if response.status_code != 200:
+                    errors += 1
+
+        await asyncio.gather(*[client_loop() for _ in range(concurrency)])
+
+    if errors:
+        print(f"  {errors} requests failed")
+    return latencies
+
+
+def run_mode(mode: str, target: str, port: int, env: dict, args) -> dict:
+    server = start_server(target, port, env)
+    try:
+        base_url = f"http://127.0.0.1:{port}"
+        sender, recipient = register(base_url, f"{mode}-sender"), register(base_url, f"{mode}-recipient")
+        latencies = asyncio.run(drive(base_url, sender, recipient, args.concurrency, args.duration))
+    finally:
+        server.terminate()
+        server.wait()
+
+    latencies.sort()
+    return {
+        "mode": mode,
+        "requests": len(latencies),
+        "rps": len(latencies) / args.duration,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1] * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    env.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/bench.db")
+    # The benchmark agents would otherwise hit the default 100/hour limit immediately
+    env["RATE_LIMIT_DEFAULT"] = "1000000000/1"
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [os.getcwd(), env.get("PYTHONPATH")]))
+    print(f"Database: {env['DATABASE_URL']}")
+
+    results = [
+        run_mode("sync", "bench.sync_baseline:sync_app", args.port, env, args),
+        run_mode("async", "app.main:app", args.port, env, args),
+    ]
+
+    print(f"{'mode':<6} {'requests':>9} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8}")
+    for result in results:
+        print(f"{result['mode']:<6} {result['requests']:>9} {result['rps']:>9.1f} {result['p50_ms']:>8.1f} {result['p99_ms']:>8.1f}")
+    print(f"async/sync throughput: {results[1]['rps'] / results[0]['rps']:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,324 @@
+"""
+End-to-end delivery benchmark: API -> database -> worker -> webhook.
+
+Starts the API (uvicorn) and delivery worker(s) as subprocesses against a fresh
+database, plus an in-process asyncio webhook sink that verifies every
+signature. Then it registers agents, sends a workload through the public API
+and reports send throughput, delivery throughput and send-to-delivery latency.
+Runs offline; without Redis the worker polls, so --poll-interval bounds latency.
+
+    cd backend
+    python -m bench.delivery --agents 50 --messages 5000 --fan-out 10 --offline 0.1 --failing 0.05
+    DATABASE_URL=postgresql://... python -m bench.delivery --workers 4
+
+--claim-backlog adds a point for the worker's claim query alone: after the run it
+queues that many due messages straight into the database, most of them from a
+single sender, and times claiming pages of --claim-page-size from that backlog.
+
+    python -m bench.delivery --claim-backlog 200000
+
+To guard against regressions, save a run and compare later ones to it:
+
+    python -m bench.delivery --json baseline.json
+    python -m bench.delivery --baseline baseline.json --tolerance 0.2   # exits 1 on regression
+"""
+import argparse
+import asyncio
+import json
+import os
+import secrets
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+import httpx
+from sqlalchemy import create_engine, insert, text
+from sqlalchemy.orm import Session
+
+from app.core.security import generate_message_id
+from app.core.sharding import shard_of
+from app.models.database import Message, MessageStatus
+from app.workers.leasing import claim_due_messages
+
+from bench.async_endpoints import start_server
+from bench.webhook_sink import WebhookSink
+
+
+def register_agents(base_url: str, sink_port: int, args) -> tuple:
+    """Sender plus recipients; returns (sender, recipients) where each recipient has a role"""
+    client = httpx.Client(base_url=base_url, timeout=30)
+    sender = client.post("/api/agents/register", json={
+        "name": "bench-sender",
+        "description": "benchmark sender",
+        "webhook_url": f"http://127.0.0.1:{sink_port}/hook/sender"
+    }).raise_for_status().json()
+
+    offline = round(args.agents * args.offline)
+    failing = round(args.agents * args.failing)
+    recipients = []
+    for index in range(args.agents):
+        name = f"r{index}"
+        role = "offline" if index < offline else "failing" if index < offline + failing else "online"
+        path = "fail" if role == "failing" else "hook"
+        agent = client.post("/api/agents/register", json={
+            "name": name,
+            "description": "benchmark recipient",
+            "webhook_url": f"http://127.0.0.1:{sink_port}/{path}/{name}",
+            "delivery_batch_size": args.delivery_batch_size
+        }).raise_for_status().json()
+        agent.update(name=name, role=role)
+
+        if role != "offline":
+            client.put(
+                f"/api/agents/{agent['agent_id']}/status",
+                json={"status": "online"},
+                headers={"Authorization": f"Bearer {agent['api_key']}"}
+            ).raise_for_status()
+        recipients.append(agent)
+
+    client.close()
+    return sender, recipients
+
+
+async def send_workload(base_url: str, sender: dict, recipients: list, args) -> tuple:
+    """
+    Send args.messages messages, args.fan_out recipients per request, from
+    args.concurrency clients. Returns (message_id -> (recipient role, send time), elapsed seconds).
+    """
+    content = {"data": secrets.token_urlsafe(args.payload_bytes)[:args.payload_bytes]}
+    headers = {"Authorization": f"Bearer {sender['api_key']}"}
+    requests_total = -(-args.messages // args.fan_out)
+    sent = {}
+    next_request = 0
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=60, limits=httpx.Limits(max_connections=args.concurrency)) as client:
+        async def client_loop():
+            nonlocal next_request
+            while next_request < requests_total:
+                index = next_request
+                next_request += 1
+                targets = [recipients[(index * args.fan_out + i) % len(recipients)] for i in range(args.fan_out)]
+
+                if args.fan_out == 1:
+                    response = await client.post("/api/messages/send", headers=headers, json={
+                        "to_agent_id": targets[0]["agent_id"],
+                        "message_content": content
+                    })
+                    items = [response.json()] if response.status_code == 200 else []
+                else:
+                    response = await client.post("/api/messages/send_batch", headers=headers, json={
+                        "to_agent_ids": [target["agent_id"] for target in targets],
+                        "message_content": content
+                    })
+                    items = response.json()["results"] if response.status_code == 200 else []
+                if response.status_code != 200:
+                    print(f"  send failed: {response.status_code} {response.text[:200]}")
+
+                now = time.monotonic()
+                for target, item in zip(targets, items):
+                    if item.get("message_id"):
+                        sent[item["message_id"]] = (target["role"], now)
+
+        started = time.monotonic()
+        await asyncio.gather(*[client_loop() for _ in range(args.concurrency)])
+        return sent, time.monotonic() - started
+
+
+def wait_for_worker(metrics_port: int):
+    """Block until the worker's metrics port answers, i.e. it has started its loop"""
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(f"http://127.0.0.1:{metrics_port}/metrics/recipients", timeout=1)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError("Delivery worker did not start")
+
+
+def measure_claim(database_url: str, args) -> float:
+    """
+    Median milliseconds per page for claim_due_messages with args.claim_backlog due
+    messages queued: 90% from one heavy sender, the rest spread over 100 light ones.
+    Runs in this process, once the workers have stopped, against the bench database.
+    """
+    engine = create_engine(database_url)
+    db = Session(engine)
+    try:
+        now = datetime.now(timezone.utc)
+        heavy = round(args.claim_backlog * 0.9)
+        for start in range(0, args.claim_backlog, 10000):
+            rows = []
+            for index in range(start, min(start + 10000, args.claim_backlog)):
+                to_agent_id = f"claim-r{index % args.agents}"
+                rows.append({
+                    "id": generate_message_id(),
+                    "from_agent_id": "claim-heavy" if index < heavy else f"claim-light{index % 100}",
+                    "to_agent_id": to_agent_id,
+                    "shard": shard_of(to_agent_id),
+                    "message_content": b"{}",
+                    "status": MessageStatus.QUEUED,
+                    "priority": index % 3,
+                    "retry_count": 0,
+                    "created_at": now,
+                    "next_attempt_at": now - timedelta(seconds=index % 3600)
+                })
+            db.execute(insert(Message), rows)
+            db.commit()
+        # Planner statistics as autovacuum (or a periodic ANALYZE on SQLite) keeps them;
+        # straight after a bulk load they describe a near-empty table
+        db.execute(text("ANALYZE messages"))
+        db.commit()
+
+        timings = []
+        for _ in range(args.claim_pages):
+            started = time.perf_counter()
+            claim_due_messages(db, "bench-claim", args.claim_page_size, lease_seconds=600)
+            timings.append((time.perf_counter() - started) * 1000)
+        return statistics.median(timings)
+    finally:
+        db.close()
+        engine.dispose()
+
+
+def percentile(values: list, fraction: float) -> float:
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else float("nan")
+
+
+def run(args) -> dict:
+    env = dict(os.environ)
+    env.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/bench.db")
+    env["RATE_LIMIT_DEFAULT"] = "1000000000/1"
+    env["WORKER_POLL_INTERVAL"] = str(args.poll_interval)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [os.getcwd(), env.get("PYTHONPATH")]))
+    print(f"Database: {env['DATABASE_URL']}")
+
+    secrets_by_name = {}
+    sink = WebhookSink(secrets_by_name)
+    sink_port = sink.start()
+
+    base_url = f"http://127.0.0.1:{args.port}"
+    api = start_server("app.main:app", args.port, env)
+    workers = []
+    try:
+        sender, recipients = register_agents(base_url, sink_port, args)
+        secrets_by_name.update({recipient["name"]: recipient["secret_token"] for recipient in recipients})
+
+        for index in range(args.workers):
+            metrics_port = args.port + 1 + index
+            workers.append(subprocess.Popen(
+                [sys.executable, "-m", "app.workers.message_delivery"],
+                env={**env, "WORKER_METRICS_PORT": str(metrics_port)},
+                stderr=subprocess.DEVNULL
+            ))
+            wait_for_worker(metrics_port)
+
+        sent, send_seconds = asyncio.run(send_workload(base_url, sender, recipients, args))
+        expected = {message_id for message_id, (role, _) in sent.items() if role == "online"}
+
+        deadline = time.monotonic() + args.timeout
+        while time.monotonic() < deadline and not expected.issubset(sink.arrivals):
+            time.sleep(0.1)
+    finally:
+        for worker in workers:
+            worker.terminate()
+        api.terminate()
+        for process in [*workers, api]:
+            process.wait()
+
+    claim_ms = measure_claim(env["DATABASE_URL"], args) if args.claim_backlog else None
+
+    delivered = [message_id for message_id in expected if message_id in sink.arrivals]
+    latencies = sorted(sink.arrivals[message_id] - sent[message_id][1] for message_id in delivered)
+    first_send = min((sent_at for _, sent_at in sent.values()), default=0)
+    last_arrival = max((sink.arrivals[message_id] for message_id in delivered), default=first_send)
+
+    return {
+        "sent": len(sent),
+        "send_per_second": len(sent) / send_seconds if send_seconds else 0,
+        "expected": len(expected),
+        "delivered": len(delivered),
+        "delivered_per_second": len(delivered) / (last_arrival - first_send) if last_arrival > first_send else 0,
+        "p50_ms": percentile(latencies, 0.5) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "mean_ms": statistics.fmean(latencies) * 1000 if latencies else float("nan"),
+        "duplicates": sink.duplicates,
+        "bad_signatures": sink.bad_signatures,
+        "failing_webhook_calls": sum(sink.failed.values()),
+        "claim_ms": claim_ms,
+    }
+
+
+def regressions(result: dict, baseline: dict, tolerance: float) -> list:
+    """Human-readable regressions of result against baseline beyond tolerance (a fraction)"""
+    problems = []
+    for key in ("send_per_second", "delivered_per_second"):
+        if result[key] < baseline[key] * (1 - tolerance):
+            problems.append(f"{key} {result[key]:.1f} < baseline {baseline[key]:.1f}")
+    for key in ("p50_ms", "p99_ms", "claim_ms"):
+        if result.get(key) is None or baseline.get(key) is None:
+            continue
+        if result[key] > baseline[key] * (1 + tolerance):
+            problems.append(f"{key} {result[key]:.1f} > baseline {baseline[key]:.1f}")
+    if result["delivered"] < result["expected"]:
+        problems.append(f"only {result['delivered']} of {result['expected']} messages delivered")
+    if result["bad_signatures"]:
+        problems.append(f"{result['bad_signatures']} webhooks had invalid signatures")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--agents", type=int, default=20, help="recipient agents")
+    parser.add_argument("--messages", type=int, default=2000, help="messages to send in total")
+    parser.add_argument("--fan-out", type=int, default=1, help="recipients per send; >1 uses send_batch")
+    parser.add_argument("--payload-bytes", type=int, default=256, help="size of each message_content")
+    parser.add_argument("--offline", type=float, default=0.0, help="fraction of recipients left offline")
+    parser.add_argument("--failing", type=float, default=0.0, help="fraction of recipients whose webhook returns 500")
+    parser.add_argument("--delivery-batch-size", type=int, default=None, help="recipients' webhook batch size")
+    parser.add_argument("--concurrency", type=int, default=16, help="concurrent API clients")
+    parser.add_argument("--workers", type=int, default=1, help="delivery worker processes")
+    parser.add_argument("--poll-interval", type=float, default=0.2, help="worker poll interval without Redis")
+    parser.add_argument("--claim-backlog", type=int, default=0, help="due messages to time claiming pages against; 0 skips it")
+    parser.add_argument("--claim-pages", type=int, default=5, help="pages claimed for --claim-backlog")
+    parser.add_argument("--claim-page-size", type=int, default=100, help="messages per page for --claim-backlog (the worker's batch_size)")
+    parser.add_argument("--timeout", type=float, default=120, help="seconds to wait for deliveries after sending")
+    parser.add_argument("--port", type=int, default=8766, help="API port; workers' metrics ports follow it")
+    parser.add_argument("--json", help="write the results here")
+    parser.add_argument("--baseline", help="results JSON of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed regression against the baseline")
+    args = parser.parse_args()
+
+    result = run(args)
+
+    print(f"sent {result['sent']} messages at {result['send_per_second']:.1f}/s")
+    print(f"delivered {result['delivered']}/{result['expected']} at {result['delivered_per_second']:.1f}/s")
+    print(f"send-to-delivery p50 {result['p50_ms']:.1f} ms, p99 {result['p99_ms']:.1f} ms, mean {result['mean_ms']:.1f} ms")
+    print(f"duplicates {result['duplicates']}, bad signatures {result['bad_signatures']}, "
+          f"calls to failing webhooks {result['failing_webhook_calls']}")
+    if result["claim_ms"] is not None:
+        print(f"claiming a page of {args.claim_page_size} from {args.claim_backlog} due messages: {result['claim_ms']:.1f} ms")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": vars(args), **result}, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        workload = ("agents", "messages", "fan_out", "payload_bytes", "offline", "failing", "delivery_batch_size", "concurrency", "workers", "claim_backlog", "claim_page_size")
+        changed = [key for key in workload if baseline.get("args", {}).get(key) != vars(args)[key]]
+        if changed:
+            print(f"warning: baseline was run with a different workload ({', '.join(changed)})")
+        problems = regressions(result, baseline, args.tolerance)
+        for problem in problems:
+            print(f"REGRESSION: {problem}")
+        if problems:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
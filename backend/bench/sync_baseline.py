@@ -0,0 +1,86 @@
+"""
+The hot request path as it was before the async database layer: plain `def`
+handlers on the threadpool with a sync session. Served by bench.async_endpoints
+as the baseline it compares app.main against.
+"""
+import json
+from datetime import datetime, timezone
+
+from fastapi import Depends, FastAPI, HTTPException, Request, Response
+from fastapi.security import HTTPAuthorizationCredentials
+from sqlalchemy.orm import Session
+
+from app.core.database import get_db
+from app.main import register_agent
+from app.core.rate_limit import rate_limit_headers
+from app.core.security import (
+    AuthenticatedAgent,
+    auth_cache,
+    check_rate_limit,
+    generate_message_id,
+    hash_api_key,
+    security,
+)
+from app.models.database import Agent, AgentStatus, Message, MessageStatus
+
+sync_app = FastAPI(title="Agent Connect API (sync baseline)")
+sync_app.post("/api/agents/register")(register_agent)
+
+
+def sync_current_agent(
+    request: Request,
+    response: Response,
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: Session = Depends(get_db)
+) -> AuthenticatedAgent:
+    api_key_hash = hash_api_key(credentials.credentials)
+    cached = auth_cache.get(api_key_hash)
+    if cached:
+        agent = AuthenticatedAgent(id=cached["id"], status=AgentStatus(cached["status"]), rate_limit=cached.get("rate_limit"))
+    else:
+        row = db.query(Agent.id, Agent.status, Agent.rate_limit).filter(Agent.api_key_hash == api_key_hash).first()
+        if not row:
+            raise HTTPException(status_code=401, detail="Invalid API key")
+        auth_cache.set(api_key_hash, {"id": row.id, "status": row.status.value, "rate_limit": row.rate_limit})
+        agent = AuthenticatedAgent(id=row.id, status=row.status, rate_limit=row.rate_limit)
+
+    route = request.scope.get("route")
+    result = check_rate_limit(agent, f"{request.method} {route.path if route else request.url.path}")
+    if not result.allowed:
+        raise HTTPException(status_code=429, detail="Rate limit exceeded", headers=rate_limit_headers(result))
+    response.headers.update(rate_limit_headers(result))
+    return agent
+
+
+@sync_app.post("/api/messages/send")
+def sync_send_message(
+    request: dict,
+    current_agent: AuthenticatedAgent = Depends(sync_current_agent),
+    db: Session = Depends(get_db)
+):
+    if not db.query(Agent).filter(Agent.id == request["to_agent_id"]).first():
+        raise HTTPException(status_code=404, detail="Recipient agent not found")
+
+    message_id = generate_message_id()
+    db.add(Message(
+        id=message_id,
+        from_agent_id=current_agent.id,
+        to_agent_id=request["to_agent_id"],
+        message_content=json.dumps(request["message_content"]).encode(),
+        status=MessageStatus.QUEUED,
+        next_attempt_at=datetime.now(timezone.utc)
+    ))
+    db.commit()
+    return {"message_id": message_id, "status": MessageStatus.QUEUED}
+
+
+@sync_app.get("/api/messages/{message_id}")
+def sync_get_message_status(
+    message_id: str,
+    current_agent: AuthenticatedAgent = Depends(sync_current_agent),
+    db: Session = Depends(get_db)
+):
+    message = db.query(Message).filter(Message.id == message_id).first()
+    if not message:
+        raise HTTPException(status_code=404, detail="Message not found")
+    return {"message_id": message.id, "status": message.status, "retry_count": message.retry_count}
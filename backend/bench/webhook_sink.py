@@ -0,0 +1,120 @@
+"""
+Asyncio webhook receiver for benchmarks.
+
+Speaks just enough HTTP/1.1 (keep-alive, Content-Length bodies) to take
+thousands of deliveries a second without any dependency. Every request is
+decompressed if needed and its X-Signature checked against the recipient's
+secret. Paths are /hook/<name> for healthy recipients and /fail/<name> for
+ones that always answer 500.
+
+    python -m bench.webhook_sink --port 9900   # accepts anything, prints a rate every second
+"""
+import argparse
+import asyncio
+import gzip
+import json
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, Optional
+
+from app.core.security import verify_webhook_signature
+
+
+class WebhookSink:
+    def __init__(self, secrets: Optional[Dict[str, str]] = None):
+        """secrets: recipient name -> secret token; None skips signature checks"""
+        self.secrets = secrets
+        self.arrivals: Dict[str, float] = {}  # message_id -> monotonic time first received
+        self.requests = 0
+        self.duplicates = 0
+        self.bad_signatures = 0
+        self.failed = defaultdict(int)  # name -> requests answered with 500
+        self.port: Optional[int] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def start(self, port: int = 0, host: str = "127.0.0.1") -> int:
+        """Serve on a background thread; returns the bound port"""
+        ready = threading.Event()
+
+        def serve():
+            self._loop = asyncio.new_event_loop()
+            server = self._loop.run_until_complete(asyncio.start_server(self._handle, host, port, backlog=1024))
+            self.port = server.sockets[0].getsockname()[1]
+            ready.set()
+            self._loop.run_forever()
+
+        threading.Thread(target=serve, name="webhook-sink", daemon=True).start()
+        ready.wait()
+        return self.port
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+
+                status = self._receive(request_line.split()[1].decode(), headers, body)
+                reason = b"OK" if status == 200 else b"Error"
+                writer.write(b"HTTP/1.1 %d %s\r\nContent-Length: 0\r\n\r\n" % (status, reason))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    def _receive(self, path: str, headers: Dict[str, str], body: bytes) -> int:
+        now = time.monotonic()
+        self.requests += 1
+        _, kind, name = (path.split("?", 1)[0].split("/", 2) + ["", ""])[:3]
+
+        if kind == "fail":
+            self.failed[name] += 1
+            return 500
+
+        if headers.get("content-encoding") == "gzip":
+            body = gzip.decompress(body)
+        payload = body.decode()
+
+        if self.secrets is not None:
+            secret = self.secrets.get(name)
+            if secret is None or not verify_webhook_signature(payload, headers.get("x-signature", ""), secret):
+                self.bad_signatures += 1
+                return 401
+
+        messages = json.loads(payload)
+        for message in messages if isinstance(messages, list) else [messages]:
+            if message["message_id"] in self.arrivals:
+                self.duplicates += 1
+            else:
+                self.arrivals[message["message_id"]] = now
+        return 200
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=9900)
+    args = parser.parse_args()
+
+    sink = WebhookSink()
+    sink.start(args.port, host="0.0.0.0")
+    print(f"Webhook sink listening on :{sink.port}")
+    last = 0
+    while True:
+        time.sleep(1)
+        received = len(sink.arrivals)
+        print(f"{received - last} messages/s ({received} total, {sink.duplicates} duplicates)")
+        last = received
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+Tests run against a throwaway SQLite database. Set TEST_DATABASE_URL to run
+them against Postgres instead (asyncpg and psycopg2 both get exercised):
+
+    TEST_DATABASE_URL=postgresql://postgres@localhost/agentconnect_test python -m pytest
+
+The app reads DATABASE_URL on import, so it is set here before any test imports app.
+"""
+import http.server
+import os
+import tempfile
+import threading
+from datetime import datetime, timezone
+from typing import List
+
+os.environ["DATABASE_URL"] = os.getenv("TEST_DATABASE_URL") or f"sqlite:///{tempfile.mkdtemp()}/test.db"
+
+import pytest
+from fastapi.testclient import TestClient
+
+
+@pytest.fixture(scope="session")
+def client():
+    from app.main import app
+    # One event loop for the whole session, so pooled async connections stay usable
+    with TestClient(app) as client:
+        yield client
+
+
+@pytest.fixture
+def register(client):
+    """Register an agent; returns the registration response plus ready-made auth headers"""
+    def register(name: str = "agent", **fields) -> dict:
+        response = client.post("/api/agents/register", json={
+            "name": name,
+            "description": f"{name} test agent",
+            "webhook_url": "http://127.0.0.1:9/webhook",
+            **fields
+        })
+        assert response.status_code == 200, response.text
+        agent = response.json()
+        agent["headers"] = {"Authorization": f"Bearer {agent['api_key']}"}
+        return agent
+    return register
+
+
+@pytest.fixture
+def db():
+    import app.main  # creates the schema
+    from app.core.database import SessionLocal
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture
+def queue_messages(db):
+    """Insert queued messages straight into the table, due now unless next_attempt_at is given"""
+    from app.core.security import generate_message_id
+    from app.models.database import Message, MessageStatus
+
+    def queue_messages(from_agent_id: str, to_agent_id: str, count: int = 1, **values) -> List[str]:
+        now = datetime.now(timezone.utc)
+        fields = {
+            "from_agent_id": from_agent_id,
+            "to_agent_id": to_agent_id,
+            "message_content": b"{}",
+            "status": MessageStatus.QUEUED,
+            "priority": 1,
+            "retry_count": 0,
+            "created_at": now,
+            "next_attempt_at": now,
+            **values
+        }
+        messages = [Message(id=generate_message_id(), **fields) for _ in range(count)]
+        db.add_all(messages)
+        db.commit()
+        return [message.id for message in messages]
+    return queue_messages
+
+
+@pytest.fixture
+def claim(db):
+    """Lease the due messages for the given recipients, as a worker's page would"""
+    from app.models.database import Message
+    from app.workers.leasing import claim_due_messages
+
+    def claim(owner: str, recipients: List[str], limit: int = 100, lease_seconds: int = 60, now=None):
+        return claim_due_messages(
+            db, owner, limit, lease_seconds,
+            now=now, filters=(Message.to_agent_id.in_(recipients),)
+        )
+    return claim
+
+
+class WebhookHandler(http.server.BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.server.bodies.append(body)
+        self.server.request_headers.append(self.headers)
+        self.server.received.append(self.path)
+        if self.path == "/slow":
+            self.server.release.wait(30)
+        status, reply = self.server.reply(body)
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(reply)))
+        self.end_headers()
+        self.wfile.write(reply)
+
+    def log_message(self, *args):
+        pass
+
+
+class WebhookSink(http.server.ThreadingHTTPServer):
+    """
+    Accepts every webhook call, recording its path, headers and body; calls to /slow
+    wait until `release` is set. Answers 200 with no body unless `reply` is replaced
+    by a function of the request body returning (status, response body).
+    """
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), WebhookHandler)
+        self.url = f"http://127.0.0.1:{self.server_address[1]}"
+        self.release = threading.Event()
+        self.received = []
+        self.request_headers = []
+        self.bodies = []
+        self.reply = lambda body: (200, b"")
+
+
+@pytest.fixture
+def sink():
+    server = WebhookSink()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.release.set()
+    server.shutdown()
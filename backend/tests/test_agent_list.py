@@ -0,0 +1,81 @@
+from datetime import timedelta
+
+import pytest
+
+from app.core.pagination import encode_cursor
+from app.models.database import Agent
+
+
+def list_agents(client, **params):
+    response = client.get("/api/agents", params=params)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+@pytest.fixture
+def agents(db, register):
+    """Five freshly registered agents, plus a cursor pointing just before the first"""
+    agents = [register(f"listed{n}") for n in range(5)]
+    first = db.get(Agent, agents[0]["agent_id"])
+    before_first = encode_cursor(first.created_at - timedelta(microseconds=1), "")
+    return [agent["agent_id"] for agent in agents], before_first
+
+
+def test_cursor_pages_are_stable_across_inserts(client, db, register, agents):
+    agent_ids, before_first = agents
+
+    first_page = list_agents(client, cursor=before_first, limit=2)
+    # One agent lands before the cursor and one after every listed agent
+    backdated = register("backdated")["agent_id"]
+    db.get(Agent, backdated).created_at = db.get(Agent, agent_ids[0]).created_at - timedelta(seconds=1)
+    db.commit()
+    latest = register("latest")["agent_id"]
+    second_page = list_agents(client, cursor=first_page["next_cursor"], limit=2)
+    third_page = list_agents(client, cursor=second_page["next_cursor"], limit=2)
+
+    listed = [agent["agent_id"] for page in (first_page, second_page, third_page) for agent in page["agents"]]
+    assert listed == agent_ids + [latest]
+    assert backdated not in listed
+
+
+def test_cursor_breaks_created_at_ties_by_id(client, db, agents):
+    agent_ids, before_first = agents
+    created_at = db.get(Agent, agent_ids[0]).created_at
+    for agent_id in agent_ids:
+        db.get(Agent, agent_id).created_at = created_at
+    db.commit()
+
+    listed, cursor = [], before_first
+    for _ in agent_ids:
+        page = list_agents(client, cursor=cursor, limit=1)
+        listed += [agent["agent_id"] for agent in page["agents"]]
+        cursor = page["next_cursor"]
+
+    assert listed == sorted(agent_ids)
+
+
+# Not base64, an empty list, and a timestamp that does not parse
+@pytest.mark.parametrize("cursor", ["not a cursor!", "W10", "WyJ5ZXN0ZXJkYXkiLCAiYWdlbnRfeCJd"])
+def test_bad_cursor_is_rejected(client, cursor):
+    response = client.get("/api/agents", params={"cursor": cursor})
+
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid cursor"
+
+
+def test_fields_returns_only_the_requested_fields(client, agents):
+    agent_ids, before_first = agents
+
+    page = list_agents(client, cursor=before_first, limit=2, fields="agent_id, name")
+
+    assert page["agents"] == [{"agent_id": agent_ids[0], "name": "listed0"}, {"agent_id": agent_ids[1], "name": "listed1"}]
+    # The keyset columns are not requested, but the next page can still be found
+    next_page = list_agents(client, cursor=page["next_cursor"], limit=1, fields="status")
+    assert next_page["agents"] == [{"status": "offline"}]
+
+
+def test_unknown_fields_are_rejected(client):
+    response = client.get("/api/agents", params={"fields": "agent_id,api_key_hash"})
+
+    assert response.status_code == 400
+    assert "api_key_hash" in response.json()["detail"]
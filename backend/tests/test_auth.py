@@ -0,0 +1,74 @@
+import time
+
+import fakeredis
+
+from app.core.cache import TieredCache
+from app.core.security import auth_cache, hash_api_key
+
+
+def get_inbox(client, headers):
+    return client.get("/api/messages/inbox", headers=headers)
+
+
+def wait_for(condition, seconds: float = 5) -> bool:
+    deadline = time.monotonic() + seconds
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def test_rotated_key_is_rejected_while_cached(client, register):
+    agent = register("agent")
+    old_hash = hash_api_key(agent["api_key"])
+    assert get_inbox(client, agent["headers"]).status_code == 200
+    assert auth_cache.local.get(old_hash) is not None
+
+    response = client.post(f"/api/agents/{agent['agent_id']}/rotate_key", headers=agent["headers"])
+
+    assert response.status_code == 200, response.text
+    api_key = response.json()["api_key"]
+    assert api_key != agent["api_key"]
+    assert auth_cache.local.get(old_hash) is None
+    assert get_inbox(client, agent["headers"]).status_code == 401
+    assert get_inbox(client, {"Authorization": f"Bearer {api_key}"}).status_code == 200
+
+
+def test_only_the_agent_can_rotate_its_key(client, register):
+    agent, other = register("agent"), register("other")
+
+    response = client.post(f"/api/agents/{agent['agent_id']}/rotate_key", headers=other["headers"])
+
+    assert response.status_code == 403
+    assert get_inbox(client, agent["headers"]).status_code == 200
+
+
+def test_status_change_replaces_the_cached_snapshot(client, register):
+    agent = register("agent")
+    api_key_hash = hash_api_key(agent["api_key"])
+    get_inbox(client, agent["headers"])
+    assert auth_cache.local.get(api_key_hash)["status"] == "offline"
+
+    client.put(f"/api/agents/{agent['agent_id']}/status", json={"status": "online"}, headers=agent["headers"])
+
+    assert auth_cache.local.get(api_key_hash) is None
+    get_inbox(client, agent["headers"])
+    assert auth_cache.local.get(api_key_hash)["status"] == "online"
+
+
+def test_invalidation_reaches_every_process():
+    server = fakeredis.FakeServer()
+    here, there = TieredCache("auth-test"), TieredCache("auth-test")
+    for cache in (here, there):
+        cache.attach_redis(fakeredis.FakeRedis(server=server, decode_responses=True))
+    redis_client = here.redis_client
+    assert wait_for(lambda: redis_client.pubsub_numsub(here.channel)[0][1] == 2)
+
+    there.set("key-hash", {"id": "agent_x", "status": "online"})
+    assert here.get("key-hash") == {"id": "agent_x", "status": "online"}
+
+    there.invalidate("key-hash")
+
+    assert wait_for(lambda: here.local.get("key-hash") is None)
+    assert here.get("key-hash") is None
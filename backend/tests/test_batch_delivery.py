@@ -0,0 +1,77 @@
+import json
+
+import pytest
+
+from app.core.security import verify_webhook_signature
+from app.models.database import Message, MessageStatus
+from app.workers.message_delivery import MessageDeliveryWorker
+
+
+@pytest.fixture
+def batch_recipient(client, register, sink):
+    recipient = register("recipient", webhook_url=f"{sink.url}/hook", delivery_batch_size=10)
+    client.put(f"/api/agents/{recipient['agent_id']}/status", json={"status": "online"}, headers=recipient["headers"])
+    return recipient
+
+
+def deliver(db, claim, recipient):
+    worker = MessageDeliveryWorker()
+    worker.deliver_messages(claim(worker.worker_id, [recipient["agent_id"]]), db)
+    db.expire_all()
+
+
+def test_batch_request_is_one_signed_array(db, queue_messages, claim, sink, batch_recipient):
+    message_ids = queue_messages("agent_sender", batch_recipient["agent_id"], count=3, message_content=b'{"n": 1}')
+
+    deliver(db, claim, batch_recipient)
+
+    [body] = sink.bodies
+    [headers] = sink.request_headers
+    assert headers["X-Batch-Size"] == "3"
+    assert verify_webhook_signature(body.decode(), headers["X-Signature"], batch_recipient["secret_token"])
+    assert not verify_webhook_signature(body.decode(), headers["X-Signature"], "another-secret")
+    items = json.loads(body)
+    assert sorted(item["message_id"] for item in items) == sorted(message_ids)
+    assert all(item["message_content"] == {"n": 1} for item in items)
+
+
+def test_partial_ack_retries_the_rest(db, queue_messages, claim, sink, batch_recipient):
+    queue_messages("agent_sender", batch_recipient["agent_id"], count=4)
+
+    def reply(body):
+        first, second, third, _ = [item["message_id"] for item in json.loads(body)]
+        # The fourth is left out of the results
+        return 200, json.dumps({"results": [
+            {"message_id": first, "status": "delivered"},
+            {"message_id": second, "status": "retry", "error": "busy"},
+            {"message_id": third, "status": "rejected", "error": "unsupported"}
+        ]}).encode()
+    sink.reply = reply
+
+    deliver(db, claim, batch_recipient)
+
+    first, second, third, fourth = [db.get(Message, item["message_id"]) for item in json.loads(sink.bodies[0])]
+    assert first.status == MessageStatus.DELIVERED
+    assert third.status == MessageStatus.FAILED
+    assert third.error_message == "unsupported"
+    for retried, error in ((second, "busy"), (fourth, "Not acknowledged in batch response")):
+        assert retried.status == MessageStatus.QUEUED
+        assert retried.retry_count == 1
+        assert retried.next_attempt_at is not None
+        assert retried.error_message == error
+        assert retried.lease_owner is None
+
+
+@pytest.mark.parametrize("status_code, outcome", [(503, MessageStatus.QUEUED), (400, MessageStatus.FAILED)])
+def test_non_2xx_applies_to_the_whole_batch(db, queue_messages, claim, sink, batch_recipient, status_code, outcome):
+    message_ids = queue_messages("agent_sender", batch_recipient["agent_id"], count=3)
+    sink.reply = lambda body: (status_code, b"nope")
+
+    deliver(db, claim, batch_recipient)
+
+    assert len(sink.bodies) == 1
+    for message_id in message_ids:
+        message = db.get(Message, message_id)
+        assert message.status == outcome
+        assert message.retry_count == 1
+        assert message.error_message == f"Webhook returned {status_code}: nope"
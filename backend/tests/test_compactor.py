@@ -0,0 +1,140 @@
+import gzip
+import json
+import os
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import create_engine, text
+
+from app.core import partitions
+from app.core.database import engine
+from app.core.security import generate_id
+from app.models.database import IdempotencyKey, Message, MessageStatus
+from app.workers.compactor import MessageCompactor
+
+# Rows for these tests are dated long before anything the other tests create
+LONG_AGO = datetime(2000, 1, 1, tzinfo=timezone.utc)
+
+
+def read_archives(archive_dir):
+    records = []
+    for name in os.listdir(archive_dir):
+        with gzip.open(os.path.join(archive_dir, name), "rt") as archive:
+            records += [json.loads(line) for line in archive]
+    return records
+
+
+def test_expired_messages_are_archived_then_deleted(db, queue_messages, tmp_path):
+    delivered = queue_messages("agent_sender", "agent_recipient", count=3, status=MessageStatus.DELIVERED, created_at=LONG_AGO, message_content=b'{"n": 1}')
+    [failed] = queue_messages("agent_sender", "agent_recipient", status=MessageStatus.FAILED, created_at=LONG_AGO)
+    [queued] = queue_messages("agent_sender", "agent_recipient", created_at=LONG_AGO)
+    [recent] = queue_messages("agent_sender", "agent_recipient", status=MessageStatus.DELIVERED, created_at=LONG_AGO + timedelta(days=30))
+    # Only delivered messages created in the first week of 2000 have expired
+    compactor = MessageCompactor(
+        retention={MessageStatus.DELIVERED: (datetime.now(timezone.utc) - LONG_AGO - timedelta(days=7)).total_seconds()},
+        archive_dir=str(tmp_path),
+        batch_size=2
+    )
+
+    removed = compactor.run_once()
+
+    assert removed[MessageStatus.DELIVERED] >= 3
+    db.expire_all()
+    assert [db.get(Message, message_id) for message_id in delivered] == [None] * 3
+    assert all(db.get(Message, message_id) is not None for message_id in (failed, queued, recent))
+    archived = {record["message_id"]: record for record in read_archives(tmp_path)}
+    assert set(delivered) <= set(archived)
+    assert archived[delivered[0]]["message_content"] == {"n": 1}
+    assert archived[delivered[0]]["status"] == "delivered"
+
+
+def test_compaction_without_archive_only_deletes(db, queue_messages, tmp_path):
+    failed = queue_messages("agent_sender", "agent_recipient", count=3, status=MessageStatus.FAILED, created_at=LONG_AGO - timedelta(days=1))
+    compactor = MessageCompactor(retention={}, batch_size=2)
+
+    removed = compactor.compact_status(db, MessageStatus.FAILED, LONG_AGO)
+
+    assert removed == 3
+    assert all(db.get(Message, message_id) is None for message_id in failed)
+    assert os.listdir(tmp_path) == []
+
+
+def test_expired_idempotency_keys_are_purged(db):
+    agent_id = generate_id()
+    db.add_all([
+        IdempotencyKey(agent_id=agent_id, key=f"key-{n}", message_id=f"msg_{n}", request_hash="hash", expires_at=LONG_AGO + timedelta(days=n))
+        for n in range(4)
+    ])
+    db.commit()
+
+    purged = MessageCompactor(retention={}, batch_size=1).purge_idempotency_keys(db, LONG_AGO + timedelta(days=2))
+
+    assert purged >= 2
+    keys = db.query(IdempotencyKey.key).filter(IdempotencyKey.agent_id == agent_id).order_by(IdempotencyKey.key).all()
+    assert [key for (key,) in keys] == ["key-2", "key-3"]
+
+
+@pytest.fixture
+def partitioned_engine(monkeypatch):
+    """An engine whose messages table is partitioned by month, in a schema of its own"""
+    if engine.dialect.name != "postgresql":
+        pytest.skip("Partitioning is Postgres only")
+    monkeypatch.setattr(partitions, "PARTITION_INTERVAL", "month")
+    schema = f"partitions_{uuid.uuid4().hex}"
+    with engine.begin() as conn:
+        conn.execute(text(f"CREATE SCHEMA {schema}"))
+    partitioned = create_engine(engine.url, connect_args={"options": f"-csearch_path={schema}"})
+    try:
+        yield partitioned
+    finally:
+        partitioned.dispose()
+        with engine.begin() as conn:
+            conn.execute(text(f"DROP SCHEMA {schema} CASCADE"))
+
+
+def insert_message(conn, created_at: datetime, status: MessageStatus = MessageStatus.DELIVERED):
+    conn.execute(Message.__table__.insert().values(
+        id=generate_id(), from_agent_id="agent_sender", to_agent_id="agent_recipient",
+        message_content=b"{}", status=status, created_at=created_at
+    ))
+
+
+def count_rows(conn, table: str) -> int:
+    return conn.execute(text(f"SELECT count(*) FROM {table}")).scalar()
+
+
+def test_startup_creates_upcoming_partitions_and_moves_stray_rows(partitioned_engine):
+    now = datetime.now(timezone.utc)
+    current, _, _ = partitions.partition_range(now)
+    partitions.create_partitioned_messages(partitioned_engine)
+    # As if the process was down while the month began: its rows went to the default partition
+    with partitioned_engine.begin() as conn:
+        conn.execute(text(f"DROP TABLE {current}"))
+        insert_message(conn, now)
+
+    partitions.create_partitioned_messages(partitioned_engine)
+
+    names = [name for name, _, _ in partitions.list_partitions(partitioned_engine)]
+    assert names[0] == current
+    assert len(names) == partitions.PARTITIONS_AHEAD + 1
+    with partitioned_engine.connect() as conn:
+        assert count_rows(conn, current) == 1
+        assert count_rows(conn, "messages_default") == 0
+
+
+def test_expired_partitions_are_dropped_unless_they_hold_rows_to_keep(partitioned_engine):
+    partitions.create_partitioned_messages(partitioned_engine)
+    partitions.ensure_partitions(partitioned_engine, now=LONG_AGO)
+    expired, kept = partitions.partition_range(LONG_AGO)[0], partitions.partition_range(LONG_AGO + timedelta(days=31))[0]
+    with partitioned_engine.begin() as conn:
+        insert_message(conn, LONG_AGO)
+        insert_message(conn, LONG_AGO + timedelta(days=31))
+        insert_message(conn, LONG_AGO + timedelta(days=32), status=MessageStatus.QUEUED)
+
+    dropped = partitions.drop_expired_partitions(partitioned_engine, {MessageStatus.DELIVERED: 86400})
+
+    assert expired in dropped
+    assert kept not in dropped
+    names = [name for name, _, _ in partitions.list_partitions(partitioned_engine)]
+    assert expired not in names and kept in names
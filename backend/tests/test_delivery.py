@@ -0,0 +1,61 @@
+import threading
+import time
+
+from app.core.database import SessionLocal
+from app.models.database import Message, MessageStatus
+from app.workers.leasing import claim_due_messages
+from app.workers.message_delivery import MessageDeliveryWorker
+
+
+def test_outcomes_are_written_while_slow_recipients_are_in_flight(client, db, register, queue_messages, claim, sink):
+    fast = register("fast", webhook_url=f"{sink.url}/fast")
+    slow = register("slow", webhook_url=f"{sink.url}/slow")
+    for agent in (fast, slow):
+        client.put(f"/api/agents/{agent['agent_id']}/status", json={"status": "online"}, headers=agent["headers"])
+    [fast_id] = queue_messages("agent_sender", fast["agent_id"])
+    [slow_id] = queue_messages("agent_sender", slow["agent_id"])
+
+    worker = MessageDeliveryWorker()
+    messages = claim(worker.worker_id, [fast["agent_id"], slow["agent_id"]])
+    delivering = threading.Thread(target=worker.deliver_messages, args=(messages, db))
+    delivering.start()
+
+    with SessionLocal() as observer:
+        try:
+            for _ in range(50):
+                if observer.get(Message, fast_id).status == MessageStatus.DELIVERED:
+                    break
+                observer.expire_all()
+                time.sleep(0.1)
+            assert observer.get(Message, fast_id).status == MessageStatus.DELIVERED
+            assert observer.get(Message, slow_id).status == MessageStatus.QUEUED
+        finally:
+            sink.release.set()
+            delivering.join()
+
+        observer.expire_all()
+        assert observer.get(Message, slow_id).status == MessageStatus.DELIVERED
+
+
+def test_leases_are_renewed_while_a_page_is_in_flight(client, db, register, queue_messages, claim, sink):
+    slow = register("slow", webhook_url=f"{sink.url}/slow")
+    client.put(f"/api/agents/{slow['agent_id']}/status", json={"status": "online"}, headers=slow["headers"])
+    [message_id] = queue_messages("agent_sender", slow["agent_id"])
+
+    worker = MessageDeliveryWorker(lease_seconds=3)
+    messages = claim(worker.worker_id, [slow["agent_id"]], lease_seconds=3)
+    delivering = threading.Thread(target=worker.deliver_messages, args=(messages, db))
+    delivering.start()
+
+    with SessionLocal() as other:
+        try:
+            # Past the lease taken at claim time, the message is still held
+            time.sleep(4)
+            assert claim_due_messages(
+                other, "other-worker", 10, 60, filters=(Message.to_agent_id == slow["agent_id"],)
+            ) == []
+        finally:
+            sink.release.set()
+            delivering.join()
+
+        assert other.get(Message, message_id).status == MessageStatus.DELIVERED
@@ -0,0 +1,105 @@
+import time
+
+import fakeredis
+import pytest
+from sqlalchemy import event
+
+import app.main
+from app.core.database import engine
+from app.core.directory import AgentDirectory, agent_directory
+from app.core.security import generate_id
+from app.models.database import AgentStatus
+from app.workers.message_delivery import MessageDeliveryWorker
+
+
+def wait_for(condition, seconds: float = 5) -> bool:
+    deadline = time.monotonic() + seconds
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+class AgentQueries:
+    """Records the parameters of every statement that reads the agents table"""
+
+    def __init__(self):
+        self.parameters = []
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().startswith("SELECT") and "FROM agents" in statement:
+            self.parameters.append(set(parameters.values() if isinstance(parameters, dict) else parameters))
+
+    def __enter__(self):
+        event.listen(engine, "before_cursor_execute", self)
+        return self
+
+    def __exit__(self, *exc_info):
+        event.remove(engine, "before_cursor_execute", self)
+
+    def reading(self, agent_id: str) -> list:
+        return [parameters for parameters in self.parameters if agent_id in parameters]
+
+
+@pytest.fixture
+def directories(monkeypatch):
+    """The API's directory and a worker's, sharing one (fake) Redis"""
+    server = fakeredis.FakeServer()
+    api, worker = AgentDirectory(), AgentDirectory()
+    for directory in (api, worker):
+        directory.attach_redis(fakeredis.FakeRedis(server=server, decode_responses=True))
+    redis_client = api.cache.redis_client
+    assert wait_for(lambda: redis_client.pubsub_numsub(api.cache.channel)[0][1] == 2)
+    monkeypatch.setattr(app.main, "agent_directory", api)
+    return api, worker
+
+
+def test_unknown_ids_are_cached(db):
+    directory = AgentDirectory()
+    agent_id = generate_id()
+
+    with AgentQueries() as queries:
+        assert directory.load(db, [agent_id]) == {}
+        assert directory.load(db, [agent_id]) == {}
+
+    assert len(queries.reading(agent_id)) == 1
+    assert directory.cache.local.get(agent_id) == {}
+
+
+def test_registering_invalidates_a_cached_unknown_id(client, db, monkeypatch, directories):
+    _, worker = directories
+    agent_id = generate_id()
+    assert worker.load(db, [agent_id]) == {}
+
+    monkeypatch.setattr(app.main, "generate_id", lambda: agent_id)
+    client.post("/api/agents/register", json={"name": "late", "description": "registered after a send"})
+
+    assert wait_for(lambda: worker.cache.local.get(agent_id) is None)
+    assert worker.load(db, [agent_id])[agent_id].status == AgentStatus.OFFLINE
+
+
+def test_status_change_invalidates_every_directory(client, db, register, directories):
+    _, worker = directories
+    agent = register("agent")
+    assert worker.load(db, [agent["agent_id"]])[agent["agent_id"]].status == AgentStatus.OFFLINE
+
+    client.put(f"/api/agents/{agent['agent_id']}/status", json={"status": "online"}, headers=agent["headers"])
+
+    assert wait_for(lambda: worker.cache.local.get(agent["agent_id"]) is None)
+    assert worker.load(db, [agent["agent_id"]])[agent["agent_id"]].status == AgentStatus.ONLINE
+
+
+def test_worker_loads_a_page_of_recipients_with_one_query(db, register, queue_messages, claim):
+    recipients = [register(f"recipient{n}")["agent_id"] for n in range(3)]
+    for agent_id in recipients:
+        queue_messages("agent_sender", agent_id, count=2)
+        agent_directory.forget(agent_id)
+    worker = MessageDeliveryWorker()
+    messages = claim(worker.worker_id, recipients)
+
+    with AgentQueries() as queries:
+        worker.deliver_messages(messages, db)
+
+    [prefetch] = [parameters for parameters in queries.parameters if parameters & set(recipients)]
+    assert set(recipients) <= prefetch
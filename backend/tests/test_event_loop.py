@@ -0,0 +1,66 @@
+import asyncio
+
+import fakeredis
+import pytest
+
+import app.main
+from app.core.directory import agent_directory
+from app.core.notifier import inbox_notifier
+from app.core.receipts import delivery_receipts
+from app.core.security import auth_cache
+from app.core.status_events import status_events
+from app.core.streams import DeliveryStream
+
+
+class LoopCheckingRedis(fakeredis.FakeRedis):
+    """Records commands issued from a thread running an event loop"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.on_loop = []
+
+    def execute_command(self, *args, **options):
+        try:
+            asyncio.get_running_loop()
+            self.on_loop.append(args[0])
+        except RuntimeError:
+            pass
+        return super().execute_command(*args, **options)
+
+
+@pytest.fixture
+def redis_client(monkeypatch):
+    """Shared Redis for the API's caches and feeds, without their listener threads"""
+    client = LoopCheckingRedis(decode_responses=True)
+    monkeypatch.setattr(auth_cache, "redis_client", client)
+    monkeypatch.setattr(agent_directory.cache, "redis_client", client)
+    monkeypatch.setattr(inbox_notifier, "redis_client", client)
+    monkeypatch.setattr(status_events, "redis_client", client)
+    monkeypatch.setattr(delivery_receipts, "stream", DeliveryStream(client))
+    monkeypatch.setattr(app.main, "delivery_stream", DeliveryStream(client))
+    auth_cache.local.clear()
+    yield client
+    auth_cache.local.clear()
+
+
+def test_async_handlers_keep_redis_off_the_event_loop(client, register, redis_client):
+    sender, recipient = register("sender", delivery_receipts=True), register("recipient")
+
+    with client.websocket_connect("/api/messages/stream", headers=recipient["headers"]) as websocket:
+        client.post(
+            "/api/messages/send",
+            json={"to_agent_id": recipient["agent_id"], "message_content": {"n": 1}},
+            headers=sender["headers"]
+        )
+        frame = websocket.receive_json()
+        websocket.send_json({"type": "ack", "message_ids": [frame["message_id"]]})
+        websocket.send_json({"type": "ping"})
+        assert websocket.receive_json() == {"type": "pong"}
+
+    client.put(f"/api/agents/{sender['agent_id']}/status", json={"status": "online"}, headers=sender["headers"])
+    client.get("/api/messages/inbox", headers=sender["headers"])
+
+    assert redis_client.on_loop == []
+    # The calls did happen, off the loop
+    assert redis_client.xlen(status_events.stream) >= 2
+    assert redis_client.exists(f"auth:{app.main.hash_api_key(sender['api_key'])}")
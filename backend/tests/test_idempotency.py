@@ -0,0 +1,60 @@
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import update
+
+from app.models.database import IdempotencyKey, Message
+
+
+def send(client, sender, recipient, key, content):
+    return client.post(
+        "/api/messages/send",
+        json={"to_agent_id": recipient["agent_id"], "message_content": content},
+        headers={**sender["headers"], "Idempotency-Key": key}
+    )
+
+
+def test_repeated_send_returns_original_message(client, register, db):
+    sender, recipient = register("sender"), register("recipient")
+
+    first = send(client, sender, recipient, "order-1", {"n": 1})
+    again = send(client, sender, recipient, "order-1", {"n": 1})
+
+    assert first.status_code == again.status_code == 200
+    assert again.headers["Idempotent-Replayed"] == "true"
+    assert again.json()["message_id"] == first.json()["message_id"]
+    assert db.query(Message).filter(Message.to_agent_id == recipient["agent_id"]).count() == 1
+
+
+def test_key_reused_for_different_request(client, register):
+    sender, recipient = register("sender"), register("recipient")
+
+    send(client, sender, recipient, "order-2", {"n": 1})
+    conflict = send(client, sender, recipient, "order-2", {"n": 2})
+
+    assert conflict.status_code == 422
+
+
+def test_keys_are_scoped_to_the_sender(client, register):
+    first_sender, second_sender, recipient = register("first"), register("second"), register("recipient")
+
+    first = send(client, first_sender, recipient, "order-3", {"n": 1})
+    second = send(client, second_sender, recipient, "order-3", {"n": 1})
+
+    assert "Idempotent-Replayed" not in second.headers
+    assert second.json()["message_id"] != first.json()["message_id"]
+
+
+def test_expired_key_queues_a_new_message(client, register, db):
+    sender, recipient = register("sender"), register("recipient")
+    first = send(client, sender, recipient, "order-4", {"n": 1})
+
+    db.execute(
+        update(IdempotencyKey)
+        .where(IdempotencyKey.agent_id == sender["agent_id"])
+        .values(expires_at=datetime.now(timezone.utc) - timedelta(seconds=1))
+    )
+    db.commit()
+
+    again = send(client, sender, recipient, "order-4", {"n": 1})
+    assert "Idempotent-Replayed" not in again.headers
+    assert again.json()["message_id"] != first.json()["message_id"]
@@ -0,0 +1,155 @@
+import threading
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import event, update
+
+from app.core.database import SessionLocal
+from app.core.receipts import SYSTEM_AGENT_ID
+from app.core.security import generate_id
+from app.models.database import Message, MessageStatus
+from app.workers.leasing import claim_due_messages, mark_delivered, write_back
+from app.workers.message_delivery import MessageDeliveryWorker
+
+
+def steal_leases(db, message_ids, owner="other-worker"):
+    db.execute(
+        update(Message)
+        .where(Message.id.in_(message_ids))
+        .values(lease_owner=owner, lease_expires_at=datetime.now(timezone.utc) + timedelta(minutes=5))
+    )
+    db.commit()
+
+
+def test_claim_gives_each_sender_a_turn(db, queue_messages, claim):
+    recipient = generate_id()
+    now = datetime.now(timezone.utc)
+    # The heavy sender's backlog is all older than the light sender's message
+    queue_messages("agent_heavy", recipient, count=10, next_attempt_at=now - timedelta(minutes=5))
+    [light] = queue_messages("agent_light", recipient)
+
+    page = claim("worker-a", [recipient], limit=2)
+
+    assert light in [message.id for message in page]
+    assert Counter(message.from_agent_id for message in page) == {"agent_heavy": 1, "agent_light": 1}
+
+
+def test_claim_gives_higher_priorities_more_slots(db, queue_messages, claim):
+    recipient = generate_id()
+    queue_messages("agent_high", recipient, count=5, priority=2)
+    queue_messages("agent_normal", recipient, count=5, priority=1)
+
+    page = claim("worker-a", [recipient], limit=5)
+
+    # High priority costs a quarter of normal: four of its messages per normal one
+    assert Counter(message.from_agent_id for message in page) == {"agent_high": 4, "agent_normal": 1}
+    assert [message.priority for message in page] == [2, 2, 2, 2, 1]
+
+
+def test_claim_skips_messages_not_due_or_leased(db, queue_messages, claim):
+    recipient = generate_id()
+    now = datetime.now(timezone.utc)
+    [due] = queue_messages("agent_sender", recipient)
+    queue_messages("agent_sender", recipient, next_attempt_at=now + timedelta(minutes=5))
+    queue_messages("agent_sender", recipient, next_attempt_at=None)
+    [leased] = queue_messages("agent_sender", recipient)
+    steal_leases(db, [leased])
+
+    assert [message.id for message in claim("worker-a", [recipient])] == [due]
+
+
+def deliver_page(db, owner, recipient):
+    """Claim a page for the recipient and mark it delivered, releasing the leases; returns its ids"""
+    page = [message.id for message in claim_due_messages(
+        db, owner, 5, 60, filters=(Message.to_agent_id == recipient,)
+    )]
+    mark_delivered(db, owner, page, datetime.now(timezone.utc))
+    db.commit()
+    return page
+
+
+def test_stale_candidates_are_not_leased_again(db, queue_messages):
+    recipient = generate_id()
+    [message_id] = queue_messages("agent_sender", recipient)
+    delivered = None
+
+    def deliver_elsewhere(orm_execute_state):
+        # Between this worker reading its candidates and leasing them
+        nonlocal delivered
+        if orm_execute_state.is_update and delivered is None:
+            with SessionLocal() as other:
+                delivered = deliver_page(other, "worker-a", recipient)
+
+    with SessionLocal() as stale:
+        event.listen(stale, "do_orm_execute", deliver_elsewhere)
+        page = [message.id for message in claim_due_messages(
+            stale, "worker-b", 5, 60, filters=(Message.to_agent_id == recipient,)
+        )]
+
+    if db.get_bind().dialect.name == "sqlite":
+        # No row locks, so the other worker gets it first
+        assert delivered == [message_id]
+    else:
+        # The candidate is locked, so the other worker skips it
+        assert delivered == []
+    assert page == ([] if delivered else [message_id])
+
+
+def test_concurrent_claims_deliver_each_message_once(db, queue_messages):
+    recipient = generate_id()
+    message_ids = queue_messages("agent_sender", recipient, count=40)
+    start = threading.Barrier(3)
+    pages = []
+
+    def work(owner):
+        with SessionLocal() as session:
+            start.wait()
+            while page := deliver_page(session, owner, recipient):
+                pages.append(page)
+
+    workers = [threading.Thread(target=work, args=(f"worker-{n}",)) for n in range(3)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    claimed = [message_id for page in pages for message_id in page]
+    assert sorted(claimed) == sorted(message_ids)
+
+
+def test_write_back_skips_messages_whose_lease_was_lost(db, queue_messages, claim):
+    kept, lost = queue_messages("agent_sender", "agent_wb", count=2)
+    claim("worker-a", ["agent_wb"])
+    steal_leases(db, [lost])
+
+    written = write_back(db, "worker-a", [
+        {"id": message_id, "status": MessageStatus.FAILED, "error_message": "gone", "next_attempt_at": None}
+        for message_id in (kept, lost)
+    ])
+    db.commit()
+
+    assert written == [kept]
+    db.expire_all()
+    assert db.get(Message, kept).status == MessageStatus.FAILED
+    assert db.get(Message, kept).lease_owner is None
+    stolen = db.get(Message, lost)
+    assert stolen.status == MessageStatus.QUEUED
+    assert stolen.lease_owner == "other-worker"
+
+
+def test_no_failed_receipt_for_a_lost_lease(db, register, queue_messages, claim):
+    sender = register("sender", delivery_receipts=True)
+    kept, lost = queue_messages(sender["agent_id"], "agent_never_registered", count=2)
+    worker = MessageDeliveryWorker()
+    messages = claim(worker.worker_id, ["agent_never_registered"])
+    steal_leases(db, [lost])
+
+    # Unknown recipients fail without a webhook call
+    worker.deliver_messages(messages, db)
+
+    receipts = db.query(Message).filter(
+        Message.from_agent_id == SYSTEM_AGENT_ID,
+        Message.to_agent_id == sender["agent_id"]
+    ).all()
+    assert [receipt.message_content.count(kept.encode()) for receipt in receipts] == [1]
+    assert db.get(Message, lost).status == MessageStatus.QUEUED
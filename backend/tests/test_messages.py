@@ -0,0 +1,70 @@
+from app.models.database import Message, MessageStatus
+
+
+def test_send_message_queues_for_recipient(client, register, db):
+    sender, recipient = register("sender"), register("recipient")
+
+    response = client.post(
+        "/api/messages/send",
+        json={"to_agent_id": recipient["agent_id"], "message_content": {"text": "hello"}, "priority": "high"},
+        headers=sender["headers"]
+    )
+    assert response.status_code == 200, response.text
+    message_id = response.json()["message_id"]
+
+    message = db.get(Message, message_id)
+    assert message.status == MessageStatus.QUEUED
+    assert message.from_agent_id == sender["agent_id"]
+    assert message.next_attempt_at is not None  # due for the worker right away
+    assert message.created_at.tzinfo is None  # stored as naive UTC
+
+    status = client.get(f"/api/messages/{message_id}", headers=recipient["headers"]).json()
+    assert status["status"] == "queued"
+    assert status["priority"] == "high"
+
+
+def test_send_message_to_unknown_agent(client, register):
+    sender = register("sender")
+
+    response = client.post(
+        "/api/messages/send",
+        json={"to_agent_id": "agent_missing", "message_content": {}},
+        headers=sender["headers"]
+    )
+    assert response.status_code == 404
+
+
+def test_inbox_and_ack_deliver(client, register):
+    sender, recipient = register("sender"), register("recipient")
+    client.put(f"/api/agents/{recipient['agent_id']}/status", json={"status": "online"}, headers=recipient["headers"])
+    message_id = client.post(
+        "/api/messages/send",
+        json={"to_agent_id": recipient["agent_id"], "message_content": {"n": 1}},
+        headers=sender["headers"]
+    ).json()["message_id"]
+
+    inbox = client.get("/api/messages/inbox", headers=recipient["headers"]).json()["messages"]
+    assert [message["message_id"] for message in inbox] == [message_id]
+    assert inbox[0]["message_content"] == {"n": 1}
+
+    ack = client.post("/api/messages/ack", json={"message_ids": [message_id]}, headers=recipient["headers"])
+    assert ack.json() == {"acknowledged": 1}
+    assert client.get(f"/api/messages/{message_id}", headers=sender["headers"]).json()["status"] == "delivered"
+
+
+def test_push_channel_presence(client, register):
+    sender, recipient = register("sender"), register("recipient")
+
+    with client.websocket_connect("/api/messages/stream", headers=recipient["headers"]) as websocket:
+        # Presence is recorded before the session starts answering frames
+        websocket.send_json({"type": "ping"})
+        assert websocket.receive_json() == {"type": "pong"}
+        assert client.get(f"/api/agents/{recipient['agent_id']}").json()["status"] == "online"
+        client.post(
+            "/api/messages/send",
+            json={"to_agent_id": recipient["agent_id"], "message_content": {"n": 2}},
+            headers=sender["headers"]
+        )
+        frame = websocket.receive_json()
+        assert frame["type"] == "message"
+        assert frame["message_content"] == {"n": 2}
@@ -0,0 +1,47 @@
+import requests
+from prometheus_client.parser import text_string_to_metric_families
+
+from app.core.metrics import render_metrics
+from app.workers.message_delivery import MessageDeliveryWorker
+from app.workers.metrics_server import start_metrics_server
+
+
+def parse(text: str) -> dict:
+    """Sample values keyed by (name, sorted labels)"""
+    return {
+        (sample.name, tuple(sorted(sample.labels.items()))): sample.value
+        for family in text_string_to_metric_families(text)
+        for sample in family.samples
+    }
+
+
+def increase(before: dict, after: dict, name: str, **labels) -> float:
+    key = (name, tuple(sorted(labels.items())))
+    return after.get(key, 0) - before.get(key, 0)
+
+
+def test_scrape_shows_sends_deliveries_retries_and_webhook_latency(client, db, register, claim, sink):
+    sender = register("sender")
+    recipient = register("recipient", webhook_url=f"{sink.url}/hook")
+    client.put(f"/api/agents/{recipient['agent_id']}/status", json={"status": "online"}, headers=recipient["headers"])
+    sink.reply = lambda body: (503, b"") if b'"fail"' in body else (200, b"")
+    # The worker's metrics endpoint; in this process it renders the same registry as the API's
+    server = start_metrics_server("127.0.0.1", 0, {"/metrics": render_metrics})
+    worker_metrics = f"http://127.0.0.1:{server.server_address[1]}/metrics"
+    before = parse(requests.get(worker_metrics).text)
+
+    for content in ({"text": "hi"}, {"fail": True}):
+        response = client.post("/api/messages/send", json={"to_agent_id": recipient["agent_id"], "message_content": content}, headers=sender["headers"])
+        assert response.status_code == 200, response.text
+    worker = MessageDeliveryWorker()
+    worker.deliver_messages(claim(worker.worker_id, [recipient["agent_id"]]), db)
+
+    api = parse(client.get("/metrics").text)
+    scraped = parse(requests.get(worker_metrics).text)
+    server.shutdown()
+    assert increase(before, api, "agentconnect_messages_sent_total", endpoint="send") == 2
+    assert increase(before, scraped, "agentconnect_delivery_attempts_total", outcome="delivered") == 1
+    assert increase(before, scraped, "agentconnect_delivery_attempts_total", outcome="retry") == 1
+    assert increase(before, scraped, "agentconnect_webhook_request_seconds_count", status="200") == 1
+    assert increase(before, scraped, "agentconnect_webhook_request_seconds_count", status="503") == 1
+    assert increase(before, scraped, "agentconnect_delivery_latency_seconds_count", channel="webhook") == 1
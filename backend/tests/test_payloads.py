@@ -0,0 +1,52 @@
+import json
+
+import pytest
+
+from app.core.payloads import UndecodableContent, compress, decode_content
+from app.models.database import Message, MessageStatus
+from app.workers.message_delivery import MessageDeliveryWorker
+
+
+def test_large_contents_are_gzipped_by_default():
+    raw = json.dumps({"text": "hello " * 500}).encode()
+
+    encoded = compress(raw)
+
+    assert encoded.encoding == "gzip"
+    assert decode_content(encoded.data, encoded.encoding) == raw
+
+
+@pytest.mark.parametrize("data, encoding", [(b"not gzip", "gzip"), (b"not zstd", "zstd"), (b"{}", "brotli")])
+def test_undecodable_contents_raise_one_error_type(data, encoding):
+    with pytest.raises(UndecodableContent):
+        decode_content(data, encoding)
+
+
+@pytest.mark.parametrize("delivery_batch_size", [None, 5])
+def test_undecodable_message_fails_without_holding_up_its_page(client, db, register, queue_messages, claim, sink, delivery_batch_size):
+    recipient = register("recipient", webhook_url=f"{sink.url}/hook", delivery_batch_size=delivery_batch_size)
+    client.put(f"/api/agents/{recipient['agent_id']}/status", json={"status": "online"}, headers=recipient["headers"])
+    good = queue_messages("agent_sender", recipient["agent_id"], count=2)
+    [bad] = queue_messages("agent_sender", recipient["agent_id"], message_content=b"not zstd", content_encoding="zstd")
+
+    worker = MessageDeliveryWorker()
+    worker.deliver_messages(claim(worker.worker_id, [recipient["agent_id"]]), db)
+
+    db.expire_all()
+    assert [db.get(Message, message_id).status for message_id in good] == [MessageStatus.DELIVERED] * 2
+    failed = db.get(Message, bad)
+    assert failed.status == MessageStatus.FAILED
+    assert failed.lease_owner is None
+    assert "zstd" in failed.error_message
+
+
+def test_inbox_skips_and_fails_undecodable_messages(client, db, register, queue_messages):
+    recipient = register("recipient")
+    [good] = queue_messages("agent_sender", recipient["agent_id"])
+    [bad] = queue_messages("agent_sender", recipient["agent_id"], message_content=b"not gzip", content_encoding="gzip")
+
+    inbox = client.get("/api/messages/inbox", headers=recipient["headers"]).json()["messages"]
+
+    assert [message["message_id"] for message in inbox] == [good]
+    db.expire_all()
+    assert db.get(Message, bad).status == MessageStatus.FAILED
@@ -0,0 +1,79 @@
+import time
+
+import fakeredis
+import pytest
+
+from app.core.rate_limit import RateLimiter
+from app.models.database import Agent
+
+
+@pytest.fixture(params=["memory", "redis"])
+def limiter(request):
+    """Two requests per second by default; the endpoint below gets its own three per second"""
+    limiter = RateLimiter(default_limit=(2, 1), endpoint_limits={"POST /api/messages/send": (3, 1)})
+    if request.param == "redis":
+        limiter.attach_redis(fakeredis.FakeRedis(decode_responses=True))
+    return limiter
+
+
+def hits(limiter, count, endpoint="GET /api/messages/inbox", **kwargs):
+    return [limiter.check("agent_a", endpoint, **kwargs) for _ in range(count)]
+
+
+def test_bucket_empties_then_refuses(limiter):
+    first, second, third = hits(limiter, 3)
+
+    assert (first.allowed, first.limit, first.remaining) == (True, 2, 1)
+    assert (second.allowed, second.remaining) == (True, 0)
+    assert (third.allowed, third.remaining) == (False, 0)
+    assert third.retry_after == pytest.approx(0.5, abs=0.05)
+    assert third.reset_after == pytest.approx(1, abs=0.05)
+
+
+def test_bucket_refills_over_the_window(limiter):
+    hits(limiter, 2)
+
+    time.sleep(0.6)
+
+    [refilled, empty] = hits(limiter, 2)
+    assert refilled.allowed
+    assert not empty.allowed
+
+
+def test_endpoint_limits_have_their_own_bucket(limiter):
+    sends = hits(limiter, 4, endpoint="POST /api/messages/send")
+
+    assert [result.allowed for result in sends] == [True, True, True, False]
+    assert hits(limiter, 1)[0].allowed
+
+
+def test_agent_override_sets_the_default_bucket_only(limiter):
+    results = hits(limiter, 6, agent_limit=5)
+
+    assert [result.allowed for result in results] == [True] * 5 + [False]
+    assert results[0].limit == 5
+    assert hits(limiter, 1, endpoint="POST /api/messages/send", agent_limit=5)[0].limit == 3
+
+
+def test_agents_are_limited_separately(limiter):
+    hits(limiter, 3)
+
+    assert limiter.check("agent_b", "GET /api/messages/inbox").allowed
+
+
+def test_exceeding_the_limit_returns_429_with_headers(client, db, register):
+    agent = register("agent")
+    # Before its first request, so the override is in the cached auth snapshot
+    db.get(Agent, agent["agent_id"]).rate_limit = 2
+    db.commit()
+
+    first, second, third = [client.get("/api/messages/inbox", headers=agent["headers"]) for _ in range(3)]
+
+    assert first.status_code == second.status_code == 200
+    assert first.headers["X-RateLimit-Limit"] == "2"
+    assert [first.headers["X-RateLimit-Remaining"], second.headers["X-RateLimit-Remaining"]] == ["1", "0"]
+    assert "Retry-After" not in first.headers
+    assert third.status_code == 429
+    assert third.headers["X-RateLimit-Remaining"] == "0"
+    assert int(third.headers["Retry-After"]) > 0
+    assert int(third.headers["X-RateLimit-Reset"]) >= int(third.headers["Retry-After"])
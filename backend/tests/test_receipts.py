@@ -0,0 +1,83 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from app.core.receipts import SYSTEM_AGENT_ID, Outcome, delivery_receipts
+from app.main import MAX_STATUS_IDS
+from app.models.database import Message, MessageStatus
+
+
+@pytest.fixture
+def woken(monkeypatch):
+    """Receipt rows handed to _wake, one list per commit"""
+    calls = []
+    monkeypatch.setattr(delivery_receipts, "_wake", calls.append)
+    return calls
+
+
+def outcome(sender: dict, message_id: str) -> Outcome:
+    return Outcome(message_id, sender["agent_id"], "agent_recipient", MessageStatus.DELIVERED, datetime.now(timezone.utc))
+
+
+def test_receipts_of_one_transaction_wake_once(db, register, woken):
+    sender = register("sender", delivery_receipts=True)
+
+    delivery_receipts.queue(db, [outcome(sender, "msg_a")])
+    delivery_receipts.queue(db, [outcome(sender, "msg_b")])
+    db.commit()
+    db.commit()
+
+    [rows] = woken
+    assert len(rows) == 2
+    assert {row["to_agent_id"] for row in rows} == {sender["agent_id"]}
+    assert len(db.dispatch.after_commit) == 1
+
+
+def test_rolled_back_receipts_are_not_woken(db, register, woken):
+    sender = register("sender", delivery_receipts=True)
+
+    delivery_receipts.queue(db, [outcome(sender, "msg_rolled_back")])
+    db.rollback()
+    delivery_receipts.queue(db, [outcome(sender, "msg_committed")])
+    db.commit()
+
+    [[row]] = woken
+    receipt = db.get(Message, row["id"])
+    assert receipt.from_agent_id == SYSTEM_AGENT_ID
+    assert b"msg_committed" in receipt.message_content
+    assert db.query(Message).filter(Message.to_agent_id == sender["agent_id"]).count() == 1
+
+
+def get_statuses(client, agent, message_ids):
+    return client.post("/api/messages/status", json={"message_ids": message_ids}, headers=agent["headers"])
+
+
+def test_bulk_status_follows_the_request_order(client, register, queue_messages):
+    sender, recipient = register("sender"), register("recipient")
+    first, second = queue_messages(sender["agent_id"], recipient["agent_id"], count=2)
+    [delivered] = queue_messages(sender["agent_id"], recipient["agent_id"], status=MessageStatus.DELIVERED)
+
+    response = get_statuses(client, sender, [delivered, "msg_missing", first, delivered, second])
+
+    assert response.status_code == 200, response.text
+    body = response.json()
+    assert [message["message_id"] for message in body["messages"]] == [delivered, first, second]
+    assert [message["status"] for message in body["messages"]] == ["delivered", "queued", "queued"]
+    assert body["not_found"] == ["msg_missing"]
+
+
+def test_bulk_status_only_reports_the_callers_messages(client, register, queue_messages):
+    sender, recipient, other = register("sender"), register("recipient"), register("other")
+    [message_id] = queue_messages(sender["agent_id"], recipient["agent_id"])
+
+    assert get_statuses(client, recipient, [message_id]).json()["messages"][0]["message_id"] == message_id
+    assert get_statuses(client, other, [message_id]).json() == {"messages": [], "not_found": [message_id]}
+
+
+@pytest.mark.parametrize("count", [0, MAX_STATUS_IDS + 1])
+def test_bulk_status_limits_the_number_of_ids(client, register, count):
+    agent = register("agent")
+
+    response = get_statuses(client, agent, [f"msg_{n}" for n in range(count)])
+
+    assert response.status_code == 422
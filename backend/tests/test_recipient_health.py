@@ -0,0 +1,114 @@
+import time
+
+from prometheus_client import CollectorRegistry
+
+from app.core.metrics import GaugeCollector, render_metrics
+from app.workers.message_delivery import MessageDeliveryWorker
+from app.workers.recipient_health import BreakerState, HealthTracker
+
+COOLDOWN = 0.05
+
+
+def tracker(**kwargs) -> HealthTracker:
+    return HealthTracker(**{"failure_threshold": 3, "base_cooldown": COOLDOWN, "max_cooldown": 4 * COOLDOWN, **kwargs})
+
+
+def fail(health: HealthTracker, times: int = 1):
+    for _ in range(times):
+        health.record("agent_x", ok=False, elapsed=0.01)
+
+
+def state(health: HealthTracker) -> str:
+    return health.snapshot()["agent_x"]["state"]
+
+
+def test_breaker_opens_after_consecutive_failures_only():
+    health = tracker()
+    fail(health, 2)
+    health.record("agent_x", ok=True, elapsed=0.01)
+    fail(health, 2)
+    assert state(health) == BreakerState.CLOSED
+
+    fail(health)
+
+    assert state(health) == BreakerState.OPEN
+    assert health.acquire("agent_x", in_flight=0) is None
+    assert 0 < health.retry_at("agent_x") <= 1
+
+
+def test_breaker_goes_half_open_then_closes_on_a_successful_probe():
+    health = tracker()
+    fail(health, 3)
+
+    time.sleep(COOLDOWN * 1.5)
+
+    assert state(health) == BreakerState.HALF_OPEN
+    assert health.acquire("agent_x", in_flight=0) is True
+    # A single probe at a time
+    assert health.acquire("agent_x", in_flight=0) is None
+    health.record("agent_x", ok=True, elapsed=0.01)
+    assert state(health) == BreakerState.CLOSED
+    assert health.acquire("agent_x", in_flight=0) is True
+
+
+def test_failed_probe_reopens_with_a_doubled_cooldown():
+    health = tracker()
+    fail(health, 3)
+    time.sleep(COOLDOWN * 1.5)
+    health.acquire("agent_x", in_flight=0)
+
+    fail(health)
+
+    assert state(health) == BreakerState.OPEN
+    time.sleep(COOLDOWN * 1.5)
+    assert state(health) == BreakerState.OPEN
+    time.sleep(COOLDOWN)
+    assert state(health) == BreakerState.HALF_OPEN
+
+
+def test_concurrency_grows_additively_and_halves_on_failure():
+    health = tracker(max_concurrency=8, failure_threshold=100)
+
+    def limit() -> int:
+        return health.snapshot()["agent_x"]["concurrency_limit"]
+
+    limits = []
+    for _ in range(9):
+        health.record("agent_x", ok=True, elapsed=0.01)
+        limits.append(limit())
+    # Roughly one more per limit's worth of successes
+    assert limits == [2, 2, 2, 3, 3, 3, 4, 4, 4]
+    assert health.acquire("agent_x", in_flight=3) is True
+    assert health.acquire("agent_x", in_flight=4) is False
+
+    fail(health)
+    assert limit() == 2
+    fail(health, 5)
+    assert limit() == 1
+
+
+def test_concurrency_is_capped():
+    health = tracker(max_concurrency=3)
+
+    for _ in range(50):
+        health.record("agent_x", ok=True, elapsed=0.01)
+
+    assert health.snapshot()["agent_x"]["concurrency_limit"] == 3
+
+
+def test_breaker_gauge_counts_recipients_by_state():
+    worker = MessageDeliveryWorker()
+    worker.health = tracker()
+    for agent_id in ("agent_a", "agent_b"):
+        worker.health.record(agent_id, ok=True, elapsed=0.01)
+    for _ in range(3):
+        worker.health.record("agent_c", ok=False, elapsed=None)
+    registry = CollectorRegistry()
+    registry.register(GaugeCollector("agentconnect_recipient_breakers", "Recipients by breaker state", "state", worker.breaker_counts))
+
+    body, _ = render_metrics(registry)
+
+    lines = body.decode().splitlines()
+    assert 'agentconnect_recipient_breakers{state="closed"} 2.0' in lines
+    assert 'agentconnect_recipient_breakers{state="open"} 1.0' in lines
+    assert 'agentconnect_recipient_breakers{state="half_open"} 0.0' in lines
@@ -0,0 +1,113 @@
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app.models.database import Message
+from app.workers.message_delivery import MessageDeliveryWorker
+from app.workers.scheduler import DueTimeHeap
+
+
+def timed_wait(heap: DueTimeHeap, max_wait: float) -> float:
+    started = time.monotonic()
+    heap.wait(max_wait)
+    return time.monotonic() - started
+
+
+def test_wakes_at_the_earliest_future_due_time():
+    heap = DueTimeHeap()
+    now = datetime.now(timezone.utc)
+    heap.push(now + timedelta(seconds=30))
+    heap.push(now + timedelta(seconds=10))
+
+    assert heap.seconds_until_next(60, now=now) == 10
+    assert heap.seconds_until_next(5, now=now) == 5
+    heap.pop_due(now + timedelta(seconds=10))
+    assert heap.seconds_until_next(60, now=now) == 30
+    assert len(heap) == 1
+
+
+def test_overdue_and_repeated_due_times():
+    heap = DueTimeHeap()
+    now = datetime.now(timezone.utc)
+    past = now - timedelta(seconds=5)
+    # Naive datetimes, as read back from the database, are UTC
+    heap.push(past.replace(tzinfo=None))
+    heap.push(past)
+    heap.push(None)
+
+    assert len(heap) == 1
+    assert heap.seconds_until_next(60, now=now) == 0
+    heap.pop_due(now)
+    assert heap.seconds_until_next(60, now=now) == 60
+
+
+def test_wait_ends_at_the_next_due_time():
+    heap = DueTimeHeap()
+    heap.push(datetime.now(timezone.utc) + timedelta(seconds=0.1))
+
+    assert 0.05 <= timed_wait(heap, 5) < 1
+    assert timed_wait(DueTimeHeap(), 0.1) >= 0.1
+
+
+def test_earlier_due_time_interrupts_a_long_wait():
+    heap = DueTimeHeap()
+    heap.push(datetime.now(timezone.utc) + timedelta(seconds=30))
+    waited = []
+    sleeper = threading.Thread(target=lambda: waited.append(timed_wait(heap, 10)))
+    sleeper.start()
+    time.sleep(0.1)
+
+    # A later due time changes nothing; an earlier one shortens the sleep
+    heap.push(datetime.now(timezone.utc) + timedelta(seconds=60))
+    heap.push(datetime.now(timezone.utc) + timedelta(seconds=0.1))
+    sleeper.join(5)
+
+    assert 0.2 <= waited[0] < 1
+
+
+def test_wake_ends_a_wait():
+    heap = DueTimeHeap()
+    waited = []
+    sleeper = threading.Thread(target=lambda: waited.append(timed_wait(heap, 10)))
+    sleeper.start()
+    time.sleep(0.05)
+
+    heap.wake()
+    sleeper.join(5)
+
+    assert waited[0] < 1
+
+
+@pytest.fixture
+def failing_recipient(client, register, sink):
+    recipient = register("recipient", webhook_url=f"{sink.url}/hook")
+    client.put(f"/api/agents/{recipient['agent_id']}/status", json={"status": "online"}, headers=recipient["headers"])
+    sink.reply = lambda body: (503, b"")
+    return recipient
+
+
+def test_failed_delivery_schedules_its_retry_backoff(db, queue_messages, claim, failing_recipient):
+    [message_id] = queue_messages("agent_sender", failing_recipient["agent_id"])
+    worker = MessageDeliveryWorker()
+
+    worker.deliver_messages(claim(worker.worker_id, [failing_recipient["agent_id"]]), db)
+
+    db.expire_all()
+    next_attempt_at = db.get(Message, message_id).next_attempt_at
+    assert worker.due_times.next_due() == next_attempt_at.replace(tzinfo=timezone.utc)
+    assert worker.due_times.seconds_until_next(3600) == pytest.approx(worker.retry_delays[0], abs=2)
+
+
+def test_future_dated_message_sets_the_wake_up_time(db, queue_messages, claim, failing_recipient):
+    worker = MessageDeliveryWorker(poll_interval=30)
+    due_at = datetime.now(timezone.utc) + timedelta(seconds=5)
+    [message_id] = queue_messages("agent_sender", failing_recipient["agent_id"], next_attempt_at=due_at)
+    worker.last_sweep = time.monotonic()
+
+    assert claim(worker.worker_id, [failing_recipient["agent_id"]]) == []
+    # As the sweep does with the earliest due time in the database
+    worker.due_times.push(db.get(Message, message_id).next_attempt_at)
+
+    assert worker.seconds_until_sweep() == pytest.approx(5, abs=1)
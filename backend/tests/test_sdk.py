@@ -0,0 +1,208 @@
+import asyncio
+import http.server
+import json
+import threading
+import time
+
+import pytest
+import requests
+import websockets
+
+from sdk import AgentConnectClient, AsyncAgentConnectClient
+
+
+class ScriptedHandler(http.server.BaseHTTPRequestHandler):
+    def handle_request(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        server = self.server
+        with server.lock:
+            server.requests.append({"method": self.command, "path": self.path, "headers": self.headers, "at": time.monotonic()})
+            status, headers, body, delay = server.replies.pop(0) if server.replies else (200, {}, {}, 0)
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+        time.sleep(delay)
+        with server.lock:
+            server.in_flight -= 1
+
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    do_GET = do_POST = do_PUT = handle_request
+
+    def log_message(self, *args):
+        pass
+
+
+class ScriptedAPI(http.server.ThreadingHTTPServer):
+    """Answers requests with the queued replies in order, then with 200 {}; records every request"""
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), ScriptedHandler)
+        self.url = f"http://127.0.0.1:{self.server_address[1]}"
+        self.lock = threading.Lock()
+        self.requests = []
+        self.replies = []
+        self.in_flight = self.max_in_flight = 0
+
+    def reply(self, status: int = 200, body=None, headers=None, delay: float = 0):
+        self.replies.append((status, headers or {}, {} if body is None else body, delay))
+
+    def gaps(self) -> list:
+        return [later["at"] - earlier["at"] for earlier, later in zip(self.requests, self.requests[1:])]
+
+
+@pytest.fixture
+def api():
+    server = ScriptedAPI()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+
+
+@pytest.fixture
+def sdk_client(api):
+    with AgentConnectClient(base_url=api.url, api_key="key", backoff=0.05) as client:
+        yield client
+
+
+def test_5xx_is_retried_with_exponential_backoff(api, sdk_client):
+    api.reply(503)
+    api.reply(502)
+    api.reply(body={"agent_id": "agent_x"})
+
+    assert sdk_client.get_agent_info("agent_x") == {"agent_id": "agent_x"}
+
+    first, second = api.gaps()
+    assert first >= 0.05
+    assert second >= 0.1
+
+
+def test_retries_stop_after_max_retries(api, sdk_client):
+    for _ in range(4):
+        api.reply(500)
+
+    with pytest.raises(requests.HTTPError):
+        sdk_client.get_agent_info("agent_x")
+
+    assert len(api.requests) == sdk_client.max_retries + 1
+
+
+def test_4xx_is_not_retried(api, sdk_client):
+    api.reply(404, {"detail": "Agent not found"})
+
+    with pytest.raises(requests.HTTPError):
+        sdk_client.get_agent_info("agent_x")
+
+    assert len(api.requests) == 1
+
+
+def test_retry_after_is_waited_out(api, sdk_client):
+    api.reply(429, headers={"Retry-After": "1"})
+
+    sdk_client.get_agent_info("agent_x")
+
+    assert len(api.requests) == 2
+    assert api.gaps()[0] >= 1
+
+
+def test_long_retry_after_is_raised(api, sdk_client):
+    api.reply(429, headers={"Retry-After": "3600"})
+
+    with pytest.raises(requests.HTTPError):
+        sdk_client.get_agent_info("agent_x")
+
+    assert len(api.requests) == 1
+
+
+def test_send_retries_reuse_the_idempotency_key(api, sdk_client):
+    api.reply(503)
+    api.reply(body={"message_id": "msg_x"})
+
+    sdk_client.send_message("agent_x", {"text": "hi"})
+
+    first, second = [request["headers"]["Idempotency-Key"] for request in api.requests]
+    assert first and first == second
+
+
+@pytest.mark.parametrize("call", [
+    lambda client: client.get_inbox(wait=0),
+    lambda client: client.send_batch(to_agent_ids=["agent_x"], message_content={}),
+    lambda client: client.register("agent", "not repeated")
+])
+def test_non_repeatable_requests_are_not_retried(api, sdk_client, call):
+    api.reply(503)
+
+    with pytest.raises(requests.HTTPError):
+        call(sdk_client)
+
+    assert len(api.requests) == 1
+
+
+def test_async_client_retries_and_waits_out_retry_after(api):
+    api.reply(503)
+    api.reply(429, headers={"Retry-After": "1"})
+    api.reply(body={"message_id": "msg_x"})
+
+    async def send():
+        async with AsyncAgentConnectClient(base_url=api.url, api_key="key", backoff=0.05) as client:
+            return await client.send_message("agent_x", {"text": "hi"})
+
+    assert asyncio.run(send()) == {"message_id": "msg_x"}
+    assert len({request["headers"]["Idempotency-Key"] for request in api.requests}) == 1
+    first, second = api.gaps()
+    assert 0.05 <= first < 1
+    assert second >= 1
+
+
+def test_async_client_limits_requests_in_flight(api):
+    for _ in range(6):
+        api.reply(body={"message_id": "msg_x"}, delay=0.1)
+
+    async def send():
+        async with AsyncAgentConnectClient(base_url=api.url, api_key="key", max_concurrency=2) as client:
+            return await client.send_messages({"to_agent_id": "agent_x", "message_content": {"n": n}} for n in range(6))
+
+    assert asyncio.run(send()) == [{"message_id": "msg_x"}] * 6
+    assert api.max_in_flight == 2
+
+
+def test_async_iter_agents_follows_cursors(api):
+    api.reply(body={"agents": [{"agent_id": "agent_a"}, {"agent_id": "agent_b"}], "total": 3, "next_cursor": "page2"})
+    api.reply(body={"agents": [{"agent_id": "agent_c"}], "total": 3, "next_cursor": None})
+
+    async def list_all():
+        async with AsyncAgentConnectClient(base_url=api.url) as client:
+            return [agent["agent_id"] async for agent in client.iter_agents(page_size=2)]
+
+    assert asyncio.run(list_all()) == ["agent_a", "agent_b", "agent_c"]
+    assert "cursor=page2" in api.requests[1]["path"]
+
+
+def test_async_stream_yields_and_acks_messages():
+    acks, authorization = [], []
+
+    async def push(websocket, *args):
+        headers = getattr(websocket, "request_headers", None) or websocket.request.headers
+        authorization.append(headers["Authorization"])
+        await websocket.send(json.dumps({"type": "ping"}))
+        await websocket.send(json.dumps({"type": "message", "message_id": "msg_x", "message_content": {"n": 1}}))
+        acks.append(json.loads(await websocket.recv()))
+
+    async def receive():
+        async with websockets.serve(push, "127.0.0.1", 0) as server:
+            port = next(iter(server.sockets)).getsockname()[1]
+            async with AsyncAgentConnectClient(base_url=f"http://127.0.0.1:{port}", api_key="key") as client:
+                async with client.stream() as messages:
+                    return [message async for message in messages]
+
+    received = asyncio.run(receive())
+
+    assert [message["message_id"] for message in received] == ["msg_x"]
+    assert acks == [{"type": "ack", "message_ids": ["msg_x"]}]
+    assert authorization == ["Bearer key"]
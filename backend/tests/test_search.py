@@ -0,0 +1,31 @@
+import secrets
+
+import pytest
+
+
+@pytest.fixture
+def summarizer(register):
+    # A word no other agent has, so earlier runs' agents can't crowd it out of the results
+    marker = f"x{secrets.token_hex(6)}"
+    agent = register("summarizer", description=f"Summarizes long documents while running offline {marker}", tags=["nlp"])
+    agent["marker"] = marker
+    return agent
+
+
+def search(client, **params) -> list:
+    response = client.get("/api/agents/search", params=params)
+    assert response.status_code == 200, response.text
+    return [result["agent_id"] for result in response.json()["results"]]
+
+
+@pytest.mark.parametrize("query", ["documents", "docu", "running", "summarizer documents"])
+def test_search_matches_words_and_prefixes(client, summarizer, query):
+    assert summarizer["agent_id"] in search(client, q=f"{query} {summarizer['marker']}")
+
+
+def test_search_requires_every_term(client, summarizer):
+    assert summarizer["agent_id"] not in search(client, q=f"spreadsheets {summarizer['marker']}")
+
+
+def test_search_by_tag(client, summarizer):
+    assert summarizer["agent_id"] in search(client, q=summarizer["marker"], tags="nlp")
@@ -0,0 +1,86 @@
+from sqlalchemy import event
+
+from app.core.database import engine
+from app.core.payloads import MAX_CONTENT_BYTES
+from app.main import MAX_BATCH_SIZE
+from app.models.database import Message, MessageStatus
+
+
+def send_batch(client, sender, **body):
+    return client.post("/api/messages/send_batch", json=body, headers=sender["headers"])
+
+
+def test_unknown_recipients_fail_alone(client, db, register):
+    sender, first, second = register("sender"), register("first"), register("second")
+    recipients = [first["agent_id"], "agent_missing", second["agent_id"]]
+
+    response = send_batch(client, sender, to_agent_ids=recipients, message_content={"text": "hello"})
+
+    assert response.status_code == 200, response.text
+    results = response.json()["results"]
+    assert [result["to_agent_id"] for result in results] == recipients
+    assert results[1] == {"to_agent_id": "agent_missing", "message_id": None, "status": None, "error": "Recipient agent not found"}
+    for result in (results[0], results[2]):
+        assert result["status"] == "queued"
+        assert result["error"] is None
+        message = db.get(Message, result["message_id"])
+        assert message.status == MessageStatus.QUEUED
+        assert message.from_agent_id == sender["agent_id"]
+        assert message.to_agent_id == result["to_agent_id"]
+
+
+def test_results_follow_the_request_order_with_per_item_errors(client, db, register):
+    sender, recipient = register("sender"), register("recipient")
+    too_large = {"text": "x" * MAX_CONTENT_BYTES}
+
+    response = send_batch(client, sender, priority="high", messages=[
+        {"to_agent_id": recipient["agent_id"], "message_content": {"n": 1}},
+        {"to_agent_id": recipient["agent_id"], "message_content": too_large},
+        {"to_agent_id": recipient["agent_id"], "message_content": {"n": 3}, "priority": "low"}
+    ])
+
+    assert response.status_code == 200, response.text
+    sent, rejected, low = response.json()["results"]
+    assert rejected["message_id"] is None and rejected["status"] is None
+    assert "limit" in rejected["error"]
+    assert [db.get(Message, result["message_id"]).priority for result in (sent, low)] == [2, 0]
+
+
+def test_batch_size_is_limited(client, register):
+    sender, recipient = register("sender"), register("recipient")
+
+    at_limit = send_batch(client, sender, to_agent_ids=[recipient["agent_id"]] * MAX_BATCH_SIZE, message_content={})
+    over_limit = send_batch(client, sender, to_agent_ids=[recipient["agent_id"]] * (MAX_BATCH_SIZE + 1), message_content={})
+
+    assert at_limit.status_code == 200
+    assert len(at_limit.json()["results"]) == MAX_BATCH_SIZE
+    assert over_limit.status_code == 400
+    assert str(MAX_BATCH_SIZE) in over_limit.json()["detail"]
+
+
+def test_malformed_batches_are_rejected(client, register):
+    sender, recipient = register("sender"), register("recipient")
+    item = {"to_agent_id": recipient["agent_id"], "message_content": {}}
+
+    assert send_batch(client, sender, messages=[]).status_code == 400
+    assert send_batch(client, sender, to_agent_ids=[recipient["agent_id"]]).status_code == 400
+    assert send_batch(client, sender, messages=[item], to_agent_ids=[recipient["agent_id"]], message_content={}).status_code == 400
+
+
+def test_batch_is_inserted_with_one_statement(client, register):
+    sender, recipients = register("sender"), [register(f"recipient{n}")["agent_id"] for n in range(5)]
+    inserts = []
+
+    def count_inserts(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith("INSERT INTO messages"):
+            inserts.append(statement)
+
+    event.listen(engine, "before_cursor_execute", count_inserts)
+    try:
+        response = send_batch(client, sender, to_agent_ids=recipients * 20, message_content={"text": "fan-out"})
+    finally:
+        event.remove(engine, "before_cursor_execute", count_inserts)
+
+    assert response.status_code == 200, response.text
+    assert len(response.json()["results"]) == 100
+    assert len(inserts) == 1
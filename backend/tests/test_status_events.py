@@ -0,0 +1,85 @@
+import threading
+import time
+
+from app.core.database import SessionLocal
+from app.core.status_events import status_events
+from app.models.database import Message, MessageStatus
+from app.workers.message_delivery import MessageDeliveryWorker
+
+
+def send(client, sender, recipient, count):
+    return [
+        client.post(
+            "/api/messages/send",
+            json={"to_agent_id": recipient["agent_id"], "message_content": {"n": n}},
+            headers=sender["headers"]
+        ).json()["message_id"]
+        for n in range(count)
+    ]
+
+
+def set_status(client, agent, status):
+    client.put(f"/api/agents/{agent['agent_id']}/status", json={"status": status}, headers=agent["headers"])
+
+
+def published_since(position):
+    """Status events the API published after position, as the worker's consumer reads them"""
+    return [fields for _, fields in status_events.read(position, 100, 1000)]
+
+
+def test_online_event_delivers_the_parked_backlog(client, db, register, claim, sink):
+    sender, recipient = register("sender"), register("recipient", webhook_url=f"{sink.url}/hook")
+    message_ids = send(client, sender, recipient, 3)
+
+    # The recipient is offline, so the worker parks them
+    worker = MessageDeliveryWorker()
+    worker.deliver_messages(claim(worker.worker_id, [recipient["agent_id"]]), db)
+    db.expire_all()
+    assert all(db.get(Message, message_id).next_attempt_at is None for message_id in message_ids)
+    assert sink.received == []
+
+    position = status_events.position()
+    set_status(client, recipient, "online")
+    worker.process_status_events(published_since(position), db)
+
+    db.expire_all()
+    assert [db.get(Message, message_id).status for message_id in message_ids] == [MessageStatus.DELIVERED] * 3
+    assert sink.received == ["/hook"] * 3
+
+
+def test_offline_event_parks_unstarted_jobs_without_using_a_retry(client, db, register, claim, sink):
+    sender, recipient = register("sender"), register("recipient", webhook_url=f"{sink.url}/slow")
+    set_status(client, recipient, "online")
+    first, *rest = send(client, sender, recipient, 3)
+
+    # One call at a time to the recipient, so the others wait behind the first
+    worker = MessageDeliveryWorker(per_agent_concurrency=1)
+    messages = claim(worker.worker_id, [recipient["agent_id"]])
+    delivering = threading.Thread(target=worker.deliver_messages, args=(messages, db))
+    delivering.start()
+
+    try:
+        for _ in range(50):
+            if sink.received:
+                break
+            time.sleep(0.1)
+        assert sink.received == ["/slow"]
+
+        position = status_events.position()
+        set_status(client, recipient, "offline")
+        with SessionLocal() as other:
+            worker.process_status_events(published_since(position), other)
+    finally:
+        sink.release.set()
+        delivering.join()
+
+    # The call in flight finishes; the rest are parked for the next time the recipient is online
+    assert sink.received == ["/slow"]
+    db.expire_all()
+    assert db.get(Message, first).status == MessageStatus.DELIVERED
+    for message_id in rest:
+        message = db.get(Message, message_id)
+        assert message.status == MessageStatus.QUEUED
+        assert message.next_attempt_at is None
+        assert message.retry_count == 0
+        assert message.lease_owner is None
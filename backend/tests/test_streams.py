@@ -0,0 +1,111 @@
+import threading
+import time
+
+import fakeredis
+import pytest
+
+import app.main
+from app.core.streams import DeliveryStream
+from app.models.database import Message, MessageStatus
+from app.workers.message_delivery import MessageDeliveryWorker
+
+
+@pytest.fixture
+def stream():
+    stream = DeliveryStream(fakeredis.FakeRedis(decode_responses=True))
+    stream.ensure_group()
+    return stream
+
+
+def pending(stream: DeliveryStream) -> dict:
+    """Unacknowledged entry count per consumer"""
+    return {consumer["name"]: consumer["pending"] for consumer in stream.redis_client.xinfo_consumers(stream.stream, stream.group)}
+
+
+def test_send_publishes_the_message_to_the_stream(client, register, monkeypatch, stream):
+    monkeypatch.setattr(app.main, "delivery_stream", stream)
+    sender, recipient = register("sender"), register("recipient")
+    client.put(f"/api/agents/{recipient['agent_id']}/status", json={"status": "online"}, headers=recipient["headers"])
+
+    response = client.post("/api/messages/send", json={"to_agent_id": recipient["agent_id"], "message_content": {}}, headers=sender["headers"])
+
+    [(_, fields)] = stream.read("worker_a", 10, 1)
+    assert fields == {"message_id": response.json()["message_id"]}
+
+
+def test_entries_stay_pending_until_acknowledged(stream):
+    stream.publish_messages(["msg_a", "msg_b"])
+
+    entries = stream.read("worker_a", 10, 1)
+    assert [fields["message_id"] for _, fields in entries] == ["msg_a", "msg_b"]
+    assert pending(stream) == {"worker_a": 2}
+
+    stream.ack([entry_id for entry_id, _ in entries])
+    assert pending(stream) == {"worker_a": 0}
+    assert stream.read("worker_a", 10, 1) == []
+
+
+def test_idle_entries_are_reclaimed_by_another_consumer(stream):
+    stream.publish_messages(["msg_a"])
+    [(entry_id, _)] = stream.read("worker_a", 10, 1)
+
+    assert stream.claim_stale("worker_b", 60000, 10) == []
+    time.sleep(0.05)
+    assert stream.claim_stale("worker_b", 10, 10) == [(entry_id, {"message_id": "msg_a"})]
+    assert pending(stream) == {"worker_a": 0, "worker_b": 1}
+
+
+def test_trimmed_entries_are_not_reclaimed(stream):
+    stream.publish_messages(["msg_a"])
+    stream.read("worker_a", 10, 1)
+    stream.redis_client.xtrim(stream.stream, maxlen=0)
+
+    assert stream.claim_stale("worker_b", 0, 10) == []
+    assert sum(pending(stream).values()) == 0
+
+
+def test_consumer_with_pending_entries_is_not_removed(stream):
+    stream.publish_messages(["msg_a"])
+    [(entry_id, _)] = stream.read("worker_a", 10, 1)
+
+    assert not stream.remove_consumer("worker_a")
+    assert pending(stream) == {"worker_a": 1}
+
+    stream.ack([entry_id])
+    assert stream.remove_consumer("worker_a")
+    assert pending(stream) == {}
+
+
+def test_idle_consumers_without_pending_entries_are_pruned(stream):
+    stream.publish_messages(["msg_a"])
+    stream.read("worker_stuck", 10, 1)
+    stream.read("worker_gone", 10, 1)
+    time.sleep(0.05)
+    stream.read("worker_live", 10, 1)
+
+    assert stream.prune_consumers(40) == ["worker_gone"]
+    assert set(pending(stream)) == {"worker_stuck", "worker_live"}
+
+
+def test_worker_delivers_stream_entries_and_leaves_the_group(db, register, queue_messages, sink, client, stream):
+    recipient = register("recipient", webhook_url=f"{sink.url}/hook")
+    client.put(f"/api/agents/{recipient['agent_id']}/status", json={"status": "online"}, headers=recipient["headers"])
+    [message_id] = queue_messages("agent_sender", recipient["agent_id"])
+    stream.publish_messages([message_id])
+    worker = MessageDeliveryWorker()
+    worker.stream = stream
+    # Only the stream entry, not a sweep of everything due, is delivered
+    worker.last_sweep = time.monotonic()
+
+    thread = threading.Thread(target=worker.run, daemon=True)
+    thread.start()
+    deadline = time.monotonic() + 10
+    while not sink.bodies and time.monotonic() < deadline:
+        time.sleep(0.01)
+    worker.stop()
+    thread.join(10)
+
+    assert not thread.is_alive()
+    assert message_id.encode() in sink.bodies[0]
+    assert db.get(Message, message_id).status == MessageStatus.DELIVERED
+    assert pending(stream) == {}
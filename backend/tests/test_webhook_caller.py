@@ -0,0 +1,40 @@
+import threading
+import time
+
+import requests
+
+from app.workers.webhook_caller import WebhookDispatcher
+
+
+def test_sessions_are_kept_for_the_most_recently_used_hosts(monkeypatch):
+    closed = []
+    monkeypatch.setattr(requests.Session, "close", lambda session: closed.append(session))
+    dispatcher = WebhookDispatcher(max_in_flight=2, max_hosts=2)
+
+    a = dispatcher._session_for("http://a.example/hook")
+    b = dispatcher._session_for("http://b.example/hook")
+    assert dispatcher._session_for("http://a.example/other") is a
+    c = dispatcher._session_for("http://c.example/hook")
+
+    assert closed == [b]
+    assert list(dispatcher._sessions.values()) == [a, c]
+    assert dispatcher._session_for("http://b.example/hook") is not b
+    assert closed == [b, a]
+    dispatcher.close()
+
+
+def test_request_in_flight_finishes_when_its_session_is_evicted(sink):
+    dispatcher = WebhookDispatcher(max_in_flight=2, max_hosts=1)
+    session = dispatcher._session_for(f"{sink.url}/slow")
+    responses = []
+    request = threading.Thread(target=lambda: responses.append(session.post(f"{sink.url}/slow", data=b"{}", timeout=10)))
+    request.start()
+    while not sink.received:
+        time.sleep(0.01)
+
+    dispatcher._session_for("http://127.0.0.1:9/hook")
+    sink.release.set()
+    request.join(10)
+
+    assert [response.status_code for response in responses] == [200]
+    dispatcher.close()
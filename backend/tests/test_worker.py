@@ -0,0 +1,59 @@
+import json
+import threading
+import time
+
+from app.core.security import generate_id
+from app.models.database import DeliveryWorker, Message, MessageStatus
+from app.workers.message_delivery import MessageDeliveryWorker
+
+
+def test_heartbeats_continue_while_the_worker_is_busy(db):
+    worker = MessageDeliveryWorker(sharded=True, heartbeat_interval=1)
+    heartbeats = threading.Thread(target=worker.send_heartbeats)
+    heartbeats.start()
+    try:
+        # The main loop never gets a turn here, as during a long delivery pass
+        time.sleep(0.5)
+        first = db.get(DeliveryWorker, worker.worker_id).heartbeat_at
+        assert worker.membership.shards
+
+        time.sleep(1.5)
+        db.expire_all()
+        assert db.get(DeliveryWorker, worker.worker_id).heartbeat_at > first
+    finally:
+        worker.stop()
+        heartbeats.join()
+        worker.membership.leave(db)
+
+
+def test_draining_worker_stops_between_pages(db, queue_messages):
+    # Unregistered, so its messages fail without a webhook call
+    recipient_id = generate_id()
+    message_ids = queue_messages("agent_sender", recipient_id, count=3)
+    worker = MessageDeliveryWorker(batch_size=1)
+    worker.stop()
+
+    worker.process_status_change_to_online(recipient_id, db)
+
+    db.expire_all()
+    statuses = [db.get(Message, message_id).status for message_id in message_ids]
+    assert statuses.count(MessageStatus.FAILED) == 1
+    assert statuses.count(MessageStatus.QUEUED) == 2
+
+
+def test_one_senders_messages_arrive_in_order_with_one_call_in_flight(client, db, register, sink):
+    sender, recipient = register("sender"), register("recipient", webhook_url=f"{sink.url}/hook")
+    client.put(f"/api/agents/{recipient['agent_id']}/status", json={"status": "online"}, headers=recipient["headers"])
+    message_ids = [
+        client.post(
+            "/api/messages/send",
+            json={"to_agent_id": recipient["agent_id"], "message_content": {"n": n}},
+            headers=sender["headers"]
+        ).json()["message_id"]
+        for n in range(6)
+    ]
+
+    worker = MessageDeliveryWorker(per_agent_concurrency=1, batch_size=4)
+    worker.process_status_change_to_online(recipient["agent_id"], db)
+
+    assert [json.loads(body)["message_id"] for body in sink.bodies] == message_ids
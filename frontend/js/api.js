@@ -51,6 +51,14 @@ class AgentConnectAPI {
         return this.request(`/agents${params}`, { skipAuth: true });
     }
 
+    async searchAgents(query, tags = [], status = null) {
+        const params = new URLSearchParams();
+        if (query) params.set('q', query);
+        if (tags.length) params.set('tags', tags.join(','));
+        if (status) params.set('status', status);
+        return this.request(`/agents/search?${params}`, { skipAuth: true });
+    }
+
     async getAgent(agentId) {
         return this.request(`/agents/${agentId}`, { skipAuth: true });
     }
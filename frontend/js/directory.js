@@ -1,29 +1,48 @@
-let allAgents = [];
+let searchTimer = null;
+let latestRequest = 0;
+
+// "tag:nlp translation" searches for agents tagged nlp whose text matches "translation"
+function parseSearch(input) {
+    const tags = [];
+    const words = [];
+    input.trim().split(/\s+/).filter(Boolean).forEach(word => {
+        if (word.toLowerCase().startsWith('tag:') && word.length > 4) {
+            tags.push(word.slice(4).toLowerCase());
+        } else {
+            words.push(word);
+        }
+    });
+    return { query: words.join(' '), tags };
+}
 
 async function loadAgents() {
     const loading = document.getElementById('loading');
-    const grid = document.getElementById('agentGrid');
-    const statusFilter = document.getElementById('statusFilter');
+    const status = document.getElementById('statusFilter').value || null;
+    const { query, tags } = parseSearch(document.getElementById('searchInput').value);
+    const requestId = ++latestRequest;
     
     try {
-        const data = await api.getAgents();
-        allAgents = data.agents;
-        
+        const data = (query || tags.length)
+            ? { agents: (await api.searchAgents(query, tags, status)).results }
+            : await api.getAgents(status);
+
+        // Ignore responses that arrive after a newer search was started
+        if (requestId !== latestRequest) return;
+
         loading.style.display = 'none';
-        displayAgents(allAgents);
-        
-        statusFilter.addEventListener('change', () => {
-            const status = statusFilter.value;
-            const filtered = status 
-                ? allAgents.filter(a => a.status === status)
-                : allAgents;
-            displayAgents(filtered);
-        });
+        displayAgents(data.agents);
     } catch (error) {
+        if (requestId !== latestRequest) return;
+        loading.style.display = 'block';
         loading.textContent = 'Error loading agents: ' + error.message;
     }
 }
 
+function scheduleSearch() {
+    clearTimeout(searchTimer);
+    searchTimer = setTimeout(loadAgents, 250);
+}
+
 function displayAgents(agents) {
     const grid = document.getElementById('agentGrid');
     const countEl = document.getElementById('agentCount');
@@ -40,6 +59,7 @@ function displayAgents(agents) {
             <h3>${escapeHtml(agent.name)}</h3>
             <div class="agent-id">${escapeHtml(agent.agent_id)}</div>
             <p>${escapeHtml(agent.description)}</p>
+            ${(agent.tags || []).length ? `<div class="agent-id">${agent.tags.map(t => '#' + escapeHtml(t)).join(' ')}</div>` : ''}
             <div style="margin-top: 1rem;">
                 <span class="status ${agent.status}">${agent.status}</span>
             </div>
@@ -56,4 +76,7 @@ function escapeHtml(text) {
     return div.innerHTML;
 }
 
+document.getElementById('statusFilter').addEventListener('change', loadAgents);
+document.getElementById('searchInput').addEventListener('input', scheduleSearch);
+
 loadAgents();
\ No newline at end of file
@@ -1,15 +1,39 @@
 declare module "agent-connect-client" {
     export = AgentConnectClient;
 
+    namespace AgentConnectClient {
+        export { MessageStream };
+    }
+
+    type MessagePriority = "low" | "normal" | "high";
+
+    class MessageStream implements AsyncIterable<any> {
+        autoAck: boolean;
+        ack(messageIds: string[]): void;
+        close(): void;
+        [Symbol.asyncIterator](): AsyncIterator<any>;
+    }
+
     class AgentConnectClient {
-        constructor(baseUrl?: string, apiKey?: string);
+        constructor(baseUrl?: string, apiKey?: string, maxRetries?: number);
 
-        register(name: string, description: string, webhookUrl: string): Promise<any>;
+        register(name: string, description: string, webhookUrl?: string | null, deliveryBatchSize?: number | null, webhookGzip?: boolean, deliveryReceipts?: boolean): Promise<any>;
         getAgentInfo(agentId: string): Promise<any>;
-        listAgents(status?: string, skip?: number, limit?: number): Promise<any>;
+        listAgents(status?: string | null, skip?: number, limit?: number, cursor?: string | null, fields?: string[] | null): Promise<any>;
+        iterAgents(status?: string | null, pageSize?: number, fields?: string[] | null): AsyncGenerator<any>;
         updateStatus(agentId: string, status: string): Promise<any>;
-        sendMessage(toAgentId: string, messageContent: any): Promise<any>;
+        sendMessage(toAgentId: string, messageContent: any, priority?: MessagePriority | null, idempotencyKey?: string | null): Promise<any>;
+        sendBatch(
+            messages?: { toAgentId: string; messageContent: any; priority?: MessagePriority }[] | null,
+            toAgentIds?: string[] | null,
+            messageContent?: any,
+            priority?: MessagePriority | null
+        ): Promise<any>;
+        getInbox(wait?: number, maxMessages?: number, visibility?: number | null): Promise<any[]>;
+        ackMessages(messageIds: string[]): Promise<any>;
+        stream(autoAck?: boolean): MessageStream;
         getMessageStatus(messageId: string): Promise<any>;
+        getMessageStatuses(messageIds: string[]): Promise<{ messages: any[]; not_found: string[] }>;
         verifyWebhookSignature(payload: string, signature: string, secretToken: string): boolean;
     }
 }
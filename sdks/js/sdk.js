@@ -4,10 +4,101 @@
 const axios = require('axios');
 const crypto = require('crypto');
 
+// An open push channel. Iterate over it with `for await` to receive messages
+// as they arrive. Requires the `ws` library (npm install ws). With autoAck each
+// message is acknowledged once the loop body that received it finishes;
+// otherwise call ack() yourself. Unacknowledged messages are delivered again
+// after a timeout.
+class MessageStream {
+    constructor(url, apiKey, autoAck = true) {
+        const WebSocket = require('ws');
+
+        this.autoAck = autoAck;
+        this._frames = [];
+        this._waiters = [];
+        this._closed = false;
+        this._socket = new WebSocket(url, { headers: { "Authorization": `Bearer ${apiKey}` } });
+        this._socket.on('message', (data) => {
+            const frame = JSON.parse(data.toString());
+            if (frame.type === "message") {
+                this._push(frame);
+            }
+        });
+        this._socket.on('close', () => {
+            this._closed = true;
+            this._push(null);
+        });
+        this._socket.on('error', () => this._socket.terminate());
+    }
+
+    _push(frame) {
+        const waiter = this._waiters.shift();
+        if (waiter) {
+            waiter(frame);
+        } else if (frame !== null) {
+            this._frames.push(frame);
+        }
+    }
+
+    _next() {
+        if (this._frames.length) {
+            return Promise.resolve(this._frames.shift());
+        }
+        if (this._closed) {
+            return Promise.resolve(null);
+        }
+        return new Promise(resolve => this._waiters.push(resolve));
+    }
+
+    // Marks the given messages as delivered.
+    ack(messageIds) {
+        this._socket.send(JSON.stringify({ type: "ack", message_ids: messageIds }));
+    }
+
+    close() {
+        this._socket.close();
+    }
+
+    async *[Symbol.asyncIterator]() {
+        while (true) {
+            const message = await this._next();
+            if (message === null) {
+                return;
+            }
+            yield message;
+            if (this.autoAck) {
+                this.ack([message.message_id]);
+            }
+        }
+    }
+}
+
+// Longest Retry-After the client waits out; a longer one (e.g. an exhausted
+// hourly rate limit) is thrown instead
+const MAX_RETRY_AFTER = 30;
+
+// Milliseconds to wait before retrying a failed request, or null if it
+// shouldn't be retried. Network errors and 5xx/429 responses are retried:
+// after the server's Retry-After when it sends one, otherwise after
+// exponential backoff.
+function retryDelay(error, attempt) {
+    const response = error.response;
+    if (response && response.status < 500 && response.status !== 429) {
+        return null;
+    }
+    const retryAfter = response && response.headers["retry-after"];
+    if (retryAfter && /^\d+$/.test(retryAfter)) {
+        const seconds = parseInt(retryAfter, 10);
+        return seconds <= MAX_RETRY_AFTER ? seconds * 1000 : null;
+    }
+    return 500 * 2 ** attempt;
+}
+
 class AgentConnectClient {
-    constructor(baseUrl = "http://127.0.0.1:8000", apiKey = null) {
+    constructor(baseUrl = "http://127.0.0.1:8000", apiKey = null, maxRetries = 2) {
         this.baseUrl = baseUrl;
         this.apiKey = apiKey;
+        this.maxRetries = maxRetries;
     }
 
     _getHeaders() {
@@ -17,9 +108,25 @@ class AgentConnectClient {
         return {};
     }
 
-    async register(name, description, webhookUrl) {
+    // Set deliveryBatchSize to receive up to that many messages per webhook
+    // call as a JSON array instead of one call per message. Pass a null
+    // webhookUrl for agents that only receive through stream(). Set
+    // webhookGzip to receive large webhook bodies gzip-compressed.
+    async register(name, description, webhookUrl = null, deliveryBatchSize = null, webhookGzip = false, deliveryReceipts = false) {
         const url = `${this.baseUrl}/api/agents/register`;
-        const data = { name, description, webhook_url: webhookUrl };
+        const data = { name, description };
+        if (webhookUrl !== null) {
+            data.webhook_url = webhookUrl;
+        }
+        if (deliveryBatchSize !== null) {
+            data.delivery_batch_size = deliveryBatchSize;
+        }
+        if (webhookGzip) {
+            data.webhook_gzip = true;
+        }
+        if (deliveryReceipts) {
+            data.delivery_receipts = true;
+        }
         const response = await axios.post(url, data);
         return response.data;
     }
@@ -30,16 +137,34 @@ class AgentConnectClient {
         return response.data;
     }
 
-    async listAgents(status = null, skip = 0, limit = 100) {
+    // Pass the previous page's next_cursor as `cursor` to continue;
+    // `skip` is kept for compatibility but gets slower on deep pages.
+    async listAgents(status = null, skip = 0, limit = 100, cursor = null, fields = null) {
         const url = `${this.baseUrl}/api/agents`;
         const params = { skip, limit };
         if (status) {
             params.status = status;
         }
+        if (cursor) {
+            params.cursor = cursor;
+        }
+        if (fields) {
+            params.fields = fields.join(",");
+        }
         const response = await axios.get(url, { params });
         return response.data;
     }
 
+    // Yields every agent, following cursors page by page.
+    async *iterAgents(status = null, pageSize = 100, fields = null) {
+        let cursor = null;
+        do {
+            const page = await this.listAgents(status, 0, pageSize, cursor, fields);
+            yield* page.agents;
+            cursor = page.next_cursor;
+        } while (cursor);
+    }
+
     async updateStatus(agentId, status) {
         const url = `${this.baseUrl}/api/agents/${agentId}/status`;
         const headers = this._getHeaders();
@@ -48,14 +173,77 @@ class AgentConnectClient {
         return response.data;
     }
 
-    async sendMessage(toAgentId, messageContent) {
+    // `priority` is "low", "normal" (the default) or "high". Network errors
+    // and 5xx/429 responses are retried up to maxRetries times with the same
+    // Idempotency-Key (generated unless given), so a retry never sends the
+    // message twice. A 429 is retried after its Retry-After.
+    async sendMessage(toAgentId, messageContent, priority = null, idempotencyKey = null) {
         const url = `${this.baseUrl}/api/messages/send`;
-        const headers = this._getHeaders();
+        const headers = { ...this._getHeaders(), "Idempotency-Key": idempotencyKey || crypto.randomUUID() };
         const data = { to_agent_id: toAgentId, message_content: messageContent };
+        if (priority !== null) {
+            data.priority = priority;
+        }
+
+        for (let attempt = 0; ; attempt++) {
+            let delay;
+            try {
+                const response = await axios.post(url, data, { headers });
+                return response.data;
+            } catch (error) {
+                delay = attempt < this.maxRetries ? retryDelay(error, attempt) : null;
+                if (delay === null) {
+                    throw error;
+                }
+            }
+            await new Promise(resolve => setTimeout(resolve, delay));
+        }
+    }
+
+    // Pass either `messages` ([{ toAgentId, messageContent, priority? }]) or
+    // `toAgentIds` with a single `messageContent` to fan out. `priority`
+    // applies to every item that doesn't set its own.
+    async sendBatch(messages = null, toAgentIds = null, messageContent = null, priority = null) {
+        const url = `${this.baseUrl}/api/messages/send_batch`;
+        const headers = this._getHeaders();
+        const data = messages
+            ? { messages: messages.map(m => ({ to_agent_id: m.toAgentId, message_content: m.messageContent, priority: m.priority })) }
+            : { to_agent_ids: toAgentIds, message_content: messageContent };
+        if (priority !== null) {
+            data.priority = priority;
+        }
         const response = await axios.post(url, data, { headers });
         return response.data;
     }
 
+    // Pulls queued messages, waiting up to `wait` seconds (max 60) for some
+    // to arrive. Returned messages are handed out again after `visibility`
+    // seconds (default 60) unless acknowledged with ackMessages().
+    async getInbox(wait = 30, maxMessages = 100, visibility = null) {
+        const url = `${this.baseUrl}/api/messages/inbox`;
+        const headers = this._getHeaders();
+        const params = { wait, max: maxMessages };
+        if (visibility !== null) {
+            params.visibility = visibility;
+        }
+        const response = await axios.get(url, { headers, params });
+        return response.data.messages;
+    }
+
+    async ackMessages(messageIds) {
+        const url = `${this.baseUrl}/api/messages/ack`;
+        const headers = this._getHeaders();
+        const response = await axios.post(url, { message_ids: messageIds }, { headers });
+        return response.data;
+    }
+
+    // Opens the push channel. The agent shows as ONLINE while the stream is
+    // open and OFFLINE once it closes, so there is no need to call updateStatus.
+    stream(autoAck = true) {
+        const wsUrl = this.baseUrl.replace(/^http/, "ws");
+        return new MessageStream(`${wsUrl}/api/messages/stream`, this.apiKey, autoAck);
+    }
+
     async getMessageStatus(messageId) {
         const url = `${this.baseUrl}/api/messages/${messageId}`;
         const headers = this._getHeaders();
@@ -63,6 +251,15 @@ class AgentConnectClient {
         return response.data;
     }
 
+    // Statuses of up to 1000 messages in one request: { messages, not_found }.
+    // Ids you neither sent nor received are reported as not found.
+    async getMessageStatuses(messageIds) {
+        const url = `${this.baseUrl}/api/messages/status`;
+        const headers = this._getHeaders();
+        const response = await axios.post(url, { message_ids: messageIds }, { headers });
+        return response.data;
+    }
+
     verifyWebhookSignature(payload, signature, secretToken) {
         if (signature.startsWith("sha256=")) {
             signature = signature.substring(7);
@@ -78,3 +275,4 @@ class AgentConnectClient {
 }
 
 module.exports = AgentConnectClient;
+module.exports.MessageStream = MessageStream;
@@ -1,78 +1,626 @@
 import requests
+import asyncio
 import hashlib
 import hmac
-from typing import Optional, Dict, Any
+import json
+import time
+import uuid
+from typing import Optional, Dict, Any, AsyncIterator, Iterable, List, Iterator, Union
+from requests.adapters import HTTPAdapter
+
+try:
+    import httpx
+except ImportError:  # only needed for AsyncAgentConnectClient
+    httpx = None
+
+# Longest Retry-After the clients wait out; a longer one (e.g. an exhausted hourly rate limit) is raised instead
+MAX_RETRY_AFTER = 30
+
+
+class MessageStream:
+    """An open push channel. Iterate over it to receive messages as they arrive.
+
+    Requires the `websockets` library. With `auto_ack` each message is acknowledged
+    once the loop body that received it finishes; otherwise call `ack()` yourself.
+    Messages that are never acknowledged are delivered again after a timeout.
+    """
+
+    def __init__(self, url: str, api_key: str, auto_ack: bool = True):
+        from websockets.sync.client import connect
+
+        self.auto_ack = auto_ack
+        self._connection = connect(url, additional_headers={"Authorization": f"Bearer {api_key}"})
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        from websockets.exceptions import ConnectionClosedOK
+
+        while True:
+            try:
+                frame = json.loads(self._connection.recv())
+            except ConnectionClosedOK:
+                return
+            if frame.get("type") != "message":
+                continue
+            yield frame
+            if self.auto_ack:
+                self.ack([frame["message_id"]])
+
+    def ack(self, message_ids: List[str]):
+        """Marks the given messages as delivered."""
+        self._connection.send(json.dumps({"type": "ack", "message_ids": message_ids}))
+
+    def close(self):
+        self._connection.close()
+
+    def __enter__(self) -> "MessageStream":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class AsyncMessageStream:
+    """asyncio counterpart of MessageStream, opened with `async with`.
+
+    Iterate with `async for`; acknowledgements work as in MessageStream.
+    """
+
+    def __init__(self, url: str, api_key: str, auto_ack: bool = True):
+        self.url = url
+        self.api_key = api_key
+        self.auto_ack = auto_ack
+        self._connection = None
+
+    async def __aenter__(self) -> "AsyncMessageStream":
+        headers = {"Authorization": f"Bearer {self.api_key}"}
+        try:
+            from websockets.asyncio.client import connect
+        except ImportError:  # websockets < 13
+            from websockets.client import connect
+            self._connection = await connect(self.url, extra_headers=headers)
+        else:
+            self._connection = await connect(self.url, additional_headers=headers)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def __aiter__(self):
+        from websockets.exceptions import ConnectionClosedOK
+
+        while True:
+            try:
+                frame = json.loads(await self._connection.recv())
+            except ConnectionClosedOK:
+                return
+            if frame.get("type") != "message":
+                continue
+            yield frame
+            if self.auto_ack:
+                await self.ack([frame["message_id"]])
+
+    async def ack(self, message_ids: List[str]):
+        """Marks the given messages as delivered."""
+        await self._connection.send(json.dumps({"type": "ack", "message_ids": message_ids}))
+
+    async def close(self):
+        if self._connection is not None:
+            await self._connection.close()
+
+
+def _stream_url(base_url: str) -> str:
+    ws_url = "ws" + base_url[len("http"):] if base_url.startswith("http") else base_url
+    return f"{ws_url}/api/messages/stream"
+
+
+def _retry_delay(status_code: int, retry_after: Optional[str], attempt: int, backoff: float) -> Optional[float]:
+    """Seconds to wait before retrying a response, or None if it shouldn't be retried.
+
+    Only 5xx and 429 responses are retried: after the server's Retry-After when it
+    sends one, otherwise after exponential backoff.
+    """
+    if status_code < 500 and status_code != 429:
+        return None
+    if retry_after and retry_after.isdigit():
+        return float(retry_after) if int(retry_after) <= MAX_RETRY_AFTER else None
+    return backoff * 2 ** attempt
+
+
+def _register_data(
+    name: str,
+    description: str,
+    webhook_url: Optional[str],
+    delivery_batch_size: Optional[int],
+    webhook_gzip: bool,
+    delivery_receipts: bool
+) -> Dict[str, Any]:
+    data = {"name": name, "description": description}
+    if webhook_url is not None:
+        data["webhook_url"] = webhook_url
+    if delivery_batch_size is not None:
+        data["delivery_batch_size"] = delivery_batch_size
+    if webhook_gzip:
+        data["webhook_gzip"] = True
+    if delivery_receipts:
+        data["delivery_receipts"] = True
+    return data
+
+
+def _list_params(status: Optional[str], skip: int, limit: int, cursor: Optional[str], fields: Optional[List[str]]) -> Dict[str, Any]:
+    params = {"skip": skip, "limit": limit}
+    if status:
+        params["status"] = status
+    if cursor:
+        params["cursor"] = cursor
+    if fields:
+        params["fields"] = ",".join(fields)
+    return params
+
+
+def _send_data(to_agent_id: str, message_content: Dict[str, Any], priority: Optional[str]) -> Dict[str, Any]:
+    data = {"to_agent_id": to_agent_id, "message_content": message_content}
+    if priority is not None:
+        data["priority"] = priority
+    return data
+
+
+def _batch_data(
+    messages: Optional[List[Dict[str, Any]]],
+    to_agent_ids: Optional[List[str]],
+    message_content: Optional[Dict[str, Any]],
+    priority: Optional[str]
+) -> Dict[str, Any]:
+    if messages is not None:
+        data = {"messages": messages}
+    else:
+        data = {"to_agent_ids": to_agent_ids, "message_content": message_content}
+    if priority is not None:
+        data["priority"] = priority
+    return data
+
+
+def _inbox_params(wait: int, max_messages: int, visibility: Optional[int]) -> Dict[str, Any]:
+    params = {"wait": wait, "max": max_messages}
+    if visibility is not None:
+        params["visibility"] = visibility
+    return params
+
+
+def verify_webhook_signature(payload: str, signature: str, secret_token: str) -> bool:
+    """Verifies the HMAC-SHA256 signature of a webhook payload."""
+    if signature.startswith("sha256="):
+        signature = signature[len("sha256="):]
+
+    expected_signature = hmac.new(
+        secret_token.encode(),
+        payload.encode(),
+        hashlib.sha256
+    ).hexdigest()
+
+    return hmac.compare_digest(signature, expected_signature)
+
 
 class AgentConnectClient:
-    def __init__(self, base_url: str = "http://127.0.0.1:8000", api_key: Optional[str] = None):
+    """Client for the Agent Connect API.
+
+    Requests share a pooled keep-alive session; close the client (or use it as a
+    context manager) when done. Every request has a connect and read timeout.
+    Requests that are safe to repeat (reads other than the inbox, status updates,
+    acks and sends, which carry an Idempotency-Key) are retried up to `max_retries` times on connection
+    errors, timeouts and 5xx/429 responses, waiting `backoff` * 2^attempt seconds
+    or the server's Retry-After in between.
+    """
+
+    def __init__(
+        self,
+        base_url: str = "http://127.0.0.1:8000",
+        api_key: Optional[str] = None,
+        max_retries: int = 2,
+        timeout: float = 30.0,
+        connect_timeout: float = 5.0,
+        backoff: float = 0.5,
+        pool_size: int = 10
+    ):
+        """`pool_size` is how many connections are kept open for use from multiple threads."""
         self.base_url = base_url
         self.api_key = api_key
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.backoff = backoff
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self) -> "AgentConnectClient":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
 
     def _get_headers(self) -> Dict[str, str]:
         if self.api_key:
             return {"Authorization": f"Bearer {self.api_key}"}
         return {}
 
-    def register(self, name: str, description: str, webhook_url: str) -> Dict[str, Any]:
-        """Registers a new agent."""
-        url = f"{self.base_url}/api/agents/register"
-        data = {"name": name, "description": description, "webhook_url": webhook_url}
-        response = requests.post(url, json=data)
+    def _request(
+        self,
+        method: str,
+        path: str,
+        retry: bool = False,
+        headers: Optional[Dict[str, str]] = None,
+        read_timeout: Optional[float] = None,
+        **kwargs
+    ) -> Any:
+        """Sends a request on the pooled session and returns its JSON body, raising for error statuses."""
+        headers = {**self._get_headers(), **(headers or {})}
+        timeout = (self.connect_timeout, read_timeout or self.timeout)
+        attempts = self.max_retries + 1 if retry else 1
+
+        for attempt in range(attempts):
+            last_attempt = attempt == attempts - 1
+            try:
+                response = self.session.request(method, self.base_url + path, headers=headers, timeout=timeout, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                if last_attempt:
+                    raise
+                delay = self.backoff * 2 ** attempt
+            else:
+                delay = None if last_attempt else _retry_delay(
+                    response.status_code, response.headers.get("Retry-After"), attempt, self.backoff
+                )
+                if delay is None:
+                    break
+            time.sleep(delay)
+
         response.raise_for_status()
         return response.json()
 
+    def register(
+        self,
+        name: str,
+        description: str,
+        webhook_url: Optional[str] = None,
+        delivery_batch_size: Optional[int] = None,
+        webhook_gzip: bool = False,
+        delivery_receipts: bool = False
+    ) -> Dict[str, Any]:
+        """Registers a new agent.
+
+        Leave out `webhook_url` for agents that only receive through `stream()`.
+        Set `webhook_gzip` to receive large webhook bodies gzip-compressed.
+        Set `delivery_batch_size` to receive up to that many messages per webhook
+        call as a JSON array instead of one call per message.
+        Set `delivery_receipts` to receive a message from "system" whenever one of
+        your messages is delivered or fails, instead of polling its status.
+        """
+        data = _register_data(name, description, webhook_url, delivery_batch_size, webhook_gzip, delivery_receipts)
+        return self._request("POST", "/api/agents/register", json=data)
+
     def get_agent_info(self, agent_id: str) -> Dict[str, Any]:
         """Retrieves public information about an agent."""
-        url = f"{self.base_url}/api/agents/{agent_id}"
-        response = requests.get(url)
-        response.raise_for_status()
-        return response.json()
+        return self._request("GET", f"/api/agents/{agent_id}", retry=True)
 
-    def list_agents(self, status: Optional[str] = None, skip: int = 0, limit: int = 100) -> Dict[str, Any]:
-        """Lists all agents, with optional filtering by status."""
-        url = f"{self.base_url}/api/agents"
-        params = {"skip": skip, "limit": limit}
-        if status:
-            params["status"] = status
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        return response.json()
+    def list_agents(
+        self,
+        status: Optional[str] = None,
+        skip: int = 0,
+        limit: int = 100,
+        cursor: Optional[str] = None,
+        fields: Optional[List[str]] = None
+    ) -> Dict[str, Any]:
+        """Lists one page of agents, with optional filtering by status.
+
+        Pass the previous page's `next_cursor` as `cursor` to continue; `skip` is
+        kept for compatibility but gets slower on deep pages.
+        """
+        params = _list_params(status, skip, limit, cursor, fields)
+        return self._request("GET", "/api/agents", retry=True, params=params)
+
+    def iter_agents(
+        self,
+        status: Optional[str] = None,
+        page_size: int = 100,
+        fields: Optional[List[str]] = None
+    ) -> Iterator[Dict[str, Any]]:
+        """Yields every agent, following cursors page by page."""
+        cursor = None
+        while True:
+            page = self.list_agents(status=status, limit=page_size, cursor=cursor, fields=fields)
+            yield from page["agents"]
+            cursor = page.get("next_cursor")
+            if not cursor:
+                return
 
     def update_status(self, agent_id: str, status: str) -> Dict[str, Any]:
         """Updates an agent's status."""
-        url = f"{self.base_url}/api/agents/{agent_id}/status"
-        headers = self._get_headers()
-        data = {"status": status}
-        response = requests.put(url, headers=headers, json=data)
-        response.raise_for_status()
-        return response.json()
+        return self._request("PUT", f"/api/agents/{agent_id}/status", retry=True, json={"status": status})
 
-    def send_message(self, to_agent_id: str, message_content: Dict[str, Any]) -> Dict[str, Any]:
-        """Sends a message from the current agent to another agent."""
-        url = f"{self.base_url}/api/messages/send"
-        headers = self._get_headers()
-        data = {"to_agent_id": to_agent_id, "message_content": message_content}
-        response = requests.post(url, headers=headers, json=data)
-        response.raise_for_status()
-        return response.json()
+    def send_message(
+        self,
+        to_agent_id: str,
+        message_content: Dict[str, Any],
+        priority: Optional[str] = None,
+        idempotency_key: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Sends a message from the current agent to another agent.
+
+        `priority` is "low", "normal" (the default) or "high"; higher priorities are delivered first.
+        Retries reuse the same Idempotency-Key (generated unless given), so a retry never
+        sends the message twice.
+        """
+        return self._request(
+            "POST",
+            "/api/messages/send",
+            retry=True,
+            headers={"Idempotency-Key": idempotency_key or str(uuid.uuid4())},
+            json=_send_data(to_agent_id, message_content, priority)
+        )
+
+    def send_batch(
+        self,
+        messages: Optional[List[Dict[str, Any]]] = None,
+        to_agent_ids: Optional[List[str]] = None,
+        message_content: Optional[Dict[str, Any]] = None,
+        priority: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Sends many messages in one request.
+
+        Pass either `messages` (a list of {"to_agent_id", "message_content"} dicts,
+        each optionally with its own "priority") or `to_agent_ids` with a single
+        `message_content` to fan out. `priority` applies to every item that doesn't
+        set one. The response holds one result per item with its message_id or error.
+        Batches are not retried, since a repeated batch would be queued twice.
+        """
+        data = _batch_data(messages, to_agent_ids, message_content, priority)
+        return self._request("POST", "/api/messages/send_batch", json=data)
+
+    def get_inbox(self, wait: int = 30, max_messages: int = 100, visibility: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Pulls queued messages, waiting up to `wait` seconds (max 60) for some to arrive.
+
+        Returned messages are handed out again after `visibility` seconds (default 60)
+        unless acknowledged with `ack_messages`. Not retried: the server leases the
+        messages it returns, so a retry after a lost response would come back without
+        them until their visibility timeout ran out.
+        """
+        return self._request(
+            "GET",
+            "/api/messages/inbox",
+            read_timeout=self.timeout + wait,
+            params=_inbox_params(wait, max_messages, visibility)
+        )["messages"]
+
+    def ack_messages(self, message_ids: List[str]) -> Dict[str, Any]:
+        """Marks messages received from the inbox as delivered."""
+        return self._request("POST", "/api/messages/ack", retry=True, json={"message_ids": message_ids})
+
+    def stream(self, auto_ack: bool = True) -> MessageStream:
+        """Opens the push channel and returns a MessageStream to iterate over.
+
+        The agent shows as ONLINE while the stream is open and OFFLINE once it closes,
+        so there is no need to call `update_status`.
+        """
+        return MessageStream(_stream_url(self.base_url), self.api_key, auto_ack=auto_ack)
 
     def get_message_status(self, message_id: str) -> Dict[str, Any]:
         """Retrievels the status of a sent message."""
-        url = f"{self.base_url}/api/messages/{message_id}"
-        headers = self._get_headers()
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()
-        return response.json()
+        return self._request("GET", f"/api/messages/{message_id}", retry=True)
+
+    def get_message_statuses(self, message_ids: List[str]) -> Dict[str, Any]:
+        """Retrieves the status of up to 1000 messages in one request.
+
+        Returns {"messages": [...], "not_found": [...]}; ids you neither sent nor
+        received are reported as not found.
+        """
+        return self._request("POST", "/api/messages/status", retry=True, json={"message_ids": message_ids})
 
     def verify_webhook_signature(self, payload: str, signature: str, secret_token: str) -> bool:
         """Verifies the HMAC-SHA256 signature of a webhook payload."""
-        if signature.startswith("sha256="):
-            signature = signature[len("sha256="):]
+        return verify_webhook_signature(payload, signature, secret_token)
+
+
+class AsyncAgentConnectClient:
+    """asyncio client for the Agent Connect API, built on httpx.
+
+    Use it as `async with AsyncAgentConnectClient(...) as client:`. At most
+    `max_concurrency` requests are in flight at once; further calls wait for a
+    slot, so thousands of sends can be started together (see `send_messages`).
+    Timeouts and retries work as in AgentConnectClient.
+    """
+
+    def __init__(
+        self,
+        base_url: str = "http://127.0.0.1:8000",
+        api_key: Optional[str] = None,
+        max_retries: int = 2,
+        timeout: float = 30.0,
+        connect_timeout: float = 5.0,
+        backoff: float = 0.5,
+        max_concurrency: int = 50
+    ):
+        if httpx is None:
+            raise ImportError("AsyncAgentConnectClient requires httpx: pip install httpx")
+        self.base_url = base_url
+        self.api_key = api_key
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.backoff = backoff
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self.client = httpx.AsyncClient(
+            base_url=base_url,
+            limits=httpx.Limits(max_connections=max_concurrency, max_keepalive_connections=max_concurrency)
+        )
+
+    async def close(self):
+        await self.client.aclose()
+
+    async def __aenter__(self) -> "AsyncAgentConnectClient":
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
 
-        expected_signature = hmac.new(
-            secret_token.encode(),
-            payload.encode(),
-            hashlib.sha256
-        ).hexdigest()
+    def _get_headers(self) -> Dict[str, str]:
+        if self.api_key:
+            return {"Authorization": f"Bearer {self.api_key}"}
+        return {}
+
+    async def _request(
+        self,
+        method: str,
+        path: str,
+        retry: bool = False,
+        headers: Optional[Dict[str, str]] = None,
+        read_timeout: Optional[float] = None,
+        **kwargs
+    ) -> Any:
+        """Sends a request once a concurrency slot is free and returns its JSON body, raising for error statuses."""
+        headers = {**self._get_headers(), **(headers or {})}
+        timeout = httpx.Timeout(read_timeout or self.timeout, connect=self.connect_timeout)
+        attempts = self.max_retries + 1 if retry else 1
+
+        for attempt in range(attempts):
+            last_attempt = attempt == attempts - 1
+            try:
+                # The slot is held for the request only, not while backing off
+                async with self._slots:
+                    response = await self.client.request(method, path, headers=headers, timeout=timeout, **kwargs)
+            except httpx.TransportError:
+                if last_attempt:
+                    raise
+                delay = self.backoff * 2 ** attempt
+            else:
+                delay = None if last_attempt else _retry_delay(
+                    response.status_code, response.headers.get("Retry-After"), attempt, self.backoff
+                )
+                if delay is None:
+                    break
+            await asyncio.sleep(delay)
+
+        response.raise_for_status()
+        return response.json()
+
+    async def register(
+        self,
+        name: str,
+        description: str,
+        webhook_url: Optional[str] = None,
+        delivery_batch_size: Optional[int] = None,
+        webhook_gzip: bool = False,
+        delivery_receipts: bool = False
+    ) -> Dict[str, Any]:
+        """Registers a new agent; see AgentConnectClient.register."""
+        data = _register_data(name, description, webhook_url, delivery_batch_size, webhook_gzip, delivery_receipts)
+        return await self._request("POST", "/api/agents/register", json=data)
+
+    async def get_agent_info(self, agent_id: str) -> Dict[str, Any]:
+        """Retrieves public information about an agent."""
+        return await self._request("GET", f"/api/agents/{agent_id}", retry=True)
+
+    async def list_agents(
+        self,
+        status: Optional[str] = None,
+        skip: int = 0,
+        limit: int = 100,
+        cursor: Optional[str] = None,
+        fields: Optional[List[str]] = None
+    ) -> Dict[str, Any]:
+        """Lists one page of agents; see AgentConnectClient.list_agents."""
+        params = _list_params(status, skip, limit, cursor, fields)
+        return await self._request("GET", "/api/agents", retry=True, params=params)
+
+    async def iter_agents(
+        self,
+        status: Optional[str] = None,
+        page_size: int = 100,
+        fields: Optional[List[str]] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Yields every agent, following cursors page by page; use with `async for`."""
+        cursor = None
+        while True:
+            page = await self.list_agents(status=status, limit=page_size, cursor=cursor, fields=fields)
+            for agent in page["agents"]:
+                yield agent
+            cursor = page.get("next_cursor")
+            if not cursor:
+                return
 
-        return hmac.compare_digest(signature, expected_signature)
+    async def update_status(self, agent_id: str, status: str) -> Dict[str, Any]:
+        """Updates an agent's status."""
+        return await self._request("PUT", f"/api/agents/{agent_id}/status", retry=True, json={"status": status})
+
+    async def send_message(
+        self,
+        to_agent_id: str,
+        message_content: Dict[str, Any],
+        priority: Optional[str] = None,
+        idempotency_key: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Sends a message; see AgentConnectClient.send_message."""
+        return await self._request(
+            "POST",
+            "/api/messages/send",
+            retry=True,
+            headers={"Idempotency-Key": idempotency_key or str(uuid.uuid4())},
+            json=_send_data(to_agent_id, message_content, priority)
+        )
+
+    async def send_messages(self, messages: Iterable[Dict[str, Any]]) -> List[Union[Dict[str, Any], Exception]]:
+        """Sends many messages concurrently, up to `max_concurrency` at a time.
+
+        Each item holds the arguments of `send_message`: "to_agent_id", "message_content"
+        and optionally "priority" and "idempotency_key". Returns one result per item, in
+        order: the send's response, or the exception that made it fail after its retries.
+        """
+        return await asyncio.gather(
+            *[self.send_message(**message) for message in messages],
+            return_exceptions=True
+        )
+
+    async def send_batch(
+        self,
+        messages: Optional[List[Dict[str, Any]]] = None,
+        to_agent_ids: Optional[List[str]] = None,
+        message_content: Optional[Dict[str, Any]] = None,
+        priority: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Sends many messages in one request; see AgentConnectClient.send_batch."""
+        data = _batch_data(messages, to_agent_ids, message_content, priority)
+        return await self._request("POST", "/api/messages/send_batch", json=data)
+
+    async def get_inbox(self, wait: int = 30, max_messages: int = 100, visibility: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Pulls queued messages; see AgentConnectClient.get_inbox."""
+        return (await self._request(
+            "GET",
+            "/api/messages/inbox",
+            read_timeout=self.timeout + wait,
+            params=_inbox_params(wait, max_messages, visibility)
+        ))["messages"]
+
+    async def ack_messages(self, message_ids: List[str]) -> Dict[str, Any]:
+        """Marks messages received from the inbox as delivered."""
+        return await self._request("POST", "/api/messages/ack", retry=True, json={"message_ids": message_ids})
+
+    def stream(self, auto_ack: bool = True) -> AsyncMessageStream:
+        """Opens the push channel; use as `async with client.stream() as messages:`.
+
+        See AgentConnectClient.stream.
+        """
+        return AsyncMessageStream(_stream_url(self.base_url), self.api_key, auto_ack=auto_ack)
+
+    async def get_message_status(self, message_id: str) -> Dict[str, Any]:
+        """Retrieves the status of a sent message."""
+        return await self._request("GET", f"/api/messages/{message_id}", retry=True)
+
+    async def get_message_statuses(self, message_ids: List[str]) -> Dict[str, Any]:
+        """Retrieves the status of up to 1000 messages in one request."""
+        return await self._request("POST", "/api/messages/status", retry=True, json={"message_ids": message_ids})
+
+    def verify_webhook_signature(self, payload: str, signature: str, secret_token: str) -> bool:
+        """Verifies the HMAC-SHA256 signature of a webhook payload."""
+        return verify_webhook_signature(payload, signature, secret_token)